@@ -1,3 +1,5 @@
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +32,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Collected static files are answered before the rest of the stack (and its
+    # metrics), after the HTTPS redirect and security headers
+    'galli_connect_app.static_assets.StaticFilesMiddleware',
+    'galli_connect_app.middleware.RequestMetricsMiddleware',
+    'galli_connect_app.middleware.SessionTokenMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -40,6 +47,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'galli_connect.urls'
 
+# Per-view latency, SQL and response-size metrics served at /metrics
+# (galli_connect_app/metrics.py). GALLI_METRICS=0 takes the middleware out
+# of the chain. With GALLI_SLOW_REQUEST_MS set, slower requests are logged
+# with their SQL to the galli_connect_app.middleware logger.
+REQUEST_METRICS = os.environ.get('GALLI_METRICS', '1') == '1'
+SLOW_REQUEST_MS = int(os.environ.get('GALLI_SLOW_REQUEST_MS', '0'))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -58,17 +72,133 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'galli_connect.wsgi.application'
 
+# Serve search, route listing and bookings from galli_connect_app/async_views.py.
+# Only worth enabling under an ASGI server (uvicorn/daphne on galli_connect.asgi).
+ASYNC_API_VIEWS = os.environ.get('GALLI_ASYNC_VIEWS', '') == '1'
+
+# Seat changes pushed to clients at /api/events (ASGI only). The broker fans
+# events out to the connections of this process; with several workers use a
+# broker relaying them between processes (see galli_connect_app/events.py).
+EVENTS_BROKER = os.environ.get('GALLI_EVENTS_BROKER', 'galli_connect_app.events.LocalBroker')
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+#
+# SQLite by default. GALLI_DB_ENGINE=postgresql with GALLI_DB_NAME, _USER,
+# _PASSWORD, _HOST and _PORT selects PostgreSQL; GALLI_DB_REPLICA_HOSTS is a
+# comma-separated list of read replicas reachable with the same credentials.
+# Search reads go to a replica, everything else to the primary
+# (galli_connect_app/routers.py).
+#
+# Connections persist for GALLI_DB_CONN_MAX_AGE seconds and are checked
+# before reuse. GALLI_DB_POOL=1 uses psycopg's connection pool instead
+# (`pip install "psycopg[pool]"`), which replaces persistent connections.
+#
+# SQLite runs in WAL mode so readers do not block the writer, and write
+# transactions take the lock at BEGIN (IMMEDIATE) so concurrent bookings
+# wait on busy_timeout instead of failing to upgrade a read lock.
+# Compare journal modes with `python manage.py bench_sqlite_concurrency`.
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DB_ENGINE = os.environ.get('GALLI_DB_ENGINE', 'sqlite3')
+CONN_MAX_AGE = int(os.environ.get('GALLI_DB_CONN_MAX_AGE', '60'))
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # durable across crashes in WAL mode; only power loss can drop the last commits
+    'cache_size': -16000,  # KiB
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 10,  # busy_timeout, seconds
+            },
+        }
     }
+else:
+    _db_pool = os.environ.get('GALLI_DB_POOL', '') == '1'
+    _primary = {
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
+        'NAME': os.environ.get('GALLI_DB_NAME', 'galli_connect'),
+        'USER': os.environ.get('GALLI_DB_USER', ''),
+        'PASSWORD': os.environ.get('GALLI_DB_PASSWORD', ''),
+        'HOST': os.environ.get('GALLI_DB_HOST', ''),
+        'PORT': os.environ.get('GALLI_DB_PORT', ''),
+        'CONN_MAX_AGE': 0 if _db_pool else CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': True} if _db_pool else {},
+    }
+    DATABASES = {'default': _primary}
+    _replica_hosts = [host.strip() for host in os.environ.get('GALLI_DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+    for _number, _host in enumerate(_replica_hosts, start=1):
+        DATABASES[f'replica{_number}'] = {**_primary, 'HOST': _host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['galli_connect_app.routers.PrimaryReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+#
+# 'api' backs the read-through cache of the driver dashboard endpoints
+# (galli_connect_app/api_cache.py). Point it at Redis/Memcached to share it
+# between workers; local memory evicts least-recently-used entries past
+# MAX_ENTRIES.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'galli-connect-api',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
 }
 
+API_CACHE_ALIAS = 'api'
+
+# JSON encoder of the API responses (galli_connect_app/serializers.py):
+# 'orjson' needs `pip install orjson`, otherwise the standard library is used.
+API_JSON_BACKEND = 'orjson' if find_spec('orjson') else 'json'
+
+# Sessions are read on every authenticated API call; serve them from the
+# cache and fall back to the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.2/topics/auth/passwords/
+#
+# Login cost is dominated by the hasher. Django's default PBKDF2 runs
+# hundreds of thousands of SHA-256 iterations per login; Argon2id at the
+# OWASP minimum (galli_connect_app/hashers.py) is far cheaper per core and
+# memory-hard. It needs `pip install argon2-cffi`; without it scrypt is used.
+# The PBKDF2 entries stay so existing hashes verify; they are re-hashed
+# with the first hasher on the user's next login.
+# Compare options with `python manage.py bench_login`.
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if find_spec('argon2'):
+    PASSWORD_HASHERS.insert(0, 'galli_connect_app.hashers.TunedArgon2PasswordHasher')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -110,6 +240,19 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'templates',  # Primary assets folder
 ]
+STATIC_ROOT = os.environ.get('GALLI_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# collectstatic stores content-hashed copies plus .gz/.br variants, served
+# with far-future caching (galli_connect_app/static_assets.py).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'galli_connect_app.static_assets.CompressedManifestStaticFilesStorage'},
+}
+# Precompressed variants, preferred first; 'br' needs `pip install brotli`.
+STATIC_COMPRESSION = ['br', 'gzip'] if find_spec('brotli') else ['gzip']
+# Serve STATIC_ROOT and the collected index.html from the app itself. Off
+# under DEBUG so a stale collectstatic never shadows the fresh dev build.
+SERVE_COLLECTED_STATIC = os.environ.get('GALLI_SERVE_STATIC', '0' if DEBUG else '1') == '1'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -0,0 +1,56 @@
+"""
+Passenger and driver accounts.
+
+An account is a User plus its UserProfile, keyed by (email, role): the same
+email may sign up once as a passenger and once as a driver. The key is the
+User's username, ``"<email>_<role>"``, so auth_user's unique username index
+is the (email, role) constraint; as the role suffixes differ, two distinct
+pairs never share a username. Duplicates are caught by that index on
+INSERT instead of being looked up first, so two concurrent signups for the
+same pair cannot both succeed.
+
+Passwords are hashed before the transaction opens. Hashing is the slow part
+(tens of milliseconds with Argon2) and must not hold the database's write
+lock; bulk imports (bulk_io.import_users) hash on several threads.
+"""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .models import UserProfile
+
+ROLES = {role for role, _ in UserProfile.ROLE_CHOICES}
+
+
+class AccountExists(Exception):
+    """Raised when an account for the email and role already exists."""
+
+
+def username(email, role):
+    """Accounts are per (email, role); the pair is encoded in the unique username."""
+    return User.normalize_username(f"{email}_{role}")
+
+
+def new_user(name, email, role, password):
+    """Unsaved User with its password hashed; no password makes it unusable."""
+    return User(
+        username=username(email, role),
+        email=User.objects.normalize_email(email),
+        first_name=name,
+        password=make_password(password),
+    )
+
+
+def create(name, email, password, role):
+    """Create an account with one INSERT per table in one transaction; returns the User.
+
+    Raises AccountExists.
+    """
+    user = new_user(name, email, role, password)
+    try:
+        with transaction.atomic():
+            user.save(force_insert=True)
+            UserProfile.objects.create(user=user, role=role)
+    except IntegrityError:
+        raise AccountExists(f"User with email {email} and role {role} already exists.")
+    return user
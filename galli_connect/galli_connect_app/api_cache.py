@@ -0,0 +1,156 @@
+"""
+Read-through cache for the driver dashboard endpoints.
+
+Responses are stored in the cache alias named by ``settings.API_CACHE_ALIAS``
+(local-memory by default, bounded by ``MAX_ENTRIES`` with LRU culling and a
+``TIMEOUT``), together with an ETag so a poll carrying a matching
+``If-None-Match`` gets a 304 without touching the database or re-serializing.
+
+Writes call ``invalidate_driver``/``invalidate_route``, which bump the
+generation of the affected keys once the surrounding transaction commits.
+An entry records the generation and the local date it was built for and is
+only served while both still hold, so:
+
+- a miss that read the database before a write committed cannot store a
+  stale entry after it: the entry carries the old generation;
+- the route listings' ``activeDays``, spelled out from today, are rebuilt
+  after midnight.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "default")]
+
+
+def driver_routes_key(driver_id):
+    return f"driver-routes:{driver_id}"
+
+
+def route_bookings_key(driver_id, route_id):
+    return f"route-bookings:{driver_id}:{route_id}"
+
+
+def demand_hotspots_key():
+    return "demand-hotspots"
+
+
+def _etag(content):
+    return '"%s"' % hashlib.sha1(content).hexdigest()
+
+
+def _if_none_match(request):
+    header = request.headers.get("If-None-Match", "")
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+def _generation_key(key):
+    return f"{key}:generation"
+
+
+def _new_generation():
+    # Unlike a counter restarting at 0, cannot match entries made before the
+    # generation was evicted
+    return time.time_ns()
+
+
+def _generation(cache, found, key):
+    """Generation of ``key`` from a get_many of the key and its generation, starting one if there is none."""
+    generation = found.get(_generation_key(key))
+    if generation is None:
+        cache.add(_generation_key(key), _new_generation(), timeout=None)
+        generation = cache.get(_generation_key(key))
+    return generation
+
+
+async def _ageneration(cache, found, key):
+    generation = found.get(_generation_key(key))
+    if generation is None:
+        await cache.aadd(_generation_key(key), _new_generation(), timeout=None)
+        generation = await cache.aget(_generation_key(key))
+    return generation
+
+
+def _entry(version, response):
+    return (version, _etag(response.content), response.content, response["Content-Type"])
+
+
+def cached_response(request, key, build):
+    """Serve ``key`` from the cache, calling ``build()`` on a miss.
+
+    Only 200 responses from ``build`` are cached; anything else is returned
+    as is.
+    """
+    cache = get_cache()
+    found = cache.get_many([key, _generation_key(key)])
+    version = (_generation(cache, found, key), timezone.localdate())
+    entry = found.get(key)
+    if entry is None or entry[0] != version:
+        response = build()
+        if response.status_code != 200:
+            return response
+        entry = _entry(version, response)
+        cache.set(key, entry)
+
+    return _serve(request, entry)
+
+
+async def acached_response(request, key, build):
+    """Async variant of ``cached_response``; ``build`` is a coroutine function."""
+    cache = get_cache()
+    found = await cache.aget_many([key, _generation_key(key)])
+    version = (await _ageneration(cache, found, key), timezone.localdate())
+    entry = found.get(key)
+    if entry is None or entry[0] != version:
+        response = await build()
+        if response.status_code != 200:
+            return response
+        entry = _entry(version, response)
+        await cache.aset(key, entry)
+    return _serve(request, entry)
+
+
+def _serve(request, entry):
+    _, etag, content, content_type = entry
+    if etag in _if_none_match(request):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    return response
+
+
+def _bump(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(_generation_key(key))
+        except ValueError:
+            # Never read, or evicted: a fresh generation orphans whatever is cached
+            cache.set(_generation_key(key), _new_generation(), timeout=None)
+
+
+def _bump_on_commit(keys):
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def invalidate_driver(driver_id):
+    """Retire the cached route listing of a driver."""
+    _bump_on_commit([driver_routes_key(driver_id)])
+
+
+def invalidate_route(driver_id, route_id):
+    """Retire everything cached about one route, including its driver's listing."""
+    _bump_on_commit([driver_routes_key(driver_id), route_bookings_key(driver_id, route_id)])
+
+
+def invalidate_demand():
+    """Retire the cached demand hotspots after a rollup."""
+    _bump_on_commit([demand_hotspots_key()])
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GalliConnectAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'galli_connect_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,132 @@
+# galli_connect_app/async_views.py
+"""
+Async versions of the read-heavy polling endpoints.
+
+Same URLs, request bodies and responses as their counterparts in views.py,
+using the async ORM so an ASGI worker does not hold a thread per request
+while waiting on the database. urls.py wires these in when
+``settings.ASYNC_API_VIEWS`` is on; the sync views stay the default.
+"""
+import json
+
+from django.contrib.auth.models import User
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import api_cache, inventory, routers, serializers, views
+from .models import DriverRoute, PassengerBooking
+
+
+async def _with_active_days(rows, chunk_size=views.SEARCH_STREAM_CHUNK, **window):
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            async for row in _attach_active_days(chunk, window):
+                yield row
+            chunk = []
+    async for row in _attach_active_days(chunk, window):
+        yield row
+
+
+async def _attach_active_days(chunk, window):
+    if not chunk:
+        return
+    active_days = await inventory.aactive_days_for(chunk, **window)
+    for row in chunk:
+        row["active_days"] = active_days[row["id"]]
+        yield row
+
+
+@csrf_exempt
+@routers.replica_reads
+async def search_routes(request):
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        parsed = views._search_query(data)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        rows, limit, window = parsed
+
+        if views._wants_stream(request, data):
+            async def lines():
+                rows_iter = rows.aiterator(chunk_size=views.SEARCH_STREAM_CHUNK)
+                async for row in _with_active_days(rows_iter, **window):
+                    yield views._ndjson_line(row)
+            return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+        if limit is None:
+            matches = _with_active_days(rows.aiterator(chunk_size=views.SEARCH_STREAM_CHUNK), **window)
+            return serializers.json_response([serializers.route(row, row["active_days"]) async for row in matches])
+
+        page = [row async for row in rows[:limit + 1]]
+        active_days = await inventory.aactive_days_for(page[:limit], **window)
+        return views._search_page(page, limit, active_days)
+
+    except json.JSONDecodeError:
+        return JsonResponse({"message": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+async def _driver_routes_response(driver_id):
+    driver = await User.objects.filter(id=driver_id).afirst()
+    if not driver:
+        return JsonResponse({"error": "Driver not found"}, status=404)
+
+    rows = [row async for row in DriverRoute.objects.filter(driver=driver).values(*serializers.DRIVER_ROUTE_FIELDS)]
+    active_days = await inventory.aactive_days_for(rows)
+    route_list = [serializers.driver_route(row, active_days[row["id"]]) for row in rows]
+
+    return serializers.json_response({"routes": route_list})
+
+
+@csrf_exempt
+async def get_driver_routes(request, driver_id):
+    if request.method == "GET":
+        return await api_cache.acached_response(
+            request,
+            api_cache.driver_routes_key(driver_id),
+            lambda: _driver_routes_response(driver_id),
+        )
+
+    return JsonResponse({"error": "Invalid request method"}, status=405)
+
+
+async def _route_bookings_response(driver_id, route_id, query=None):
+    try:
+        # Ensure this route belongs to the driver
+        route = await DriverRoute.objects.aget(id=route_id, driver_id=driver_id)
+    except DriverRoute.DoesNotExist:
+        return JsonResponse({"error": "Route not found or unauthorized"}, status=404)
+
+    if query is None:
+        bookings = PassengerBooking.objects.filter(route=route).values(*serializers.ROUTE_BOOKING_FIELDS)
+        return serializers.json_response(serializers.route_bookings([row async for row in bookings]))
+
+    bookings = views._bookings_in_range(route, query)
+    if query["summary"]:
+        booked = [row async for row in views._booked_seats(bookings)]
+        active_days = (await inventory.aactive_days_for([route], **views._summary_window(query)))[route.id]
+        return serializers.json_response(serializers.booking_summary(booked, active_days, query["end"]))
+    dates = [date async for date in views._booked_dates(bookings, query["limit"])]
+    rows = [row async for row in views._page_rows(bookings, dates, query["limit"])] if dates else []
+    return views._bookings_page_response(rows, dates, query["limit"])
+
+
+@csrf_exempt
+async def get_route_bookings(request, driver_id, route_id):
+    try:
+        query = views._route_bookings_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if query is not None:
+        return await _route_bookings_response(driver_id, route_id, query)
+    return await api_cache.acached_response(
+        request,
+        api_cache.route_bookings_key(driver_id, route_id),
+        lambda: _route_bookings_response(driver_id, route_id),
+    )
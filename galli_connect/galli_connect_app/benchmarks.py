@@ -0,0 +1,100 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks never touch the configured database: they run against a throwaway
+test database (in-memory for SQLite) created the same way the test runner
+does, so they need the app's migrations to exist (``manage.py makemigrations``).
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+AREAS = [
+    "Andheri", "Bandra", "Koramangala", "Indiranagar", "Whitefield", "Powai",
+    "Gurgaon", "Noida", "Dwarka", "Saket", "Salt Lake", "Howrah", "Baner",
+    "Hinjewadi", "Kothrud", "Velachery", "Adyar", "Tambaram", "Gachibowli",
+    "Madhapur", "Kondapur", "Bellandur", "Marathahalli", "Electronic City",
+    "Jayanagar", "Malleswaram", "Chembur", "Thane", "Vashi", "Kharadi",
+]
+LANDMARKS = ["Sector", "Phase", "Block", "Gate", "Metro Station", "Tech Park", "Market"]
+# (south, north, west, east) of a metro area, roughly Bengaluru
+CITY_BOX = (12.85, 13.10, 77.45, 77.75)
+
+
+@contextmanager
+def isolated_database(verbosity=0, on_disk=False):
+    """Create a throwaway database (and test client settings) for the block.
+
+    Multi-threaded benchmarks need ``on_disk=True`` with SQLite: a shared
+    in-memory database fails concurrent writers immediately instead of
+    making them wait on the lock like a real deployment.
+    """
+    test_settings = connection.settings_dict["TEST"]
+    old_test_name = test_settings.get("NAME")
+    path = None
+    if on_disk and connection.vendor == "sqlite":
+        fd, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        test_settings["NAME"] = path
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        test_settings["NAME"] = old_test_name
+        if path:
+            # WAL mode leaves its sidecar files behind
+            for leftover in (path, f"{path}-wal", f"{path}-shm"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        teardown_test_environment()
+
+
+def synthetic_location(rng, spread=500):
+    """A plausible free-text location such as ``"Powai Tech Park 42"``."""
+    return f"{rng.choice(AREAS)} {rng.choice(LANDMARKS)} {rng.randint(1, spread)}"
+
+
+def synthetic_point(rng, box=CITY_BOX):
+    """A uniformly random ``(lat, lng)`` inside ``box``."""
+    south, north, west, east = box
+    return rng.uniform(south, north), rng.uniform(west, east)
+
+
+def make_rng(seed=42):
+    return random.Random(seed)
+
+
+def timed(func, repeat=20):
+    """Run ``func`` ``repeat`` times and return the wall-clock samples in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Median/p95/p99/max of a list of millisecond samples."""
+    return {
+        "median_ms": round(statistics.median(samples), 3) if samples else 0.0,
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+        "max_ms": round(max(samples), 3) if samples else 0.0,
+    }
@@ -0,0 +1,522 @@
+"""
+Streaming CSV / NDJSON import and export of routes and bookings.
+
+Rows are read lazily from any iterable of text lines (an open file, or the
+request stream via ``codecs.iterdecode``) and handled ``CHUNK_SIZE`` at a
+time: a chunk is validated in Python, its foreign keys are checked with one
+query each, and the valid rows are written with ``bulk_create`` in one
+transaction. Rows that fail are reported through ``on_error`` with their
+line number and skipped; the rest of the chunk still goes in. Memory stays
+bounded by the chunk size however large the file is.
+
+``bulk_create`` skips the model signals, so route imports do what the
+signals would: parse ``departure_minutes``, index location tokens and
+coordinates. Booking imports take seats off the inventory like
+``/api/book-seats`` does.
+
+Besides the weekly rule, a route row carries its per-date inventory
+(inventory.py): ``activeDays`` lists ``date:seats`` for the dates offered
+outside the rule or with their own seat count, and ``exceptions`` the
+cancelled dates. The seats are those offered before any booking, since
+importing the bookings takes them off again.
+
+User imports provision passenger and driver accounts (accounts.py) in
+batches: a chunk's usernames are checked against existing accounts with one
+query, its passwords are hashed on ``HASH_WORKERS`` threads (the hashers
+release the GIL), and its users and profiles go in with one bulk INSERT
+each. Rows without a password get an unusable one.
+
+Exports stream ``iterator(chunk_size=...)`` rows in the same columns, so an
+export can be edited and imported again (``id`` is ignored on import). A
+route export reads the per-date rows of each chunk with one query per
+table.
+"""
+import csv
+import json
+import os
+import re
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
+
+from . import accounts, api_cache, geo, inventory, search
+from .models import DriverRoute, PassengerBooking, RouteSeatInventory, RoutePoint, SeatHold, UserProfile
+
+FORMATS = ("csv", "ndjson")
+CHUNK_SIZE = 1000
+
+ROUTE_COLUMNS = [
+    "id", "driverId", "from", "to", "departureTime", "costPerSeat", "totalSeats",
+    "weekdays", "startDate", "endDate", "activeDays", "exceptions", "fromLat", "fromLng", "toLat", "toLng",
+]
+BOOKING_COLUMNS = ["id", "passengerId", "routeId", "driverId", "date", "seatsBooked"]
+
+RowError = namedtuple("RowError", ["line", "message"])
+# route: unsaved DriverRoute; dates: unsaved RouteSeatInventory rows, route unset
+ParsedRoute = namedtuple("ParsedRoute", ["route", "dates"])
+NewAccount = namedtuple("NewAccount", ["name", "email", "role", "password"])
+
+HASH_WORKERS = os.cpu_count() or 1
+
+_LIST_SEPARATOR = re.compile(r"[\s,;]+")
+_LOCATION_LENGTH = DriverRoute._meta.get_field("from_location").max_length
+_DEPARTURE_LENGTH = DriverRoute._meta.get_field("departure_time").max_length
+_NAME_LENGTH = User._meta.get_field("first_name").max_length
+# Room in the username for "_<role>"
+_EMAIL_LENGTH = User._meta.get_field("username").max_length - 1 - max(map(len, accounts.ROLES))
+
+
+def format_for(name, default="ndjson"):
+    """Format implied by a file name or content type."""
+    name = (name or "").lower()
+    if name.endswith(".csv") or name.startswith("text/csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or "json" in name:
+        return "ndjson"
+    return default
+
+
+def read_rows(lines, fmt):
+    """Yield ``(line number, row)`` from text lines; NDJSON rows are left undecoded."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield number, line
+
+
+def _fields(row):
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except ValueError:
+            raise ValueError("Invalid JSON")
+    if not isinstance(row, dict):
+        raise ValueError("Row must be a JSON object")
+    # CSV has no nulls; an empty cell means a missing value
+    return {key: value for key, value in row.items() if value not in ("", None)}
+
+
+def _required(fields, key):
+    if key not in fields:
+        raise ValueError(f"'{key}' is required")
+    return fields[key]
+
+
+def _text(fields, key, max_length):
+    value = str(_required(fields, key)).strip()
+    if not value or len(value) > max_length:
+        raise ValueError(f"'{key}' must be 1 to {max_length} characters")
+    return value
+
+
+def _positive_int(fields, key):
+    try:
+        value = int(_required(fields, key))
+    except (TypeError, ValueError):
+        raise ValueError(f"'{key}' must be a whole number")
+    if value < 1:
+        raise ValueError(f"'{key}' must be at least 1")
+    return value
+
+
+def _date(fields, key, required=False):
+    if key not in fields and not required:
+        return None
+    value = parse_date(str(_required(fields, key)))
+    if value is None:
+        raise ValueError(f"'{key}' must be in YYYY-MM-DD format")
+    return value
+
+
+def _point(fields, prefix):
+    lat, lng = fields.get(f"{prefix}Lat"), fields.get(f"{prefix}Lng")
+    if lat is None and lng is None:
+        return None, None
+    return geo.parse_point({"lat": lat, "lng": lng}, f"{prefix}Lat/{prefix}Lng")
+
+
+def _weekdays(value):
+    if isinstance(value, str):
+        value = _LIST_SEPARATOR.split(value.strip())
+    return inventory.parse_weekdays(value)
+
+
+def _list(fields, key):
+    value = fields.get(key, [])
+    if isinstance(value, str):
+        value = _LIST_SEPARATOR.split(value.strip())
+    if not isinstance(value, list):
+        raise ValueError(f"'{key}' must be a list")
+    return value
+
+
+def _active_days(fields):
+    """date -> seats from ``activeDays`` entries, ``"2025-08-15:3"`` or ``{"date": ..., "availableSeats": ...}``."""
+    seats_by_date = {}
+    for entry in _list(fields, "activeDays"):
+        if isinstance(entry, dict):
+            value, seats = entry.get("date"), entry.get("availableSeats")
+        else:
+            value, _, seats = str(entry).partition(":")
+        date = parse_date(str(value or ""))
+        try:
+            seats = int(seats)
+        except (TypeError, ValueError):
+            seats = -1
+        if date is None or seats < 0:
+            raise ValueError(f"'activeDays' entries must be YYYY-MM-DD:seats, not {entry!r}")
+        seats_by_date[date] = seats
+    return seats_by_date
+
+
+def _exceptions(fields):
+    dates = [parse_date(str(value)) for value in _list(fields, "exceptions")]
+    if None in dates:
+        raise ValueError("'exceptions' must be dates in YYYY-MM-DD format")
+    return set(dates)
+
+
+def _cost(fields):
+    try:
+        cost = Decimal(str(_required(fields, "costPerSeat"))).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError("'costPerSeat' must be a number")
+    if not 0 <= cost < 10 ** 8:
+        raise ValueError("'costPerSeat' is out of range")
+    return cost
+
+
+def parse_route(row):
+    """ParsedRoute for an import row; raises ValueError."""
+    fields = _fields(row)
+    start, end = _date(fields, "startDate"), _date(fields, "endDate")
+    if start and end and end < start:
+        raise ValueError("'endDate' is before 'startDate'")
+    departure_time = _text(fields, "departureTime", _DEPARTURE_LENGTH)
+    (from_lat, from_lng), (to_lat, to_lng) = _point(fields, "from"), _point(fields, "to")
+    active_days, exceptions = _active_days(fields), _exceptions(fields)
+    if clash := min(active_days.keys() & exceptions, default=None):
+        raise ValueError(f"{clash} is in both 'activeDays' and 'exceptions'")
+    route = DriverRoute(
+        driver_id=_positive_int(fields, "driverId"),
+        from_location=_text(fields, "from", _LOCATION_LENGTH),
+        to_location=_text(fields, "to", _LOCATION_LENGTH),
+        departure_time=departure_time,
+        departure_minutes=search.departure_minutes(departure_time),
+        cost_per_seat=_cost(fields),
+        total_seats=_positive_int(fields, "totalSeats"),
+        weekday_mask=_weekdays(fields.get("weekdays", [])),
+        start_date=start,
+        end_date=end,
+        from_lat=from_lat, from_lng=from_lng, to_lat=to_lat, to_lng=to_lng,
+    )
+    dates = [RouteSeatInventory(date=date, available_seats=seats) for date, seats in sorted(active_days.items())]
+    dates += [RouteSeatInventory(date=date, available_seats=0, cancelled=True) for date in sorted(exceptions)]
+    return ParsedRoute(route, dates)
+
+
+def parse_booking(row):
+    """Unsaved PassengerBooking for an import row; raises ValueError."""
+    fields = _fields(row)
+    return PassengerBooking(
+        passenger_id=_positive_int(fields, "passengerId"),
+        route_id=_positive_int(fields, "routeId"),
+        date=_date(fields, "date", required=True),
+        seats_booked=_positive_int(fields, "seatsBooked"),
+    )
+
+
+def parse_user(row):
+    """NewAccount for an import row; raises ValueError."""
+    fields = _fields(row)
+    email = _text(fields, "email", _EMAIL_LENGTH)
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise ValueError(f"'{email}' is not a valid email address")
+    role = str(_required(fields, "role")).strip().upper()
+    if role not in accounts.ROLES:
+        raise ValueError("'role' must be PASSENGER or DRIVER")
+    password = fields.get("password")
+    return NewAccount(_text(fields, "name", _NAME_LENGTH), email, role, str(password) if password else None)
+
+
+def _chunks(rows, chunk_size, on_error):
+    """Chunks of rows; errors collected in the list passed along are reported in line order."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        errors = []
+        yield chunk, errors.append
+        for error in sorted(errors):
+            on_error(error)
+
+
+def _parse_chunk(chunk, parse, on_error):
+    parsed = []
+    for line, row in chunk:
+        try:
+            parsed.append((line, parse(row)))
+        except ValueError as e:
+            on_error(RowError(line, str(e)))
+    return parsed
+
+
+def _existing_users(ids):
+    return set(User.objects.filter(id__in=set(ids)).values_list("id", flat=True))
+
+
+def _ignore(error):
+    pass
+
+
+def import_routes(rows, chunk_size=CHUNK_SIZE, dry_run=False, on_error=None):
+    """Create DriverRoutes from ``read_rows`` output; returns the number created."""
+    created = 0
+    for chunk, on_error in _chunks(rows, chunk_size, on_error or _ignore):
+        parsed = _parse_chunk(chunk, parse_route, on_error)
+        drivers = _existing_users(row.route.driver_id for _, row in parsed)
+        accepted = []
+        for line, row in parsed:
+            if row.route.driver_id in drivers:
+                accepted.append(row)
+            else:
+                on_error(RowError(line, f"Driver {row.route.driver_id} not found"))
+        if dry_run or not accepted:
+            created += len(accepted)
+            continue
+        with transaction.atomic():
+            routes = DriverRoute.objects.bulk_create([row.route for row in accepted])
+            for row in accepted:
+                for date in row.dates:
+                    date.route = row.route
+            RouteSeatInventory.objects.bulk_create(
+                [date for row in accepted for date in row.dates], batch_size=chunk_size,
+            )
+            search.index_routes(routes)
+            RoutePoint.objects.bulk_create(
+                [point for route in routes for point in geo.route_points(route)], batch_size=chunk_size,
+            )
+            for driver_id in {route.driver_id for route in routes}:
+                api_cache.invalidate_driver(driver_id)
+        created += len(routes)
+    return created
+
+
+def _reserve(route, date, bookings, on_error):
+    """Bookings of one route and date that fit; the rest are reported."""
+    try:
+        with transaction.atomic():
+            inventory.reserve(route, [date], sum(booking.seats_booked for _, booking in bookings))
+        return [booking for _, booking in bookings]
+    except inventory.NotEnoughSeats:
+        pass
+    # Not all of them fit; take them one at a time, in file order
+    accepted = []
+    for line, booking in bookings:
+        try:
+            with transaction.atomic():
+                inventory.reserve(route, [date], booking.seats_booked)
+            accepted.append(booking)
+        except inventory.NotEnoughSeats as e:
+            on_error(RowError(line, str(e)))
+    return accepted
+
+
+def import_bookings(rows, chunk_size=CHUNK_SIZE, dry_run=False, on_error=None):
+    """Create PassengerBookings from ``read_rows`` output, taking their seats.
+
+    Returns the number created. A dry run checks rows and references but
+    not seat availability.
+    """
+    created = 0
+    for chunk, on_error in _chunks(rows, chunk_size, on_error or _ignore):
+        parsed = _parse_chunk(chunk, parse_booking, on_error)
+        passengers = _existing_users(booking.passenger_id for _, booking in parsed)
+        routes = DriverRoute.objects.only(
+            "id", "driver_id", "total_seats", "weekday_mask", "start_date", "end_date",
+        ).in_bulk({booking.route_id for _, booking in parsed})
+        groups = defaultdict(list)
+        for line, booking in parsed:
+            if booking.passenger_id not in passengers:
+                on_error(RowError(line, f"Passenger {booking.passenger_id} not found"))
+            elif booking.route_id not in routes:
+                on_error(RowError(line, f"Route {booking.route_id} not found"))
+            else:
+                groups[booking.route_id, booking.date].append((line, booking))
+        if dry_run:
+            created += sum(len(bookings) for bookings in groups.values())
+            continue
+        with transaction.atomic():
+            # Sorted like inventory.book so concurrent imports lock rows in the same order
+            bookings = [
+                booking for (route_id, date), group in sorted(groups.items())
+                for booking in _reserve(routes[route_id], date, group, on_error)
+            ]
+            PassengerBooking.objects.bulk_create(bookings)
+            for route_id in {booking.route_id for booking in bookings}:
+                api_cache.invalidate_route(routes[route_id].driver_id, route_id)
+        created += len(bookings)
+    return created
+
+
+def _new_accounts(parsed, on_error):
+    """Rows of a chunk whose account does not exist yet, first row per account."""
+    seen = {}
+    for line, account in parsed:
+        key = accounts.username(account.email, account.role)
+        if key in seen:
+            on_error(RowError(line, f"Duplicate of line {seen[key]}"))
+        else:
+            seen[key] = line
+    taken = set(User.objects.filter(username__in=seen).values_list("username", flat=True))
+    fresh = []
+    for line, account in parsed:
+        key = accounts.username(account.email, account.role)
+        if seen.get(key) != line:
+            continue
+        if key in taken:
+            on_error(RowError(line, f"User with email {account.email} and role {account.role} already exists"))
+        else:
+            fresh.append((line, account))
+    return fresh
+
+
+def _insert_accounts(pending):
+    with transaction.atomic():
+        User.objects.bulk_create([user for _, user in pending])
+        UserProfile.objects.bulk_create([UserProfile(user=user, role=account.role) for (_, account), user in pending])
+
+
+def import_users(rows, chunk_size=CHUNK_SIZE, dry_run=False, on_error=None):
+    """Create accounts (User and UserProfile) from ``read_rows`` output; returns the number created."""
+    created = 0
+    with ThreadPoolExecutor(HASH_WORKERS) as hashers:
+        for chunk, on_error in _chunks(rows, chunk_size, on_error or _ignore):
+            fresh = _new_accounts(_parse_chunk(chunk, parse_user, on_error), on_error)
+            if dry_run or not fresh:
+                created += len(fresh)
+                continue
+            users = dict(zip(fresh, hashers.map(lambda row: accounts.new_user(*row[1]), fresh)))
+            try:
+                _insert_accounts(list(users.items()))
+            except IntegrityError:
+                # Some signed up since the check: report those and insert the rest
+                fresh = _new_accounts(fresh, on_error)
+                for row in fresh:
+                    users[row].pk = None
+                _insert_accounts([(row, users[row]) for row in fresh])
+            created += len(fresh)
+    return created
+
+
+def _route_row(route):
+    return {
+        "id": route["id"],
+        "driverId": route["driver_id"],
+        "from": route["from_location"],
+        "to": route["to_location"],
+        "departureTime": route["departure_time"],
+        "costPerSeat": route["cost_per_seat"],
+        "totalSeats": route["total_seats"],
+        "weekdays": inventory.weekday_names(route["weekday_mask"]),
+        "startDate": route["start_date"],
+        "endDate": route["end_date"],
+        "activeDays": route["active_days"],
+        "exceptions": route["exceptions"],
+        "fromLat": route["from_lat"],
+        "fromLng": route["from_lng"],
+        "toLat": route["to_lat"],
+        "toLng": route["to_lng"],
+    }
+
+
+def _booking_row(booking):
+    return {
+        "id": booking["id"],
+        "passengerId": booking["passenger_id"],
+        "routeId": booking["route_id"],
+        "driverId": booking["route__driver_id"],
+        "date": booking["date"],
+        "seatsBooked": booking["seats_booked"],
+    }
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, list):
+        return " ".join(value)
+    return "" if value is None else value
+
+
+def _lines(rows, columns, fmt):
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_csv_cell(row[column]) for column in columns])
+    else:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def _with_dates(routes, chunk_size):
+    """Route ``values()`` rows with their ``active_days`` and ``exceptions`` filled in, a chunk at a time."""
+    routes = iter(routes)
+    while chunk := list(islice(routes, chunk_size)):
+        ids = [route["id"] for route in chunk]
+        # Seats booked or held on a date were offered there too
+        taken = defaultdict(int)
+        for model, field in ((PassengerBooking, "seats_booked"), (SeatHold, "seats")):
+            rows = model.objects.filter(route_id__in=ids).order_by().values_list("route_id", "date")
+            for route_id, date, seats in rows.annotate(Sum(field)):
+                taken[route_id, date] += seats
+        dates = defaultdict(list)
+        for row in RouteSeatInventory.objects.filter(route_id__in=ids).order_by("date").values_list(
+            "route_id", "date", "available_seats", "cancelled",
+        ):
+            dates[row[0]].append(row[1:])
+        for route in chunk:
+            route["active_days"], route["exceptions"] = [], []
+            for date, seats, cancelled in dates[route["id"]]:
+                offered = seats + taken[route["id"], date]
+                if cancelled:
+                    route["exceptions"].append(date.isoformat())
+                elif offered != route["total_seats"] or not inventory.runs_by_rule(route, date):
+                    route["active_days"].append(f"{date.isoformat()}:{offered}")
+            yield route
+
+
+def export_routes(routes, fmt, chunk_size=CHUNK_SIZE):
+    """Text lines for a DriverRoute queryset."""
+    rows = routes.order_by("id").values(
+        "id", "driver_id", "from_location", "to_location", "departure_time", "cost_per_seat",
+        "total_seats", "weekday_mask", "start_date", "end_date", "from_lat", "from_lng", "to_lat", "to_lng",
+    ).iterator(chunk_size=chunk_size)
+    return _lines(map(_route_row, _with_dates(rows, chunk_size)), ROUTE_COLUMNS, fmt)
+
+
+def export_bookings(bookings, fmt, chunk_size=CHUNK_SIZE):
+    """Text lines for a PassengerBooking queryset."""
+    rows = bookings.order_by("id").values(
+        "id", "passenger_id", "route_id", "route__driver_id", "date", "seats_booked",
+    ).iterator(chunk_size=chunk_size)
+    return _lines(map(_booking_row, rows), BOOKING_COLUMNS, fmt)
@@ -0,0 +1,171 @@
+"""
+Passenger demand counters behind ``/api/demand-hotspots``.
+
+Searches and bookings are counted per normalized pickup location and hour
+in ``DemandCounter``. The request path only bumps an in-process buffer;
+a daemon thread of each process writes it out as a few upserts
+(``count = count + n``) every ``FLUSH_SECONDS``, or sooner once
+``FLUSH_KEYS`` keys are pending, so neither searching nor booking pays for a
+write, not even after the response, and PassengerBooking is never rescanned.
+Counts of a worker that dies before flushing are lost, which a heat map can
+live with.
+
+The ``rollup_demand`` management command, run periodically, turns the
+recent counters into ranked ``DemandHotspot`` rows; the endpoint serves
+those through the API cache, so a poll is a cache hit (or a 304).
+"""
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
+from string import capwords
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, Sum
+from django.template.defaultfilters import pluralize
+from django.utils import timezone
+
+from . import api_cache
+from .models import DemandCounter, DemandHotspot
+from .search import normalize_location
+
+FLUSH_SECONDS = 30
+# Flush early once this many (location, hour) keys are pending
+FLUSH_KEYS = 1000
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_wake = threading.Event()
+_flusher = None
+
+
+def _bucket(now=None):
+    return (now or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+
+def _record(location, field, amount):
+    location = normalize_location(location)[:DemandCounter.LOCATION_LENGTH]
+    if not location or amount <= 0:
+        return
+    with _lock:
+        _pending[(location, _bucket(), field)] += amount
+        if len(_pending) >= FLUSH_KEYS:
+            _wake.set()
+        _start_flusher()
+
+
+def record_search(from_location):
+    _record(from_location, "searches", 1)
+
+
+def record_booking(from_location, seats):
+    _record(from_location, "seats_booked", seats)
+
+
+def _start_flusher():
+    """Start this process's flusher thread if it is not running; called with ``_lock`` held."""
+    global _flusher
+    # is_alive() is False in a worker forked after the thread started
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_periodically, name="demand-flush", daemon=True)
+        _flusher.start()
+
+
+def _flush_periodically():
+    while True:
+        _wake.wait(FLUSH_SECONDS)
+        _wake.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Could not write demand counters; retrying on the next flush")
+        finally:
+            # Outside the request cycle nothing else retires this thread's connection
+            close_old_connections()
+
+
+def flush():
+    """Write the pending counts to DemandCounter; returns the number of keys written.
+
+    Counts that fail to write go back into the buffer for the next flush.
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    increments = {}
+    for (location, bucket, field), amount in pending.items():
+        increments.setdefault((location, bucket), {})[field] = amount
+    try:
+        with transaction.atomic():
+            DemandCounter.objects.bulk_create(
+                [DemandCounter(location=location, bucket=bucket) for location, bucket in increments],
+                ignore_conflicts=True,
+            )
+            for (location, bucket), fields in increments.items():
+                DemandCounter.objects.filter(location=location, bucket=bucket).update(
+                    **{field: F(field) + amount for field, amount in fields.items()}
+                )
+    except Exception:
+        with _lock:
+            _pending.update(pending)
+        raise
+    return len(increments)
+
+
+def demand_score(value, top):
+    """1-10 relative to the busiest location of the window."""
+    return max(1, round(10 * value / top)) if top else 1
+
+
+def rollup(hours=24, top=10, booking_weight=3):
+    """Rebuild DemandHotspot from the last ``hours`` of counters; returns the rows."""
+    since = _bucket() - timedelta(hours=hours - 1)
+    totals = (
+        DemandCounter.objects.filter(bucket__gte=since)
+        .values("location")
+        .annotate(searches=Sum("searches"), seats_booked=Sum("seats_booked"))
+        .annotate(weight=F("searches") + F("seats_booked") * booking_weight)
+        .order_by("-weight", "location")[:top]
+    )
+    totals = list(totals)
+    busiest = totals[0]["weight"] if totals else 0
+    hotspots = [
+        DemandHotspot(
+            rank=rank,
+            location=capwords(row["location"]),
+            demand_score=demand_score(row["weight"], busiest),
+            searches=row["searches"],
+            seats_booked=row["seats_booked"],
+            window_hours=hours,
+        )
+        for rank, row in enumerate(totals, start=1)
+    ]
+    with transaction.atomic():
+        DemandHotspot.objects.all().delete()
+        DemandHotspot.objects.bulk_create(hotspots)
+        api_cache.invalidate_demand()
+    return hotspots
+
+
+def prune(keep_hours):
+    """Delete counters older than ``keep_hours``; returns the number deleted."""
+    deleted, _ = DemandCounter.objects.filter(
+        bucket__lt=_bucket() - timedelta(hours=keep_hours)).delete()
+    return deleted
+
+
+def as_json(hotspot):
+    """A hotspot in the client's ``DemandHotspot`` shape."""
+    return {
+        "location": hotspot.location,
+        "demandScore": hotspot.demand_score,
+        "summary": (
+            f"{hotspot.searches} search{pluralize(hotspot.searches, 'es')} and "
+            f"{hotspot.seats_booked} seat{pluralize(hotspot.seats_booked)} booked "
+            f"from here in the last {hotspot.window_hours} hours."
+        ),
+    }
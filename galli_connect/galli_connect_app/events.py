@@ -0,0 +1,155 @@
+"""
+Live seat availability, pushed to browsers over Server-Sent Events.
+
+Writes publish small events once their transaction commits:
+
+- ``seats``: ``{"routeId", "changes": [{"date", "delta"}]}`` whenever seats
+  are taken (inventory.reserve: bookings, seat holds, imports) or given back
+  (holds released or expired).
+- ``route``: ``{"routeId", "deleted"}`` when a driver edits or deletes a
+  route; clients refetch it.
+
+``/api/events?routes=1,2`` (ASGI only) streams the events of those routes
+to a search page or a driver's dashboard instead of it polling. Each event
+is encoded once, when published; subscribers get the same bytes.
+
+The broker named in ``settings.EVENTS_BROKER`` does the fan-out.
+``LocalBroker`` reaches the connections of its own process only, so with
+several workers (or bookings served by WSGI workers) configure a broker
+that relays through a shared channel such as Redis pub/sub: anything with
+``publish(channel, event, data)`` and ``subscribe(channels)`` returning a
+``Subscription``-like object. Compare fan-out rates with
+``manage.py bench_events``.
+"""
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+HEARTBEAT_SECONDS = 15
+# Events buffered per connection before it is told to resync
+QUEUE_SIZE = 256
+RETRY_MS = 5000
+
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+def route_channel(route_id):
+    return f"route:{route_id}"
+
+
+def encode(event, data):
+    """One SSE frame."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class Subscription:
+    """Events of some channels for one connection, read from the event loop it was made on."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, frame):
+        # Called on the loop's thread
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # A reader this far behind has missed events; have it refetch instead
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Next frame, or None after ``timeout`` seconds without one."""
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Fan-out to the subscriptions of this process; publish from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        if not subscribers:
+            return
+        frame = encode(event, data)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, frame)
+            except RuntimeError:
+                # Its event loop has shut down without closing the stream
+                self.unsubscribe(subscription)
+
+    def connections(self):
+        with self._lock:
+            return len({subscription for subscribers in self._channels.values() for subscription in subscribers})
+
+
+@lru_cache(maxsize=None)
+def broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def _publish_on_commit(channel, event, data):
+    transaction.on_commit(lambda: broker().publish(channel, event, data))
+
+
+def seats_changed(route_id, changes):
+    """Publish seat deltas (date -> seats, negative when taken) of a route after commit."""
+    changes = [{"date": date.isoformat(), "delta": delta} for date, delta in sorted(changes.items()) if delta]
+    if changes:
+        _publish_on_commit(route_channel(route_id), "seats", {"routeId": route_id, "changes": changes})
+
+
+def route_changed(route_id, deleted=False):
+    """Tell subscribers of a route to refetch it after commit."""
+    _publish_on_commit(route_channel(route_id), "route", {"routeId": route_id, "deleted": deleted})
+
+
+async def stream(channels, heartbeat=HEARTBEAT_SECONDS):
+    """SSE frames of ``channels`` until the client goes away, with keep-alive comments."""
+    subscription = broker().subscribe(channels)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        while True:
+            frame = await subscription.get(heartbeat)
+            yield b": keep-alive\n\n" if frame is None else frame
+    finally:
+        subscription.close()
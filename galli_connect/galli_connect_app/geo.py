@@ -0,0 +1,206 @@
+"""
+Coordinate search for DriverRoute.
+
+Each route's origin, destination and optional intermediate waypoints are
+stored as ``RoutePoint`` rows keyed by a geohash: the base-32 interleaving
+of latitude and longitude bits, so points in the same cell share a prefix.
+A radius query covers its bounding box with a handful of cells at the
+finest precision that keeps the cell count small, turns each cell into a
+range scan on the geohash index and only runs the haversine distance on
+the candidates those scans return.
+
+Pure Python and plain B-tree indexes, so it works on any database backend
+without SpatiaLite, PostGIS or SQLite's rtree module.
+"""
+import math
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import RoutePoint
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0088
+PRECISION = 9  # ~5 m cells; what is stored
+MAX_CELLS = 32  # most range scans a single radius query may issue
+
+
+def encode(lat, lng, precision=PRECISION):
+    """Geohash of a point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in km."""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _bounding_box(lat, lng, radius_km):
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(lat)), 1e-6)))
+    return max(lat - dlat, -90.0), min(lat + dlat, 90.0), max(lng - dlng, -180.0), min(lng + dlng, 180.0)
+
+
+def _cells_in_box(box, precision):
+    south, north, west, east = box
+    height, width = cell_size(precision)
+    rows = range(math.floor((south + 90) / height), math.floor((north + 90) / height) + 1)
+    cols = range(math.floor((west + 180) / width), math.floor((east + 180) / width) + 1)
+    if len(rows) * len(cols) > MAX_CELLS:
+        return None
+    return {
+        encode(min(-90 + (row + 0.5) * height, 90.0), min(-180 + (col + 0.5) * width, 180.0), precision)
+        for row in rows for col in cols
+    }
+
+
+def covering_cells(lat, lng, radius_km, box=None):
+    """Geohash prefixes whose cells together cover the circle."""
+    box = box or _bounding_box(lat, lng, radius_km)
+    for precision in range(PRECISION, 0, -1):
+        cells = _cells_in_box(box, precision)
+        if cells is not None:
+            return cells
+    return {""}
+
+
+def parse_point(value, field):
+    """``(lat, lng)`` from ``{"lat": ..., "lng": ...}``; None for a missing value."""
+    if value is None:
+        return None
+    try:
+        lat, lng = float(value["lat"]), float(value["lng"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"'{field}' must be an object with numeric 'lat' and 'lng'")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"'{field}' is outside valid coordinates")
+    return lat, lng
+
+
+def parse_waypoints(value):
+    """List of ``(lat, lng)`` from a ``waypoints`` payload."""
+    return [parse_point(point, "waypoints") for point in value or []]
+
+
+def coordinate_fields(data, from_key, to_key):
+    """DriverRoute coordinate fields for whichever of the two keys ``data`` has."""
+    fields = {}
+    for key, prefix in ((from_key, "from"), (to_key, "to")):
+        if key in data:
+            point = parse_point(data[key], key) or (None, None)
+            fields[f"{prefix}_lat"], fields[f"{prefix}_lng"] = point
+    return fields
+
+
+def as_json(lat, lng):
+    return None if lat is None else {"lat": lat, "lng": lng}
+
+
+def _point(route, kind, seq, lat, lng):
+    return RoutePoint(route_id=route.pk, kind=kind, seq=seq, lat=lat, lng=lng, geohash=encode(lat, lng))
+
+
+def _waypoints(route, waypoints):
+    # Numbered 1..n so seq follows the direction of travel
+    return [
+        _point(route, RoutePoint.WAYPOINT, seq, lat, lng)
+        for seq, (lat, lng) in enumerate(waypoints or [], start=1)
+    ]
+
+
+def route_points(route, waypoints=None):
+    """Unsaved RoutePoint rows for a route's origin, waypoints and destination."""
+    points = _waypoints(route, waypoints)
+    if route.from_lat is not None:
+        points.insert(0, _point(route, RoutePoint.ORIGIN, 0, route.from_lat, route.from_lng))
+    if route.to_lat is not None:
+        points.append(_point(route, RoutePoint.DESTINATION, RoutePoint.LAST, route.to_lat, route.to_lng))
+    return points
+
+
+def index_route(route, created=False):
+    """(Re)build the origin/destination points of a saved route, keeping its waypoints."""
+    if not created:
+        RoutePoint.objects.filter(route_id=route.pk).exclude(kind=RoutePoint.WAYPOINT).delete()
+    points = route_points(route)
+    if points:
+        RoutePoint.objects.bulk_create(points)
+
+
+def set_waypoints(route, waypoints):
+    """Replace a route's intermediate waypoints with a list of ``(lat, lng)``."""
+    RoutePoint.objects.filter(route_id=route.pk, kind=RoutePoint.WAYPOINT).delete()
+    RoutePoint.objects.bulk_create(_waypoints(route, waypoints))
+
+
+def points_within(lat, lng, radius_km, kinds):
+    """Map route id -> [(distance km, seq)] of its points of ``kinds`` in the circle."""
+    box = _bounding_box(lat, lng, radius_km)
+    cells = Q()
+    for cell in covering_cells(lat, lng, radius_km, box):
+        if cell:
+            cells |= Q(geohash__gte=cell, geohash__lt=cell[:-1] + chr(ord(cell[-1]) + 1))
+    # Cells overshoot the circle; the box check drops most of the extra
+    # points inside the index, before the haversine runs in Python.
+    south, north, west, east = box
+    rows = RoutePoint.objects.filter(
+        cells, kind__in=kinds, lat__range=(south, north), lng__range=(west, east),
+    ).values_list("route_id", "seq", "lat", "lng")
+    found = defaultdict(list)
+    for route_id, seq, point_lat, point_lng in rows:
+        distance = haversine_km(lat, lng, point_lat, point_lng)
+        if distance <= radius_km:
+            found[route_id].append((distance, seq))
+    return found
+
+
+def nearby_routes(pickup, radius_km, dropoff=None, limit=20):
+    """Nearest routes passing within ``radius_km`` of ``pickup`` (and ``dropoff``).
+
+    Pickup matches an origin or waypoint, dropoff a waypoint or destination
+    further along the route. Returns ``[(route_id, pickup_km, dropoff_km)]``
+    ordered by total distance, at most ``limit`` long.
+    """
+    starts = points_within(*pickup, radius_km, [RoutePoint.ORIGIN, RoutePoint.WAYPOINT])
+    if dropoff is None:
+        matches = [(route_id, min(points)[0], None) for route_id, points in starts.items()]
+    else:
+        ends = points_within(*dropoff, radius_km, [RoutePoint.WAYPOINT, RoutePoint.DESTINATION])
+        matches = []
+        for route_id in starts.keys() & ends.keys():
+            pairs = [
+                (start, end) for start, start_seq in starts[route_id]
+                for end, end_seq in ends[route_id] if end_seq > start_seq
+            ]
+            if pairs:
+                start, end = min(pairs, key=sum)
+                matches.append((route_id, start, end))
+    matches.sort(key=lambda match: (match[1] + (match[2] or 0), match[0]))
+    return matches[:limit]
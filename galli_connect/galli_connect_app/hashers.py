@@ -0,0 +1,14 @@
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id at the OWASP minimum (19 MiB, 2 passes, 1 lane).
+
+    Django's defaults (100 MiB, 8 lanes) make each login cost several times
+    more CPU and memory. Raise these if logins/sec per core allows it
+    (``manage.py bench_login``); existing hashes are upgraded on next login.
+    """
+
+    time_cost = 2
+    memory_cost = 19 * 1024  # KiB
+    parallelism = 1
@@ -0,0 +1,154 @@
+"""
+Two-phase booking: hold seats, then confirm them.
+
+``place`` takes the seats off the route's inventory straight away, exactly
+like a booking, and records one SeatHold row per date under a shared
+``hold_id`` that expires ``HOLD_MINUTES`` later. Races for the last seats
+are settled there, while the passenger is still filling in details,
+rather than at checkout. ``confirm`` turns the rows into PassengerBookings
+without touching the inventory again; ``cancel`` and expiry give the seats
+back.
+
+Holds are released in bulk: one grouped SELECT reads the seats returned
+per (route, date) for the events pushed to clients (events.py), one UPDATE
+adds them back to the inventory through a correlated subquery, and one
+DELETE drops the rows. ``place`` first releases expired holds on the dates
+it wants, so availability never waits for the sweeper; ``manage.py
+release_expired_holds``, run every minute or so, returns the rest.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from . import api_cache, events, inventory
+from .models import PassengerBooking, RouteSeatInventory, SeatHold
+
+HOLD_MINUTES = 10
+SWEEP_CHUNK = 1000
+
+
+class HoldExpired(Exception):
+    """Raised when confirming a hold after it expired; its seats are back on sale.
+
+    ``route`` is the (driver id, route id) the seats went back to.
+    """
+
+    def __init__(self, message, route):
+        super().__init__(message)
+        self.route = route
+
+
+def _release(holds):
+    """Give the seats of a SeatHold queryset back to the inventory and delete the rows.
+
+    Call it inside a transaction. Returns the number of rows released.
+    """
+    returned = defaultdict(dict)
+    for route_id, date, seats in holds.order_by().values_list("route", "date").annotate(Sum("seats")):
+        returned[route_id][date] = seats
+    for route_id, changes in returned.items():
+        events.seats_changed(route_id, changes)
+    held = (
+        holds.filter(route=OuterRef("route"), date=OuterRef("date"))
+        .order_by().values("route", "date").annotate(total=Sum("seats")).values("total")
+    )
+    RouteSeatInventory.objects.filter(route__in=holds.values("route"), date__in=holds.values("date")).filter(
+        Exists(held),
+    ).update(available_seats=F("available_seats") + Subquery(held))
+    return holds.delete()[0]
+
+
+def place(route, passenger, dates, seats, now=None):
+    """Hold ``seats`` on every date, all or nothing; returns the SeatHolds.
+
+    Raises inventory.NotEnoughSeats like inventory.book.
+    """
+    dates = sorted(set(dates))
+    now = now or timezone.now()
+    hold_id = uuid.uuid4()
+    expired = SeatHold.objects.filter(route=route, date__in=dates, expires_at__lte=now)
+
+    def write():
+        if expired.exists():
+            _release(expired)
+        inventory.reserve(route, dates, seats)
+        return SeatHold.objects.bulk_create([
+            SeatHold(hold_id=hold_id, passenger=passenger, route=route, date=date, seats=seats,
+                     expires_at=now + timedelta(minutes=HOLD_MINUTES))
+            for date in dates
+        ])
+
+    return inventory.retry_locked(write)
+
+
+def confirm(hold_id, passenger, now=None):
+    """Book the seats of a hold; returns the PassengerBookings.
+
+    Raises SeatHold.DoesNotExist when the passenger has no such hold and
+    HoldExpired (after releasing it) when it has expired.
+    """
+    now = now or timezone.now()
+    holds = SeatHold.objects.filter(hold_id=hold_id, passenger=passenger)
+
+    def write():
+        rows = list(holds.select_for_update())
+        if not rows:
+            raise SeatHold.DoesNotExist(f"No seat hold {hold_id}")
+        if rows[0].expires_at <= now:
+            route = holds.values_list("route__driver_id", "route_id").first()
+            _release(holds)
+            return None, route
+        holds.delete()
+        return PassengerBooking.objects.bulk_create([
+            PassengerBooking(passenger=passenger, route_id=row.route_id, date=row.date, seats_booked=row.seats)
+            for row in rows
+        ]), None
+
+    bookings, expired = inventory.retry_locked(write)
+    if expired:
+        raise HoldExpired(f"Seat hold {hold_id} expired", expired)
+    return bookings
+
+
+def cancel(hold_id, passenger):
+    """Release a hold now; returns its (driver id, route id), or None if there is no such hold."""
+    holds = SeatHold.objects.filter(hold_id=hold_id, passenger=passenger)
+
+    def write():
+        route = holds.values_list("route__driver_id", "route_id").first()
+        if route is not None:
+            _release(holds)
+        return route
+
+    return inventory.retry_locked(write)
+
+
+def release_expired(now=None, chunk_size=SWEEP_CHUNK):
+    """Release every hold that expired by ``now``, ``chunk_size`` rows per transaction.
+
+    Returns the number of rows released. Holds being confirmed at the same
+    time are skipped (they are locked) and left to their confirmation.
+    """
+    now = now or timezone.now()
+    expired = SeatHold.objects.filter(expires_at__lte=now).order_by()
+
+    def write():
+        rows = list(
+            expired.select_for_update(skip_locked=True, of=("self",))
+            .values_list("id", "route__driver_id", "route_id")[:chunk_size]
+        )
+        if rows:
+            _release(SeatHold.objects.filter(id__in=[row[0] for row in rows]))
+            for driver_id, route_id in {row[1:] for row in rows}:
+                api_cache.invalidate_route(driver_id, route_id)
+        return len(rows)
+
+    released = 0
+    while count := inventory.retry_locked(write):
+        released += count
+        if count < chunk_size:
+            break
+    return released
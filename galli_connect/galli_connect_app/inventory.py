@@ -0,0 +1,348 @@
+"""
+Seat availability for DriverRoute.
+
+A route runs on a recurring schedule stored on the route row: a weekday
+bitmask (bit 0 = Monday ... bit 6 = Sunday) between an optional
+``start_date`` and ``end_date``, with ``total_seats`` available on every such
+date. Nothing is stored per date until a date differs from that rule, at
+which point ``RouteSeatInventory`` holds an override row for it:
+
+- the seats left after bookings (created lazily by the first booking),
+- an extra date outside the rule, with its own seat count,
+- a cancelled date (``cancelled=True``).
+
+The ``active_days`` lists sent to clients
+(``[{"date": "2025-08-15", "day": "Fri", "availableSeats": 3}, ...]``) are
+generated from the rule plus the override rows, and bookings decrement a
+single override row with a conditional UPDATE.
+"""
+import random
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import events
+from .models import PassengerBooking, RouteSeatInventory
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# How many days ahead listings spell out the recurring dates
+AVAILABILITY_DAYS = 28
+
+# Attempts for a booking that hits a lock timeout (SQLite "database is locked")
+BOOKING_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.02
+
+# fields: DriverRoute attributes to set (weekday_mask, start_date, end_date).
+# overrides: date -> seats for explicitly listed dates, or None if not sent.
+# exceptions: set of cancelled dates, or None if not sent.
+ScheduleUpdate = namedtuple("ScheduleUpdate", ["fields", "overrides", "exceptions"])
+
+
+class NotEnoughSeats(Exception):
+    """Raised when a date has fewer available seats than requested."""
+
+    def __init__(self, date):
+        super().__init__(f"Not enough seats available on {date}")
+        self.date = date
+
+
+def parse_weekdays(names):
+    """Weekday bitmask from names such as ``["Mon", "wednesday"]``."""
+    mask = 0
+    for name in names or []:
+        prefix = str(name)[:3].title()
+        if prefix not in WEEKDAYS:
+            raise ValueError(f"Unknown weekday: {name!r}")
+        mask |= 1 << WEEKDAYS.index(prefix)
+    return mask
+
+
+# Names of every 7-bit mask, so listings do not rebuild them per route
+_MASK_NAMES = [
+    tuple(name for bit, name in enumerate(WEEKDAYS) if mask & (1 << bit)) for mask in range(1 << 7)
+]
+
+
+def weekday_names(mask):
+    return list(_MASK_NAMES[mask & 0b1111111])
+
+
+def _parse_date(value, field):
+    date = parse_date(str(value or ""))
+    if date is None:
+        raise ValueError(f"Invalid date in {field}: {value!r}")
+    return date
+
+
+def parse_schedule(active_days=None, recurrence=None):
+    """Parse the schedule parts of a route payload into a ScheduleUpdate.
+
+    ``active_days`` is the client's list: per-date dicts
+    (``{"date": "2025-08-15", "availableSeats": 3}``) become overrides and
+    bare weekday names become the weekday mask. ``recurrence`` is
+    ``{"weekdays": [...], "startDate": ..., "endDate": ..., "exceptions": [...]}``.
+    Raises ValueError on anything it cannot parse.
+    """
+    fields = {}
+    overrides = None
+    exceptions = None
+
+    if active_days is not None:
+        names = [entry for entry in active_days if not isinstance(entry, dict)]
+        dated = [entry for entry in active_days if isinstance(entry, dict)]
+        if names:
+            fields["weekday_mask"] = parse_weekdays(names)
+        if dated or not names:
+            overrides = {
+                _parse_date(entry.get("date"), "activeDays"): int(entry.get("availableSeats", 0))
+                for entry in dated
+            }
+
+    if recurrence is not None:
+        if "weekdays" in recurrence:
+            fields["weekday_mask"] = parse_weekdays(recurrence["weekdays"])
+        for key, field in (("startDate", "start_date"), ("endDate", "end_date")):
+            if key in recurrence:
+                value = recurrence[key]
+                fields[field] = _parse_date(value, f"schedule.{key}") if value else None
+        if "exceptions" in recurrence:
+            exceptions = {
+                _parse_date(value, "schedule.exceptions") for value in recurrence["exceptions"] or []
+            }
+
+    return ScheduleUpdate(fields, overrides, exceptions)
+
+
+def _attr(route, name):
+    return route[name] if isinstance(route, dict) else getattr(route, name)
+
+
+def runs_by_rule(route, date):
+    """Whether the recurring schedule alone puts the route on ``date``."""
+    start, end = _attr(route, "start_date"), _attr(route, "end_date")
+    return bool(
+        _attr(route, "weekday_mask") & (1 << date.weekday())
+        and (start is None or start <= date)
+        and (end is None or date <= end)
+    )
+
+
+def sync_inventory(route, update):
+    """Store the override rows described by a ScheduleUpdate.
+
+    A list of dates replaces the route's other explicit dates; rows for dates
+    the rule still covers are kept with their booked-down seat counts. A list
+    of exceptions replaces the previous cancellations.
+    """
+    if update.overrides is not None:
+        stale = [
+            date for date, cancelled in
+            RouteSeatInventory.objects.filter(route=route).values_list("date", "cancelled")
+            if not cancelled and date not in update.overrides and not runs_by_rule(route, date)
+        ]
+        RouteSeatInventory.objects.filter(route=route, date__in=stale).delete()
+        RouteSeatInventory.objects.bulk_create(
+            [RouteSeatInventory(route=route, date=date, available_seats=seats)
+             for date, seats in update.overrides.items()],
+            update_conflicts=True,
+            unique_fields=["route", "date"],
+            update_fields=["available_seats", "cancelled"],
+        )
+    if update.exceptions is not None:
+        RouteSeatInventory.objects.filter(route=route, cancelled=True).exclude(
+            date__in=update.exceptions).delete()
+        RouteSeatInventory.objects.bulk_create(
+            [RouteSeatInventory(route=route, date=date, available_seats=0, cancelled=True)
+             for date in update.exceptions],
+            update_conflicts=True,
+            unique_fields=["route", "date"],
+            update_fields=["available_seats", "cancelled"],
+        )
+
+
+def schedule_for(route):
+    """The recurring part of a route's schedule, as sent to clients."""
+    start, end = _attr(route, "start_date"), _attr(route, "end_date")
+    return {
+        "weekdays": weekday_names(_attr(route, "weekday_mask")),
+        "startDate": start.isoformat() if start else None,
+        "endDate": end.isoformat() if end else None,
+    }
+
+
+def _override_rows(route_ids, start, days):
+    rows = RouteSeatInventory.objects.filter(route_id__in=list(route_ids), date__gte=start)
+    if days is not None:
+        rows = rows.filter(date__lte=start + timedelta(days=days - 1))
+    return rows.values_list("route_id", "date", "available_seats", "cancelled")
+
+
+def _merge(routes, rows, start, days):
+    overrides = defaultdict(dict)
+    for route_id, date, seats, cancelled in rows:
+        overrides[route_id][date] = None if cancelled else seats
+
+    window = [start + timedelta(days=offset) for offset in range(days)]
+    result = defaultdict(list)
+    for route in routes:
+        route_id = _attr(route, "id")
+        seats_by_date = {
+            date: _attr(route, "total_seats") for date in window if runs_by_rule(route, date)
+        }
+        seats_by_date.update(overrides[route_id])
+        result[route_id] = [
+            {"date": date.isoformat(), "day": date.strftime("%a"), "availableSeats": seats}
+            for date, seats in sorted(seats_by_date.items())
+            if seats is not None
+        ]
+    return result
+
+
+def active_days_for(routes, start=None, days=None):
+    """Map route id -> ``active_days`` list from ``start`` (default today).
+
+    With ``days``, only the dates of that window are listed. Without it,
+    recurring dates are spelled out for AVAILABILITY_DAYS days and explicit
+    dates are listed however far ahead they are. ``routes`` are DriverRoute
+    instances or ``values()`` dicts carrying the schedule fields. One query.
+    """
+    routes = list(routes)
+    start = start or timezone.localdate()
+    rows = _override_rows((_attr(route, "id") for route in routes), start, days)
+    return _merge(routes, rows, start, days or AVAILABILITY_DAYS)
+
+
+async def aactive_days_for(routes, start=None, days=None):
+    """Async variant of ``active_days_for``."""
+    routes = list(routes)
+    start = start or timezone.localdate()
+    rows = [row async for row in _override_rows((_attr(route, "id") for route in routes), start, days)]
+    return _merge(routes, rows, start, days or AVAILABILITY_DAYS)
+
+
+def available_on(dates, seats):
+    """DriverRoute filter: routes with ``seats`` free on at least one of ``dates``.
+
+    Evaluated entirely in SQL: per date, either a non-cancelled override row
+    has the seats, or there is no override row and the weekly rule covers the
+    date with enough ``total_seats``. Each check is an index lookup on
+    (route, date).
+    """
+    condition = Q()
+    for date in dates:
+        overrides = RouteSeatInventory.objects.filter(route=OuterRef("pk"), date=date)
+        by_rule = (
+            ~Exists(overrides)
+            & GreaterThan(F("weekday_mask").bitand(1 << date.weekday()), 0)
+            & (Q(start_date__isnull=True) | Q(start_date__lte=date))
+            & (Q(end_date__isnull=True) | Q(end_date__gte=date))
+            & Q(total_seats__gte=seats)
+        )
+        condition |= Exists(overrides.filter(cancelled=False, available_seats__gte=seats)) | by_rule
+    return condition
+
+
+def reserve(route, dates, seats):
+    """Take ``seats`` off each date with one conditional UPDATE per date.
+
+    Dates served by the recurring rule get their override row on first use,
+    with an INSERT that skips rows already there so concurrent first bookings
+    are safe. Raises NotEnoughSeats for the first date that cannot be served,
+    and ValueError unless ``seats`` is at least 1. Call it inside a
+    transaction so a failure undoes the dates already taken.
+    """
+    if seats < 1:
+        raise ValueError(f"Cannot reserve {seats} seats")
+    RouteSeatInventory.objects.bulk_create(
+        [RouteSeatInventory(route=route, date=date, available_seats=route.total_seats)
+         for date in dates if runs_by_rule(route, date)],
+        ignore_conflicts=True,
+    )
+    for date in dates:
+        updated = RouteSeatInventory.objects.filter(
+            route=route, date=date, cancelled=False, available_seats__gte=seats,
+        ).update(available_seats=F("available_seats") - seats)
+        if not updated:
+            raise NotEnoughSeats(date)
+    events.seats_changed(route.id, {date: -seats for date in dates})
+
+
+def scheduled_dates(route, start, end, weekday_mask=0):
+    """Dates the route runs between ``start`` and ``end`` (inclusive).
+
+    ``weekday_mask`` optionally narrows the result to some weekdays.
+    """
+    cancelled = dict(
+        RouteSeatInventory.objects.filter(route=route, date__range=(start, end))
+        .values_list("date", "cancelled")
+    )
+    dates = []
+    date = start
+    while date <= end:
+        runs = not cancelled[date] if date in cancelled else runs_by_rule(route, date)
+        if runs and (not weekday_mask or weekday_mask & (1 << date.weekday())):
+            dates.append(date)
+        date += timedelta(days=1)
+    return dates
+
+
+def first_unavailable(route, dates, seats):
+    """First of ``dates`` without ``seats`` available, or None; one query."""
+    available = {
+        date: None if cancelled else seats_left
+        for date, seats_left, cancelled in RouteSeatInventory.objects.filter(
+            route=route, date__in=dates,
+        ).values_list("date", "available_seats", "cancelled")
+    }
+    for date in dates:
+        if date not in available and runs_by_rule(route, date):
+            available[date] = route.total_seats
+        if available.get(date) is None or available[date] < seats:
+            return date
+    return None
+
+
+def book(route, passenger, dates, seats, attempts=BOOKING_ATTEMPTS):
+    """Reserve every date and record the bookings, all or nothing.
+
+    The bookings are written with a single bulk INSERT in the same
+    transaction, so a month of commutes costs one commit, not one per date.
+
+    Each conditional UPDATE locks its inventory row until commit, so two
+    passengers racing for the last seat cannot both succeed; the loser gets
+    NotEnoughSeats. Dates are locked in sorted order so concurrent multi-date
+    bookings cannot deadlock. Lock timeouts are retried with jittered
+    backoff unless we are inside a caller's transaction.
+    """
+    dates = sorted(set(dates))
+
+    def write():
+        reserve(route, dates, seats)
+        return PassengerBooking.objects.bulk_create([
+            PassengerBooking(passenger=passenger, route=route, date=date, seats_booked=seats)
+            for date in dates
+        ])
+
+    return retry_locked(write, attempts)
+
+
+def retry_locked(write, attempts=BOOKING_ATTEMPTS):
+    """Run ``write()`` in a transaction, retrying lock timeouts with jittered backoff.
+
+    Inside a caller's transaction the first failure is raised instead.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                return write()
+        except OperationalError:
+            if attempt == attempts or connection.in_atomic_block:
+                raise
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt * random.random())
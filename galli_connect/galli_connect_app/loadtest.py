@@ -0,0 +1,340 @@
+"""
+Load-testing harness for the booking API (``manage.py loadtest``).
+
+``populate`` fills a database with a synthetic city: drivers with weekday
+routes between ``benchmarks.AREAS``, passengers, and multi-date bookings.
+Routes and bookings go through the bulk_io importers, so search index rows,
+route points and seat inventory end up as the API would leave them. Every
+account's password is ``PASSWORD``, hashed once rather than per account.
+
+Scenarios script what real clients do, one virtual user per session:
+
+- ``passenger``: sign up, log in, then ``iterations`` rounds of a search
+  over a few days and a booking of 1-3 of the dates found.
+- ``driver``: log in as a seeded driver, then ``iterations`` polls of the
+  dashboard (routes, a route's bookings and seat summary), revalidating
+  with ETags like the browser.
+
+Sessions run in-process through the Django test client (``ClientTransport``)
+or over HTTP against a running server (``HttpTransport``), on
+``concurrency`` threads. Each request is timed per step; ``report`` turns
+the samples into throughput and latency percentiles, and ``compare`` lists
+the steps that got slower than in an earlier report.
+"""
+import http.client
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client
+from django.utils import timezone
+
+from . import accounts, benchmarks, bulk_io
+from .models import DriverRoute, UserProfile
+
+PASSWORD = "loadtest-password"
+# Usernames of seeded and signed-up accounts start with this
+PREFIX = "loadtest-"
+# Routes run on weekdays from today; searches and bookings fall in this window
+DAYS = 14
+SEARCH_WINDOW_DAYS = 3
+# Share of searches between the areas of a seeded route; the rest are random pairs
+SEARCH_HIT_RATIO = 0.8
+
+
+class Scale(NamedTuple):
+    drivers: int = 20
+    routes_per_driver: int = 5
+    passengers: int = 200
+    bookings: int = 1000
+
+
+class SeededDriver(NamedTuple):
+    id: int
+    email: str
+    route_ids: tuple
+
+
+class Dataset(NamedTuple):
+    drivers: list
+    # (from area, to area) of every seeded route
+    area_pairs: list
+    dates: list
+
+    @classmethod
+    def load(cls):
+        """The seeded drivers and routes of the default database."""
+        routes = {}
+        for route_id, driver_id, from_location, to_location in DriverRoute.objects.filter(
+            driver__username__startswith=PREFIX,
+        ).order_by("id").values_list("id", "driver_id", "from_location", "to_location"):
+            routes.setdefault(driver_id, []).append((route_id, _area(from_location), _area(to_location)))
+        drivers = [
+            SeededDriver(user_id, email, tuple(route_id for route_id, _, _ in routes[user_id]))
+            for user_id, email in User.objects.filter(id__in=routes).order_by("id").values_list("id", "email")
+        ]
+        pairs = [(start, end) for driver_routes in routes.values() for _, start, end in driver_routes]
+        today = timezone.localdate()
+        return cls(drivers, pairs, [today + timedelta(days=i) for i in range(1, DAYS)])
+
+
+def _area(location):
+    return next((area for area in benchmarks.AREAS if location.startswith(area)), location.split()[0])
+
+
+def _create_accounts(tag, role, count, password):
+    users = User.objects.bulk_create([
+        User(username=accounts.username(email, role), email=email, first_name=f"{role.title()} {i}", password=password)
+        for i, email in enumerate(f"{PREFIX}{tag}-{role.lower()}-{i}@example.com" for i in range(count))
+    ], batch_size=bulk_io.CHUNK_SIZE)
+    UserProfile.objects.bulk_create([UserProfile(user=user, role=role) for user in users], batch_size=bulk_io.CHUNK_SIZE)
+    return users
+
+
+def populate(rng, scale=Scale(), on_error=None):
+    """Seed drivers, their routes, passengers and bookings; returns the counts created."""
+    tag = uuid.uuid4().hex[:8]
+    password = make_password(PASSWORD)
+    drivers = _create_accounts(tag, "DRIVER", scale.drivers, password)
+    passengers = _create_accounts(tag, "PASSENGER", scale.passengers, password)
+    today = timezone.localdate()
+
+    def route_rows():
+        for i in range(scale.drivers * scale.routes_per_driver):
+            (from_lat, from_lng), (to_lat, to_lng) = benchmarks.synthetic_point(rng), benchmarks.synthetic_point(rng)
+            yield i + 1, {
+                "driverId": drivers[i % scale.drivers].id,
+                "from": benchmarks.synthetic_location(rng), "to": benchmarks.synthetic_location(rng),
+                "departureTime": f"{rng.randint(6, 10):02d}:{rng.choice([0, 15, 30, 45]):02d}",
+                "costPerSeat": rng.randint(20, 200), "totalSeats": rng.randint(3, 6),
+                "weekdays": "Mon,Tue,Wed,Thu,Fri", "startDate": today.isoformat(),
+                "fromLat": from_lat, "fromLng": from_lng, "toLat": to_lat, "toLng": to_lng,
+            }
+
+    routes = bulk_io.import_routes(route_rows(), on_error=on_error)
+    route_ids = list(DriverRoute.objects.filter(driver__in=drivers).values_list("id", flat=True))
+    weekdays = [today + timedelta(days=i) for i in range(1, DAYS) if (today + timedelta(days=i)).weekday() < 5]
+
+    def booking_rows():
+        line = 0
+        for _ in range(scale.bookings):
+            passenger, route_id = rng.choice(passengers), rng.choice(route_ids)
+            for date in rng.sample(weekdays, rng.randint(1, min(3, len(weekdays)))):
+                line += 1
+                yield line, {"passengerId": passenger.id, "routeId": route_id, "date": date.isoformat(),
+                             "seatsBooked": 1}
+
+    # Rows for dates already full are reported and skipped, like a rejected booking
+    bookings = bulk_io.import_bookings(booking_rows(), on_error=on_error) if route_ids and weekdays else 0
+    return {"drivers": len(drivers), "passengers": len(passengers), "routes": routes, "bookings": bookings}
+
+
+class ClientTransport:
+    """In-process requests through the Django test client."""
+
+    name = "client"
+
+    def session(self):
+        return _ClientSession()
+
+
+class _ClientSession:
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.generic(
+            method, path, json.dumps(body) if body is not None else "",
+            content_type="application/json", headers=headers,
+        )
+        return response.status_code, response.headers, response.content
+
+    def close(self):
+        # Each worker thread opened its own database connection
+        connections.close_all()
+
+
+class HttpTransport:
+    """Requests to a running server, over one keep-alive connection per session."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.name = url
+        self.https = parts.scheme == "https"
+        self.host, self.port = parts.hostname, parts.port
+
+    def session(self):
+        return _HttpSession(self)
+
+
+class _HttpSession:
+    def __init__(self, transport):
+        self.transport = transport
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        payload = json.dumps(body).encode() if body is not None else None
+        for attempt in range(2):
+            if self.connection is None:
+                factory = http.client.HTTPSConnection if self.transport.https else http.client.HTTPConnection
+                self.connection = factory(self.transport.host, self.transport.port, timeout=30)
+            try:
+                self.connection.request(method, path, payload, headers)
+                response = self.connection.getresponse()
+                return response.status, response.headers, response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the idle keep-alive connection; reconnect once
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class VirtualUser:
+    """One client session; times each request under a step name."""
+
+    def __init__(self, http, record):
+        self.http = http
+        self.record = record
+        self.token = None
+        self.etags = {}
+
+    def call(self, step, method, path, body=None, revalidate=False):
+        """Send a request; returns (status, decoded JSON body or None)."""
+        headers = {}
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        if revalidate and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        start = time.perf_counter()
+        try:
+            status, response_headers, content = self.http.request(method, path, body, headers)
+        except OSError:
+            status, response_headers, content = 0, {}, b""
+        self.record((step, status, (time.perf_counter() - start) * 1000))
+        if revalidate and response_headers.get("ETag"):
+            self.etags[path] = response_headers["ETag"]
+        if status not in (200, 201) or not content:
+            return status, None
+        return status, json.loads(content)
+
+    def login(self, email, role):
+        status, body = self.call("login", "POST", "/api/login", {"email": email, "password": PASSWORD, "role": role})
+        if body:
+            self.token = body["token"]
+        return body
+
+
+def passenger(user, rng, dataset, iterations, number, run_id):
+    email = f"{PREFIX}{run_id}-rider-{number}@example.com"
+    user.call("signup", "POST", "/api/signup",
+              {"name": f"Rider {number}", "email": email, "password": PASSWORD, "role": "PASSENGER"})
+    if not user.login(email, "PASSENGER"):
+        return
+    for _ in range(iterations):
+        if dataset.area_pairs and rng.random() < SEARCH_HIT_RATIO:
+            start_area, end_area = rng.choice(dataset.area_pairs)
+        else:
+            start_area, end_area = rng.sample(benchmarks.AREAS, 2)
+        start = rng.choice(dataset.dates[:-SEARCH_WINDOW_DAYS])
+        _, routes = user.call("search", "POST", "/api/routes/search", {
+            "from": start_area, "to": end_area, "startDate": start.isoformat(),
+            "endDate": (start + timedelta(days=SEARCH_WINDOW_DAYS - 1)).isoformat(), "limit": 20,
+        })
+        if not routes:
+            continue
+        route = rng.choice(routes)
+        days = [day["date"] for day in route["activeDays"] if day["availableSeats"] > 0]
+        if days:
+            user.call("book", "POST", "/api/book-seats", {
+                "driverId": route["driverId"], "routeId": route["id"], "seatsToBook": 1,
+                "dates": rng.sample(days, rng.randint(1, min(3, len(days)))),
+            })
+
+
+def driver(user, rng, dataset, iterations, number, run_id):
+    seeded = dataset.drivers[number % len(dataset.drivers)]
+    if not user.login(seeded.email, "DRIVER"):
+        return
+    for _ in range(iterations):
+        user.call("driver_routes", "GET", f"/api/get-driver-routes/{seeded.id}/", revalidate=True)
+        route_id = rng.choice(seeded.route_ids)
+        base = f"/api/driver/{seeded.id}/routes/{route_id}/bookings"
+        user.call("route_bookings", "GET", base, revalidate=True)
+        user.call("route_summary", "GET", f"{base}?summary=1")
+
+
+SCENARIOS = {"passenger": passenger, "driver": driver}
+
+
+def run(scenario, transport, dataset, sessions, iterations, concurrency, seed=42):
+    """Run ``sessions`` virtual users of a scenario; returns the samples and the elapsed seconds."""
+    samples = []
+    run_id = uuid.uuid4().hex[:8]
+
+    def session(number):
+        http = transport.session()
+        try:
+            SCENARIOS[scenario](VirtualUser(http, samples.append), benchmarks.make_rng(seed + number),
+                                dataset, iterations, number, run_id)
+        finally:
+            http.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(session, range(sessions)))
+    return samples, time.perf_counter() - start
+
+
+def report(samples, elapsed):
+    """Throughput, errors and per-step latency percentiles of a run."""
+    steps = {}
+    for step, status, ms in samples:
+        steps.setdefault(step, []).append((status, ms))
+    errors = sum(status == 0 or status >= 500 for _, status, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "steps": {
+            step: {
+                "requests": len(rows),
+                "statuses": {str(code): sum(status == code for status, _ in rows) for code in sorted({s for s, _ in rows})},
+                **benchmarks.summarize([ms for _, ms in rows]),
+            }
+            for step, rows in steps.items()
+        },
+    }
+
+
+def compare(results, baseline, tolerance, floor_ms=1.0):
+    """Steps of ``results`` whose p95 grew by more than ``tolerance`` (and ``floor_ms``) over ``baseline``.
+
+    Returns (scenario, step, baseline p95, p95) tuples.
+    """
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        for step, stats in current["steps"].items():
+            before = previous["steps"].get(step)
+            if before is None:
+                continue
+            old, new = before["p95_ms"], stats["p95_ms"]
+            if new > old * (1 + tolerance) and new - old > floor_ms:
+                regressions.append((scenario, step, old, new))
+    return regressions
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from galli_connect_app.inventory import parse_schedule
+from galli_connect_app.models import DriverRoute, RouteSeatInventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Move each route's legacy active_days JSON into the recurring schedule: "
+        "weekday names set the weekday mask, dated entries become inventory rows. "
+        "Dates that already have an inventory row are left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--clear", action="store_true",
+            help="Empty the active_days JSON of migrated routes.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        before = RouteSeatInventory.objects.count()
+        skipped = 0
+        rows, migrated = [], []
+        routes = DriverRoute.objects.filter(active_days__isnull=False).only("id", "weekday_mask", "active_days")
+        for route in routes.iterator(chunk_size=batch_size):
+            try:
+                schedule = parse_schedule(route.active_days)
+            except (AttributeError, TypeError, ValueError) as e:
+                skipped += 1
+                self.stderr.write(f"Route {route.id}: {e}")
+                continue
+            rows.extend(
+                RouteSeatInventory(route_id=route.id, date=date, available_seats=seats)
+                for date, seats in (schedule.overrides or {}).items()
+            )
+            route.weekday_mask = schedule.fields.get("weekday_mask", route.weekday_mask)
+            if options["clear"]:
+                route.active_days = None
+            migrated.append(route)
+            if len(rows) >= batch_size or len(migrated) >= batch_size:
+                self._flush(rows, migrated)
+                rows, migrated = [], []
+        self._flush(rows, migrated)
+        created = RouteSeatInventory.objects.count() - before
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Inventory rows created: {created}; routes skipped: {skipped}."
+        ))
+
+    def _flush(self, rows, routes):
+        RouteSeatInventory.objects.bulk_create(rows, ignore_conflicts=True)
+        DriverRoute.objects.bulk_update(routes, ["weekday_mask", "active_days"])
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+
+from galli_connect_app import async_views, benchmarks, views
+from galli_connect_app.models import DriverRoute
+from galli_connect_app.search import index_routes
+
+
+def polling_urlconf(name, module):
+    """A URLconf serving the polling endpoints from ``module``."""
+    urlconf = types.ModuleType(name)
+    urlconf.urlpatterns = [
+        path('api/get-driver-routes/<int:driver_id>/', module.get_driver_routes),
+        path('api/routes/search', module.search_routes),
+        path('api/driver/<int:driver_id>/routes/<int:route_id>/bookings', module.get_route_bookings),
+    ]
+    sys.modules[name] = urlconf
+    return name
+
+
+class Command(BaseCommand):
+    help = (
+        "In-process load test of the polling endpoints: sync views behind a "
+        "bounded WSGI thread pool vs. async views under the ASGI handler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", nargs="+", type=int, default=[100, 500, 1000])
+        parser.add_argument("--requests", type=int, default=5, help="Requests per client.")
+        parser.add_argument("--wsgi-threads", type=int, default=32,
+                            help="Worker threads of the simulated WSGI server.")
+        parser.add_argument("--routes", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmarks.isolated_database(on_disk=True):
+            calls = self._seed(options["routes"])
+            modes = [
+                ("wsgi", polling_urlconf("_bench_wsgi_urls", views), self._wsgi),
+                ("asgi", polling_urlconf("_bench_asgi_urls", async_views), self._asgi),
+            ]
+            for clients in options["clients"]:
+                for mode, urlconf, run in modes:
+                    with override_settings(ROOT_URLCONF=urlconf):
+                        elapsed, samples, errors = asyncio.run(
+                            run(calls, clients, options["requests"], options["wsgi_threads"]))
+                    results.append({
+                        "mode": mode,
+                        "clients": clients,
+                        "requests": len(samples),
+                        "errors": errors,
+                        "requests_per_s": round(len(samples) / elapsed, 1),
+                        "latency": benchmarks.summarize(samples),
+                    })
+                    row = results[-1]
+                    self.stderr.write(
+                        f"{mode} clients={clients:<5} rps={row['requests_per_s']:>8} "
+                        f"p50={row['latency']['median_ms']:>9.1f}ms p99={row['latency']['p99_ms']:>9.1f}ms "
+                        f"errors={errors}"
+                    )
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def _seed(self, count):
+        rng = benchmarks.make_rng()
+        driver = User.objects.create_user(username="bench_driver", password="x")
+        routes = DriverRoute.objects.bulk_create([
+            DriverRoute(
+                driver=driver, from_location=benchmarks.synthetic_location(rng),
+                to_location=benchmarks.synthetic_location(rng), departure_time="08:00",
+                cost_per_seat=40, total_seats=4, weekday_mask=0b0011111, departure_minutes=8 * 60,
+            )
+            for _ in range(count)
+        ])
+        index_routes(routes)
+        search = json.dumps({"from": "koramangala", "to": "tech", "limit": 20})
+        return [
+            ("post", "/api/routes/search", search),
+            ("get", f"/api/get-driver-routes/{driver.id}/", None),
+            ("get", f"/api/driver/{driver.id}/routes/{routes[0].id}/bookings", None),
+        ]
+
+    async def _wsgi(self, calls, clients, per_client, threads):
+        local = threading.local()
+
+        def call(method, url, body):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            if body is None:
+                return getattr(local.client, method)(url).status_code
+            return getattr(local.client, method)(url, body, content_type="application/json").status_code
+
+        pool = ThreadPoolExecutor(max_workers=threads)
+        loop = asyncio.get_running_loop()
+        try:
+            return await self._drive(
+                lambda method, url, body: loop.run_in_executor(pool, call, method, url, body),
+                calls, clients, per_client,
+            )
+        finally:
+            pool.map(lambda _: connection.close(), range(threads))
+            pool.shutdown(wait=True)
+
+    async def _asgi(self, calls, clients, per_client, threads):
+        client = AsyncClient()
+
+        async def call(method, url, body):
+            if body is None:
+                response = await getattr(client, method)(url)
+            else:
+                response = await getattr(client, method)(url, body, content_type="application/json")
+            return response.status_code
+
+        return await self._drive(call, calls, clients, per_client)
+
+    async def _drive(self, call, calls, clients, per_client):
+        samples = []
+        errors = 0
+
+        async def user(offset):
+            nonlocal errors
+            for i in range(per_client):
+                method, url, body = calls[(offset + i) % len(calls)]
+                start = time.perf_counter()
+                status = await call(method, url, body)
+                samples.append((time.perf_counter() - start) * 1000)
+                errors += status >= 500
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(clients)))
+        return time.perf_counter() - start, samples, errors
@@ -0,0 +1,65 @@
+import json
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from galli_connect_app import benchmarks, inventory
+from galli_connect_app.models import DriverRoute, PassengerBooking, RouteSeatInventory
+
+
+def book_row_by_row(route, passenger, dates, seats):
+    """The pre-batching path: one autocommitted UPDATE and INSERT per date."""
+    for day in dates:
+        RouteSeatInventory.objects.filter(
+            route=route, date=day, available_seats__gte=seats,
+        ).update(available_seats=F("available_seats") - seats)
+        PassengerBooking.objects.create(passenger=passenger, route=route, date=day, seats_booked=seats)
+
+
+class Command(BaseCommand):
+    help = "Per-booking latency against the number of dates, row-by-row vs. batched."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dates", nargs="+", type=int, default=[1, 5, 10, 20, 40])
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--in-memory", action="store_true",
+            help="Use an in-memory SQLite database (hides the per-commit fsync cost).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmarks.isolated_database(on_disk=not options["in_memory"]):
+            driver = User.objects.create_user(username="bench_driver", password="x")
+            passenger = User.objects.create_user(username="bench_passenger", password="x")
+            seats = options["repeat"] * 2 + 1
+            for count in options["dates"]:
+                route = DriverRoute.objects.create(
+                    driver=driver, from_location="Bench From", to_location="Bench To",
+                    departure_time="08:00", cost_per_seat=10, total_seats=seats,
+                )
+                dates = [date.today() + timedelta(days=i) for i in range(count)]
+                inventory.sync_inventory(route, inventory.parse_schedule([
+                    {"date": d.isoformat(), "availableSeats": seats} for d in dates
+                ]))
+                old = benchmarks.timed(
+                    lambda: book_row_by_row(route, passenger, dates, 1), options["repeat"])
+                new = benchmarks.timed(
+                    lambda: inventory.book(route, passenger, dates, 1), options["repeat"])
+                results.append({
+                    "dates": count,
+                    "row_by_row": benchmarks.summarize(old),
+                    "batched": benchmarks.summarize(new),
+                })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['dates']:>4} dates  row-by-row={row['row_by_row']['median_ms']:>8.2f}ms  "
+                f"batched={row['batched']['median_ms']:>8.2f}ms"
+            )
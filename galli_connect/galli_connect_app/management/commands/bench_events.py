@@ -0,0 +1,145 @@
+import asyncio
+import json
+import resource
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+
+from galli_connect_app import benchmarks, events
+
+
+def _scope(route_ids, port):
+    query = "routes=" + ",".join(map(str, route_ids))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/events",
+        "raw_path": b"/api/events",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"localhost"), (b"accept", b"text/event-stream")],
+        "server": ("localhost", 8000),
+        "client": ("127.0.0.1", port),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of /api/events in one ASGI worker: hold many event streams open, "
+        "publish seat changes from a writer thread and time their fan-out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", nargs="+", type=int, default=[100, 1000, 5000])
+        parser.add_argument("--routes", type=int, default=200, help="Routes the events are spread over.")
+        parser.add_argument("--routes-per-connection", type=int, default=5)
+        parser.add_argument("--events", type=int, default=2000, help="Seat events published per run.")
+        parser.add_argument("--rate", type=float, default=0,
+                            help="Events published per second; 0 publishes them all at once.")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        application = get_asgi_application()
+        results = [asyncio.run(self._run(application, count, options)) for count in options["connections"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['connections']:>6} connections  open={row['open_s']:.2f}s  "
+                f"{row['rss_kb_per_connection']:.1f} KB/conn  delivered={row['delivered']}/{row['expected']}  "
+                f"{row['deliveries_per_s']:>9.0f} msg/s  p50={row['latency']['median_ms']:.2f}ms "
+                f"p99={row['latency']['p99_ms']:.2f}ms  resyncs={row['resyncs']}"
+            )
+
+    async def _run(self, application, count, options):
+        rng = benchmarks.make_rng()
+        route_ids = range(1, options["routes"] + 1)
+        subscriptions = [rng.sample(route_ids, options["routes_per_connection"])
+                         for _ in range(count)]
+        subscribers = {route_id: 0 for route_id in route_ids}
+        for routes in subscriptions:
+            for route_id in routes:
+                subscribers[route_id] += 1
+
+        closing = asyncio.Event()
+        latencies = []
+        resyncs = 0
+        statuses = {}
+
+        async def connection(routes, port):
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await closing.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                nonlocal resyncs
+                if message["type"] == "http.response.start":
+                    statuses[message["status"]] = statuses.get(message["status"], 0) + 1
+                    return
+                frame = message.get("body", b"")
+                if frame.startswith(b"event: seats"):
+                    data = json.loads(frame.split(b"data: ", 1)[1])
+                    latencies.append((time.perf_counter() - data["sentAt"]) * 1000)
+                elif frame.startswith(b"event: resync"):
+                    resyncs += 1
+
+            await application(_scope(routes, port), receive, send)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(connection(routes, 10000 + i)) for i, routes in enumerate(subscriptions)]
+        while events.broker().connections() < count:
+            await asyncio.sleep(0.01)
+        open_s = time.perf_counter() - start
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+        published = [rng.choice(route_ids) for _ in range(options["events"])]
+        expected = sum(subscribers[route_id] for route_id in published)
+
+        def publish():
+            # Where book_seats' on_commit hooks would publish from: a worker thread
+            for i, route_id in enumerate(published):
+                if options["rate"]:
+                    time.sleep(max(0, start + i / options["rate"] - time.perf_counter()))
+                events.broker().publish(events.route_channel(route_id), "seats", {
+                    "routeId": route_id,
+                    "changes": [{"date": "2030-01-01", "delta": -1}],
+                    "sentAt": time.perf_counter(),
+                })
+
+        start = time.perf_counter()
+        await asyncio.to_thread(publish)
+        last_count, idle_since = -1, time.perf_counter()
+        while len(latencies) + resyncs < expected and time.perf_counter() - idle_since < 2:
+            if len(latencies) != last_count:
+                last_count, idle_since = len(latencies), time.perf_counter()
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - start
+
+        closing.set()
+        await asyncio.gather(*tasks)
+        return {
+            "connections": count,
+            "statuses": statuses,
+            "open_s": round(open_s, 3),
+            "rss_kb_per_connection": round(rss_kb / count, 2),
+            "published": len(published),
+            "rate": options["rate"] or None,
+            "expected": expected,
+            "delivered": len(latencies),
+            "resyncs": resyncs,
+            "deliveries_per_s": round(len(latencies) / elapsed, 1),
+            "latency": benchmarks.summarize(latencies),
+            "still_subscribed": events.broker().connections(),
+        }
@@ -0,0 +1,97 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from galli_connect_app import benchmarks, geo
+from galli_connect_app.models import DriverRoute, RoutePoint
+
+
+def brute_force(pickup, radius_km):
+    """Haversine over every route origin, the way a query without the index must."""
+    matches = []
+    for route_id, lat, lng in DriverRoute.objects.values_list("id", "from_lat", "from_lng"):
+        distance = geo.haversine_km(*pickup, lat, lng)
+        if distance <= radius_km:
+            matches.append((distance, route_id))
+    return sorted(matches)
+
+
+def nearby_trip(trip, radius_km):
+    pickup, dropoff = trip
+    return geo.nearby_routes(pickup, radius_km, dropoff, limit=20)
+
+
+class Command(BaseCommand):
+    help = "Compare brute-force haversine against the geohash index for radius queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000])
+        parser.add_argument("--radius", nargs="+", type=float, default=[0.5, 1.0, 3.0])
+        parser.add_argument("--queries", type=int, default=20, help="Random pickup points per size.")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        rng = benchmarks.make_rng()
+        results = []
+        with benchmarks.isolated_database():
+            driver = User.objects.create_user(username="bench_driver", password="x")
+            created = 0
+            for size in sorted(options["sizes"]):
+                created += self._grow(driver, rng, size - created)
+                pickups = [benchmarks.synthetic_point(rng) for _ in range(options["queries"])]
+                trips = [(pickup, benchmarks.synthetic_point(rng)) for pickup in pickups]
+                for radius in options["radius"]:
+                    queries = iter(pickups)
+                    old = benchmarks.timed(lambda: brute_force(next(queries), radius), len(pickups))
+                    queries = iter(pickups)
+                    new = benchmarks.timed(
+                        lambda: geo.nearby_routes(next(queries), radius, limit=20), len(pickups))
+                    queries = iter(trips)
+                    both = benchmarks.timed(lambda: nearby_trip(next(queries), radius), len(trips))
+                    results.append({
+                        "routes": size,
+                        "radius_km": radius,
+                        "matches": len(geo.points_within(*pickups[0], radius, [RoutePoint.ORIGIN])),
+                        "brute_force": benchmarks.summarize(old),
+                        "indexed": benchmarks.summarize(new),
+                        "indexed_with_dropoff": benchmarks.summarize(both),
+                    })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['routes']:>8} routes  radius={row['radius_km']:<4} matches={row['matches']:<6} "
+                f"brute={row['brute_force']['median_ms']:>8.2f}ms  "
+                f"indexed={row['indexed']['median_ms']:>6.2f}ms (p95 {row['indexed']['p95_ms']:.2f})  "
+                f"+dropoff={row['indexed_with_dropoff']['median_ms']:>6.2f}ms"
+            )
+
+    def _grow(self, driver, rng, count):
+        batch_size = 10_000
+        for start in range(0, max(count, 0), batch_size):
+            routes = []
+            waypoints = []
+            for _ in range(min(batch_size, count - start)):
+                (from_lat, from_lng), (to_lat, to_lng) = (
+                    benchmarks.synthetic_point(rng), benchmarks.synthetic_point(rng))
+                routes.append(DriverRoute(
+                    driver=driver,
+                    from_location=benchmarks.synthetic_location(rng),
+                    to_location=benchmarks.synthetic_location(rng),
+                    departure_time="08:30",
+                    departure_minutes=8 * 60 + 30,
+                    cost_per_seat=50,
+                    total_seats=4,
+                    from_lat=from_lat, from_lng=from_lng, to_lat=to_lat, to_lng=to_lng,
+                ))
+                waypoints.append([benchmarks.synthetic_point(rng) for _ in range(rng.randint(0, 2))])
+            # bulk_create skips post_save, so index the batch explicitly
+            routes = DriverRoute.objects.bulk_create(routes)
+            RoutePoint.objects.bulk_create(
+                [point for route, points in zip(routes, waypoints) for point in geo.route_points(route, points)],
+                batch_size=5000,
+            )
+        return max(count, 0)
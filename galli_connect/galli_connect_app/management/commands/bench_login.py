@@ -0,0 +1,67 @@
+import json
+import time
+from importlib.util import find_spec
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from galli_connect_app import benchmarks
+from galli_connect_app.models import UserProfile
+
+HASHERS = {
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+    "argon2-django": "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "argon2-tuned": "galli_connect_app.hashers.TunedArgon2PasswordHasher",
+}
+
+
+class Command(BaseCommand):
+    help = "Logins per second on one core through /api/login, per password hasher."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=50)
+        parser.add_argument("--hashers", nargs="+", choices=sorted(HASHERS), default=list(HASHERS))
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmarks.isolated_database():
+            for name in options["hashers"]:
+                if name.startswith("argon2") and not find_spec("argon2"):
+                    self.stderr.write(f"skipping {name}: argon2-cffi is not installed")
+                    continue
+                with override_settings(PASSWORD_HASHERS=[HASHERS[name]]):
+                    results.append(self._run(name, options["logins"]))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['hasher']:<14} {row['logins_per_s']:>8.1f} logins/s  "
+                f"p50={row['latency']['median_ms']:.1f}ms  p99={row['latency']['p99_ms']:.1f}ms"
+            )
+
+    def _run(self, name, logins):
+        email = f"{name}@example.com"
+        user = User.objects.create_user(username=f"{email}_PASSENGER", email=email, password="correct horse")
+        UserProfile.objects.create(user=user, role="PASSENGER")
+        body = json.dumps({"email": email, "password": "correct horse", "role": "PASSENGER"})
+
+        samples = []
+        start = time.perf_counter()
+        for _ in range(logins):
+            client = Client()
+            begin = time.perf_counter()
+            response = client.post("/api/login", body, content_type="application/json")
+            samples.append((time.perf_counter() - begin) * 1000)
+            assert response.status_code == 200, response.content
+        elapsed = time.perf_counter() - start
+        return {
+            "hasher": name,
+            "logins": logins,
+            "logins_per_s": round(logins / elapsed, 1),
+            "latency": benchmarks.summarize(samples),
+        }
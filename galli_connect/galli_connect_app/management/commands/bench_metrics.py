@@ -0,0 +1,54 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from galli_connect_app import benchmarks, metrics
+from galli_connect_app.models import DriverRoute
+from galli_connect_app.search import index_routes
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request cost of RequestMetricsMiddleware on the route search endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--routes", type=int, default=200)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmarks.isolated_database():
+            self._seed(options["routes"])
+            body = json.dumps({"from": "koramangala", "to": "electronic", "limit": 20})
+            modes = [("disabled", {"REQUEST_METRICS": False}),
+                     ("enabled", {"REQUEST_METRICS": True}),
+                     ("enabled+slow_log", {"REQUEST_METRICS": True, "SLOW_REQUEST_MS": 60_000})]
+            for mode, overrides in modes:
+                with override_settings(**overrides):
+                    client = Client()  # loads the middleware chain under these settings
+                    call = lambda: client.post("/api/routes/search", body, content_type="application/json")
+                    benchmarks.timed(call, 50)  # warm up
+                    samples = benchmarks.timed(call, options["requests"])
+                results.append({"mode": mode, "latency": benchmarks.summarize(samples),
+                                "mean_ms": round(sum(samples) / len(samples), 4)})
+            metrics.reset()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:<17} mean={row['mean_ms']:>7.3f}ms  median={row['latency']['median_ms']:>7.3f}ms  "
+                f"p99={row['latency']['p99_ms']:>7.3f}ms"
+            )
+
+    def _seed(self, count):
+        driver = User.objects.create_user(username="bench_driver", password="x")
+        routes = DriverRoute.objects.bulk_create([
+            DriverRoute(driver=driver, from_location=f"Koramangala Block {i}", to_location="Electronic City",
+                        departure_time="08:00", departure_minutes=480, cost_per_seat=40, total_seats=4)
+            for i in range(count)
+        ])
+        index_routes(routes)
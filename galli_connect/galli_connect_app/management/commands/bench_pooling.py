@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from galli_connect_app import benchmarks
+
+# Residential pickups spread over the city, dropoffs around a few office hubs
+HUBS = 6
+JITTER_KM = 1.0
+
+
+def synthetic_requests(rng, count, hubs):
+    jitter = JITTER_KM / 111.0
+    requests = []
+    for request_id in range(1, count + 1):
+        from_lat, from_lng = benchmarks.synthetic_point(rng)
+        hub_lat, hub_lng = rng.choice(hubs)
+        earliest = rng.randrange(7 * 60, 10 * 60, 5)
+        requests.append({
+            "id": request_id,
+            "from_location": benchmarks.synthetic_location(rng),
+            "to_location": f"Hub {hubs.index((hub_lat, hub_lng)) + 1}",
+            "from_lat": from_lat,
+            "from_lng": from_lng,
+            "to_lat": rng.gauss(hub_lat, jitter),
+            "to_lng": rng.gauss(hub_lng, jitter),
+            "earliest_minutes": earliest,
+            "latest_minutes": earliest + rng.choice([15, 30, 45]),
+            "seats": rng.choice([1, 1, 1, 2]),
+        })
+    return requests
+
+
+class Command(BaseCommand):
+    help = "Time the trip-request pooling solver on synthetic morning demand."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 5_000, 10_000])
+        parser.add_argument("--capacity", type=int, default=4)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            from galli_connect_app import pooling
+        except ImportError:
+            raise CommandError("Pooling needs NumPy installed")
+
+        rng = benchmarks.make_rng()
+        hubs = [benchmarks.synthetic_point(rng) for _ in range(HUBS)]
+        results = []
+        for size in options["sizes"]:
+            requests = synthetic_requests(rng, size, hubs)
+            pools, unpooled = pooling.propose(requests, options["capacity"])
+            samples = benchmarks.timed(lambda: pooling.propose(requests, options["capacity"]), options["repeat"])
+            results.append({
+                "requests": size,
+                "pools": len(pools),
+                "pooled_share": round(1 - len(unpooled) / size, 3),
+                "mean_pool_seats": round(sum(pool.seats for pool in pools) / len(pools), 2) if pools else 0,
+                "solve": benchmarks.summarize(samples),
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['requests']:>7} requests  pools={row['pools']:<6} pooled={row['pooled_share']:.1%}  "
+                f"seats/pool={row['mean_pool_seats']:<5} "
+                f"solve={row['solve']['median_ms']:>8.2f}ms (max {row['solve']['max_ms']:.2f})"
+            )
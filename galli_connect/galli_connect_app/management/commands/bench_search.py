@@ -0,0 +1,78 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from galli_connect_app import benchmarks
+from galli_connect_app.models import DriverRoute
+from galli_connect_app.search import index_routes, matching_routes
+
+QUERIES = [
+    ("Powai Tech Park 42", "Whitefield Gate 7"),   # exact locations
+    ("koramangala", "electronic"),                 # single words
+    ("tech park", "metro"),                        # broad, multi-word
+    ("ba", "ma"),                                  # first keystrokes
+    ("nowhere", "gurgaon"),                        # no match
+]
+
+
+class Command(BaseCommand):
+    help = "Compare icontains search against the location token index on synthetic routes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        rng = benchmarks.make_rng()
+        results = []
+        with benchmarks.isolated_database():
+            driver = User.objects.create_user(username="bench_driver", password="x")
+            created = 0
+            for size in sorted(options["sizes"]):
+                created += self._grow(driver, rng, size - created)
+                for from_q, to_q in QUERIES:
+                    old = benchmarks.timed(lambda: list(
+                        DriverRoute.objects.filter(
+                            from_location__icontains=from_q, to_location__icontains=to_q,
+                        ).values_list("id", flat=True)
+                    ), options["repeat"])
+                    new = benchmarks.timed(lambda: list(
+                        matching_routes(from_q, to_q).values_list("id", flat=True)
+                    ), options["repeat"])
+                    results.append({
+                        "routes": size,
+                        "query": f"{from_q} -> {to_q}",
+                        "matches": matching_routes(from_q, to_q).count(),
+                        "icontains": benchmarks.summarize(old),
+                        "indexed": benchmarks.summarize(new),
+                    })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['routes']:>9} routes  {row['query']:<42} matches={row['matches']:<7} "
+                f"icontains={row['icontains']['median_ms']:>9.2f}ms  "
+                f"indexed={row['indexed']['median_ms']:>8.2f}ms"
+            )
+
+    def _grow(self, driver, rng, count):
+        batch_size = 10_000
+        for start in range(0, max(count, 0), batch_size):
+            routes = []
+            for _ in range(min(batch_size, count - start)):
+                routes.append(DriverRoute(
+                    driver=driver,
+                    from_location=benchmarks.synthetic_location(rng),
+                    to_location=benchmarks.synthetic_location(rng),
+                    departure_time="08:30",
+                    departure_minutes=8 * 60 + 30,
+                    cost_per_seat=50,
+                    total_seats=4,
+                ))
+            # bulk_create skips post_save, so index the batch explicitly
+            index_routes(DriverRoute.objects.bulk_create(routes))
+        return max(count, 0)
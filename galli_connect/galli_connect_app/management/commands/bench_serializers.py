@@ -0,0 +1,93 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from galli_connect_app import benchmarks, serializers
+from galli_connect_app.serializers import orjson
+
+
+def synthetic_rows(rng, count):
+    """``values(*serializers.ROUTE_FIELDS)`` rows with a fortnight of active days each."""
+    rows = []
+    for route_id in range(1, count + 1):
+        lat, lng = benchmarks.synthetic_point(rng)
+        rows.append({
+            "id": route_id,
+            "driver_id": rng.randint(1, 500),
+            "driver__username": f"driver{route_id}@example.com_DRIVER",
+            "from_location": benchmarks.synthetic_location(rng),
+            "to_location": benchmarks.synthetic_location(rng),
+            "departure_time": "08:30",
+            "departure_minutes": 510,
+            "cost_per_seat": Decimal(rng.randint(20, 200)),
+            "total_seats": 4,
+            "weekday_mask": 0b0011111,
+            "start_date": date(2030, 1, 1),
+            "end_date": None,
+            "from_lat": lat, "from_lng": lng, "to_lat": None, "to_lng": None,
+        })
+    active_days = [
+        {"date": f"2030-01-{day:02d}", "day": "Mon", "availableSeats": 3} for day in range(1, 15)
+    ]
+    return rows, active_days
+
+
+def legacy_route(row, active_days):
+    """The hand-built dict of the views before serializers.py, for comparison."""
+    return {
+        "id": row["id"],
+        "from": row["from_location"],
+        "to": row["to_location"],
+        "departureTime": row["departure_time"],
+        "costPerSeat": float(row["cost_per_seat"]),
+        "activeDays": active_days,
+        "totalSeats": row["total_seats"],
+        "driverId": row["driver_id"],
+        "driverName": row["driver__username"],
+    }
+
+
+class Command(BaseCommand):
+    help = "Routes serialized and JSON-encoded per second, per JSON backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--routes", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        backends = ["json"] + (["orjson"] if orjson else [])
+        if options["json"] and not orjson:
+            self.stderr.write("orjson is not installed; only the standard library is measured.")
+        rows, active_days = synthetic_rows(benchmarks.make_rng(), options["routes"])
+        if not rows:
+            raise CommandError("--routes must be positive")
+
+        cases = [("legacy dicts + json.dumps", lambda: json.dumps(
+            [legacy_route(row, active_days) for row in rows], cls=serializers.DjangoJSONEncoder))]
+        cases.append(("serializers.route only", lambda: [serializers.route(row, active_days) for row in rows]))
+        for backend in backends:
+            cases.append((f"dumps ({backend})", lambda backend=backend: serializers.dumps(
+                [serializers.route(row, active_days) for row in rows], backend)))
+
+        results = []
+        for name, func in cases:
+            samples = benchmarks.timed(func, options["repeat"])
+            summary = benchmarks.summarize(samples)
+            results.append({
+                "case": name,
+                "routes": len(rows),
+                "latency": summary,
+                "routes_per_s": round(len(rows) / (summary["median_ms"] / 1000)),
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['case']:<28} {row['latency']['median_ms']:>8.2f}ms per {row['routes']} routes  "
+                f"{row['routes_per_s']:>10,} routes/s"
+            )
@@ -0,0 +1,138 @@
+import json
+import logging
+import multiprocessing
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from galli_connect_app import benchmarks
+from galli_connect_app.inventory import parse_schedule, sync_inventory
+from galli_connect_app.models import DriverRoute
+
+# OPTIONS of each mode; None is what settings.py configures
+MODES = {
+    "rollback": {},  # SQLite's defaults: DELETE journal, FULL sync, deferred transactions
+    "wal": None,
+    # WAL with deferred transactions: a write after a read in the same
+    # transaction fails at once if another writer got in first
+    "wal-deferred": {"init_command": "PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL", "timeout": 10},
+}
+
+
+def _send_all(share):
+    """Worker process: send a share of the requests as one logged-in passenger."""
+    passenger_id, tasks = share
+    client = Client()
+    client.force_login(User.objects.get(id=passenger_id))
+    results = []
+    for kind, path, payload in tasks:
+        start = time.perf_counter()
+        response = client.post(path, json.dumps(payload), content_type="application/json")
+        results.append((kind, response.status_code, (time.perf_counter() - start) * 1000))
+    connections.close_all()
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed search/booking load from concurrent worker processes against an "
+        "on-disk SQLite database, in the rollback-journal and WAL configurations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["rollback", "wal"])
+        parser.add_argument("--reads", type=int, default=2000, help="Search requests per mode.")
+        parser.add_argument("--writes", type=int, default=400, help="Booking requests per mode.")
+        parser.add_argument("--workers", type=int, default=8, help="Worker processes, like a prefork server's.")
+        parser.add_argument("--routes", type=int, default=300)
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark compares SQLite journal modes")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Worker processes are forked; this platform cannot fork")
+        # Failed bookings are counted in the report; keep them out of the output
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        # settings.DATABASES itself: worker processes open connections from it
+        db_options = connection.settings_dict["OPTIONS"]
+        configured = dict(db_options)
+        results = []
+        try:
+            for mode in options["modes"]:
+                db_options.clear()
+                db_options.update(configured if MODES[mode] is None else MODES[mode])
+                with benchmarks.isolated_database(on_disk=True):
+                    results.append({"mode": mode, **self._run(options)})
+        finally:
+            db_options.clear()
+            db_options.update(configured)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:>12}  {row['requests_per_s']:>7.1f} req/s  "
+                f"search p50={row['search']['median_ms']:.2f}ms p99={row['search']['p99_ms']:.2f}ms  "
+                f"booking p50={row['booking']['median_ms']:.2f}ms p99={row['booking']['p99_ms']:.2f}ms  "
+                f"failed={row['failed']}"
+            )
+
+    def _run(self, options):
+        rng = benchmarks.make_rng()
+        driver = User.objects.create_user(username="bench_driver", password="x")
+        dates = [date.today() + timedelta(days=i) for i in range(7)]
+        # Enough seats that no booking sells out: failures are lock errors only
+        seats = options["writes"] * 3
+        routes = []
+        for _ in range(options["routes"]):
+            route = DriverRoute.objects.create(
+                driver=driver, from_location=benchmarks.synthetic_location(rng),
+                to_location=benchmarks.synthetic_location(rng),
+                departure_time=f"{rng.randint(6, 10):02d}:{rng.choice([0, 15, 30, 45]):02d}",
+                cost_per_seat=rng.randint(20, 200), total_seats=seats,
+            )
+            sync_inventory(route, parse_schedule([{"date": d.isoformat(), "availableSeats": seats} for d in dates]))
+            routes.append(route)
+
+        passengers = [
+            User.objects.create_user(username=f"bench_passenger_{i}", password="x").id
+            for i in range(options["workers"])
+        ]
+        tasks = [
+            ("search", "/api/routes/search", {
+                "from": rng.choice(benchmarks.AREAS), "to": rng.choice(benchmarks.AREAS),
+                "date": rng.choice(dates).isoformat(), "limit": 50,
+            })
+            for _ in range(options["reads"])
+        ] + [
+            ("booking", "/api/book-seats", {
+                "driverId": driver.id, "routeId": route.id, "seatsToBook": 1,
+                "dates": [d.isoformat() for d in rng.sample(dates, rng.randint(1, 3))],
+            })
+            for route in rng.choices(routes, k=options["writes"])
+        ]
+        rng.shuffle(tasks)
+        shares = [(passenger, tasks[i::len(passengers)]) for i, passenger in enumerate(passengers)]
+
+        # Children inherit the settings (and the test database name) but must open their own connections
+        connections.close_all()
+        start = time.perf_counter()
+        with multiprocessing.get_context("fork").Pool(len(shares)) as pool:
+            results = [result for share in pool.map(_send_all, shares) for result in share]
+        elapsed = time.perf_counter() - start
+
+        return {
+            "requests": len(results),
+            "workers": options["workers"],
+            "elapsed_s": round(elapsed, 3),
+            "requests_per_s": round(len(results) / elapsed, 1),
+            "search": benchmarks.summarize([ms for kind, _, ms in results if kind == "search"]),
+            "booking": benchmarks.summarize([ms for kind, _, ms in results if kind == "booking"]),
+            "failed": sum(status >= 500 for _, status, _ in results),
+        }
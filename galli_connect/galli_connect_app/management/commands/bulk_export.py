@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from galli_connect_app import bulk_io
+from galli_connect_app.models import DriverRoute, PassengerBooking
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream routes or bookings to a CSV or NDJSON file in the columns bulk_import reads. "
+        "Writes stdout when no path (or '-') is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["bookings", "routes"])
+        parser.add_argument("path", nargs="?", default="-")
+        parser.add_argument("--format", choices=bulk_io.FORMATS, help="Default: from the file extension, else ndjson.")
+        parser.add_argument("--driver", type=int, help="Only this driver's routes (or bookings on them).")
+        parser.add_argument("--chunk-size", type=int, default=bulk_io.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or bulk_io.format_for(options["path"])
+        if options["kind"] == "routes":
+            rows = DriverRoute.objects.all()
+            if options["driver"]:
+                rows = rows.filter(driver_id=options["driver"])
+            lines = bulk_io.export_routes(rows, fmt, options["chunk_size"])
+        else:
+            rows = PassengerBooking.objects.all()
+            if options["driver"]:
+                rows = rows.filter(route__driver_id=options["driver"])
+            lines = bulk_io.export_bookings(rows, fmt, options["chunk_size"])
+
+        if options["path"] == "-":
+            sys.stdout.writelines(lines)
+            return
+        try:
+            with open(options["path"], "w", encoding="utf-8", newline="") as file:
+                file.writelines(lines)
+        except OSError as e:
+            raise CommandError(e)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['path']}."))
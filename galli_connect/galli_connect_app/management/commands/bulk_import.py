@@ -0,0 +1,50 @@
+import codecs
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from galli_connect_app import bulk_io
+
+IMPORTERS = {"routes": bulk_io.import_routes, "bookings": bulk_io.import_bookings, "users": bulk_io.import_users}
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream routes, bookings or user accounts from a CSV or NDJSON file into the database in chunks, "
+        "reporting rows that fail validation by line number. Use '-' to read stdin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=bulk_io.FORMATS, help="Default: from the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=bulk_io.CHUNK_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Validate without writing anything.")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or bulk_io.format_for(options["path"])
+        errors = 0
+
+        def on_error(error):
+            nonlocal errors
+            errors += 1
+            self.stderr.write(f"line {error.line}: {error.message}")
+
+        if options["path"] == "-":
+            lines = codecs.iterdecode(sys.stdin.buffer, "utf-8-sig")
+            created = self._import(options, bulk_io.read_rows(lines, fmt), on_error)
+        else:
+            try:
+                file = open(options["path"], encoding="utf-8-sig", newline="")
+            except OSError as e:
+                raise CommandError(e)
+            with file:
+                created = self._import(options, bulk_io.read_rows(file, fmt), on_error)
+
+        verb = "Validated" if options["dry_run"] else "Imported"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {created} {options['kind']}; {errors} rows rejected."))
+
+    def _import(self, options, rows, on_error):
+        return IMPORTERS[options["kind"]](
+            rows, chunk_size=options["chunk_size"], dry_run=options["dry_run"], on_error=on_error,
+        )
@@ -0,0 +1,222 @@
+import json
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from galli_connect_app import api_cache, benchmarks, demand, holds, inventory
+from galli_connect_app.models import DriverRoute, UserProfile
+
+# Statements per request for the scenario below, counted like assertNumQueries
+# (tests.py holds every view to exactly its budget): the session/user lookups
+# of authenticated requests and the BEGIN and COMMIT of transactions included.
+# book_seats books 2 dates and book_recurring 4; each date costs one UPDATE,
+# plus one INSERT that creates the rows of dates served by the weekly rule.
+BUDGETS = {
+    "signup": 4,
+    "login": 9,
+    "add_driver_route": 10,
+    "get_driver_routes": 3,
+    "update_driver_route": 12,
+    "search_routes": 2,
+    "search_routes_by_date": 2,
+    "nearby_routes": 4,
+    "book_seats": 10,
+    "book_recurring": 11,
+    "place_seat_hold": 9,
+    "confirm_seat_hold": 8,
+    "get_route_bookings": 2,
+    "get_route_bookings_range": 3,
+    "get_route_bookings_summary": 3,
+    "delete_driver_route": 10,
+    "demand_hotspots": 1,
+    "create_trip_request": 2,
+    "pooling_suggestions": 2,
+}
+
+ROUTES = 20
+DATES = 10
+
+Scenario = namedtuple("Scenario", ["driver", "passenger", "route", "hold_id"])
+
+
+@contextmanager
+def capture_statements():
+    """Record (sql, params) for every statement, unlike CaptureQueriesContext."""
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield statements
+
+
+def explain(sql, params):
+    if connection.vendor == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [" ".join(str(col) for col in row[3:] if col is not None) or str(row)
+                for row in cursor.fetchall()]
+
+
+def explain_statements(statements):
+    """``{"sql", "plan"}`` for each SELECT, UPDATE and DELETE captured by ``capture_statements``."""
+    return [
+        {"sql": sql, "plan": explain(sql, params)} for sql, params in statements
+        if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE"))
+    ]
+
+
+def full_scans(plan):
+    """SQLite plan lines that walk a whole table without any index."""
+    return [line for line in plan if line.startswith("SCAN ") and " USING " not in line]
+
+
+def make_user(email, role):
+    user = User.objects.create_user(username=f"{email}_{role}", email=email, password="pw")
+    UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def seed():
+    """Routes with bookings, an override and an exception each, and one seat hold."""
+    driver = make_user("driver@example.com", "DRIVER")
+    passenger = make_user("rider@example.com", "PASSENGER")
+    for i in range(ROUTES):
+        route = DriverRoute.objects.create(
+            driver=driver, from_location=f"Koramangala Block {i}", to_location="Electronic City",
+            departure_time="08:00", cost_per_seat=40, total_seats=4,
+            weekday_mask=0b1111111, start_date=date(2030, 1, 1), end_date=date(2030, 1, DATES),
+            from_lat=12.9352 + i / 1000, from_lng=77.6245, to_lat=12.8452, to_lng=77.6602,
+        )
+        inventory.sync_inventory(route, inventory.parse_schedule(
+            [{"date": "2030-02-01", "availableSeats": 2}], {"exceptions": ["2030-01-04"]}))
+        inventory.book(route, passenger, [date(2030, 1, d) for d in range(1, 4)], 1)
+    route = DriverRoute.objects.filter(driver=driver).first()
+    hold_id = holds.place(route, passenger, [date(2030, 1, 9)], 1)[0].hold_id
+    return Scenario(driver, passenger, route, hold_id)
+
+
+def api_calls(scenario):
+    """``(view, client, method, path, body)`` for every API view, in an order where each succeeds."""
+    driver, passenger, route, hold_id = scenario
+    client = Client()
+    rider = Client()
+    rider.force_login(passenger)
+    schedule = {"weekdays": inventory.WEEKDAYS, "startDate": "2030-01-01", "endDate": f"2030-01-{DATES:02d}"}
+    base = f"/api/driver/{driver.id}/routes/{route.id}"
+    return [
+        ("signup", client, "post", "/api/signup",
+         {"name": "New", "email": "new@example.com", "password": "pw", "role": "PASSENGER"}),
+        ("login", client, "post", "/api/login",
+         {"email": "driver@example.com", "password": "pw", "role": "DRIVER"}),
+        ("add_driver_route", client, "post", "/api/add-driver-route/",
+         {"driverId": driver.id, "from": "Whitefield", "to": "Indiranagar", "departureTime": "09:00",
+          "costPerSeat": 30, "totalSeats": 3, "schedule": schedule,
+          "fromCoords": {"lat": 12.9698, "lng": 77.7500}, "toCoords": {"lat": 12.9784, "lng": 77.6408},
+          "waypoints": [{"lat": 12.9569, "lng": 77.7011}]}),
+        ("get_driver_routes", client, "get", f"/api/get-driver-routes/{driver.id}/", None),
+        ("update_driver_route", client, "put", f"/api/update-driver-route/{driver.id}/{route.id}/",
+         {"departure_time": "08:15", "schedule": {**schedule, "exceptions": ["2030-01-08"]}}),
+        ("search_routes", client, "post", "/api/routes/search",
+         {"from": "koramangala", "to": "electronic"}),
+        ("search_routes_by_date", client, "post", "/api/routes/search",
+         {"from": "koramangala", "to": "electronic", "startDate": "2030-01-03",
+          "endDate": "2030-01-05", "seats": 2}),
+        ("nearby_routes", client, "post", "/api/routes/nearby",
+         {"pickup": {"lat": 12.9400, "lng": 77.6250}, "dropoff": {"lat": 12.8450, "lng": 77.6600},
+          "radiusKm": 1}),
+        ("book_seats", rider, "post", "/api/book-seats",
+         {"driverId": driver.id, "routeId": route.id, "dates": ["2030-01-05", "2030-01-06"],
+          "seatsToBook": 1}),
+        ("book_recurring", rider, "post", "/api/book-recurring",
+         {"driverId": driver.id, "routeId": route.id, "startDate": "2030-01-07",
+          "endDate": "2030-01-10", "seatsToBook": 1}),
+        ("place_seat_hold", rider, "post", "/api/seat-holds",
+         {"driverId": driver.id, "routeId": route.id, "dates": ["2030-01-05", "2030-01-06"],
+          "seatsToBook": 1}),
+        ("confirm_seat_hold", rider, "post", f"/api/seat-holds/{hold_id}/confirm", None),
+        ("get_route_bookings", client, "get", f"{base}/bookings", None),
+        ("get_route_bookings_range", client, "get", f"{base}/bookings?from=2030-01-02&limit=3", None),
+        ("get_route_bookings_summary", client, "get",
+         f"{base}/bookings?summary=1&from=2030-01-01&to=2030-01-31", None),
+        ("demand_hotspots", client, "get", "/api/demand-hotspots", None),
+        ("create_trip_request", rider, "post", "/api/trip-requests",
+         {"from": "Koramangala", "to": "Electronic City", "fromCoords": {"lat": 12.9352, "lng": 77.6245},
+          "toCoords": {"lat": 12.8452, "lng": 77.6602}, "date": "2030-01-07", "windowStart": "08:00"}),
+        ("pooling_suggestions", client, "post", "/api/pooling/suggestions",
+         {"date": "2030-01-07", "routeId": route.id}),
+        ("delete_driver_route", client, "delete", f"/api/delete-driver-route/{driver.id}/{route.id}/", None),
+    ]
+
+
+def reset_caches():
+    """Clear the response cache and flush buffered demand counts, so the next call runs cold."""
+    api_cache.get_cache().clear()
+    demand.flush()
+
+
+def send(http, method, path, body):
+    kwargs = {"content_type": "application/json"}
+    if body is not None:
+        kwargs["data"] = json.dumps(body)
+    return getattr(http, method)(path, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Call every API view on seeded data and fail when one issues more "
+        "queries than its budget or plans a full table scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--explain", action="store_true", help="Print the plan of every query.")
+
+    def handle(self, *args, **options):
+        with benchmarks.isolated_database():
+            report = self._run(options["explain"])
+
+        failures = [row for row in report if row["over_budget"] or row["full_scans"]]
+        for row in report:
+            status = "FAIL" if row in failures else "ok"
+            self.stdout.write(f"{status:<5} {row['view']:<28} {row['queries']:>3} / {row['budget']} queries")
+            for line in row["full_scans"]:
+                self.stdout.write(f"        full scan: {line}")
+            for statement in row.get("plans", []):
+                self.stdout.write(f"        {statement['sql']}")
+                for line in statement["plan"]:
+                    self.stdout.write(f"            {line}")
+        if failures:
+            raise CommandError(f"{len(failures)} view(s) over budget or scanning tables.")
+
+    def _run(self, with_plans):
+        report = []
+        for view, http, method, path, body in api_calls(seed()):
+            reset_caches()
+            with CaptureQueriesContext(connection) as queries, capture_statements() as statements:
+                response = send(http, method, path, body)
+            if response.status_code >= 400:
+                raise CommandError(f"{view} returned {response.status_code}: {response.content[:200]!r}")
+
+            plans = explain_statements(statements)
+            row = {
+                "view": view,
+                "queries": len(queries),
+                "budget": BUDGETS[view],
+                "over_budget": len(queries) > BUDGETS[view],
+                "full_scans": [line for statement in plans for line in full_scans(statement["plan"])],
+            }
+            if with_plans:
+                row["plans"] = plans
+            report.append(row)
+        return report
@@ -0,0 +1,116 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from galli_connect_app import benchmarks, loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Scripted passenger (signup, login, search, book) and driver dashboard sessions against "
+        "synthetic data, in-process or against a running server, with per-step throughput and "
+        "latency percentiles as JSON."
+    )
+
+    def add_arguments(self, parser):
+        scale = loadtest.Scale()
+        parser.add_argument("--scenarios", nargs="*", choices=sorted(loadtest.SCENARIOS),
+                            default=sorted(loadtest.SCENARIOS))
+        parser.add_argument("--sessions", type=int, default=20, help="Virtual users per scenario.")
+        parser.add_argument("--iterations", type=int, default=5, help="Searches or dashboard polls per session.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Sessions running at once (threads).")
+        parser.add_argument("--drivers", type=int, default=scale.drivers)
+        parser.add_argument("--routes-per-driver", type=int, default=scale.routes_per_driver)
+        parser.add_argument("--passengers", type=int, default=scale.passengers)
+        parser.add_argument("--bookings", type=int, default=scale.bookings,
+                            help="Seeded trips, each booking 1-3 dates.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server sharing this database, e.g. http://127.0.0.1:8000. "
+                 "Default: the test client against a throwaway database.",
+        )
+        parser.add_argument("--populate", action="store_true",
+                            help="With --url: seed synthetic data into the configured database first.")
+        parser.add_argument("--label", default="", help="Stored in the report, e.g. a release tag.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--compare", help="Earlier JSON report; fail if a step's p95 regressed.")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth for --compare.")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        scale = loadtest.Scale(options["drivers"], options["routes_per_driver"], options["passengers"],
+                               options["bookings"])
+        if options["url"]:
+            seeded = self._populate(scale, options) if options["populate"] else None
+            results = self._run(loadtest.HttpTransport(options["url"]), seeded, options)
+        else:
+            # On disk: concurrent sessions wait on SQLite's lock like a deployment
+            with benchmarks.isolated_database(on_disk=True):
+                results = self._run(loadtest.ClientTransport(), self._populate(scale, options), options)
+        results["meta"].update(scale=scale._asdict())
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for scenario, row in results["scenarios"].items():
+                self.stdout.write(f"{scenario}: {row['requests_per_s']:.1f} req/s, {row['errors']} errors")
+                for step, stats in row["steps"].items():
+                    self.stdout.write(
+                        f"  {step:<16} {stats['requests']:>6}  p50={stats['median_ms']:.2f}ms "
+                        f"p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms  {stats['statuses']}"
+                    )
+        if options["compare"]:
+            self._compare(results, options)
+
+    def _populate(self, scale, options):
+        start = timezone.now()
+        counts = loadtest.populate(benchmarks.make_rng(options["seed"]), scale)
+        counts["seconds"] = round((timezone.now() - start).total_seconds(), 3)
+        return counts
+
+    def _run(self, transport, seeded, options):
+        dataset = loadtest.Dataset.load()
+        if not dataset.drivers:
+            raise CommandError("No seeded drivers in the database; run with --populate first")
+        scenarios = {}
+        for scenario in options["scenarios"]:
+            samples, elapsed = loadtest.run(scenario, transport, dataset, options["sessions"],
+                                            options["iterations"], options["concurrency"], options["seed"])
+            scenarios[scenario] = loadtest.report(samples, elapsed)
+        return {
+            "meta": {
+                "label": options["label"],
+                "target": transport.name,
+                "timestamp": timezone.now().isoformat(),
+                "seed": options["seed"],
+                "sessions": options["sessions"],
+                "iterations": options["iterations"],
+                "concurrency": options["concurrency"],
+                "seeded": seeded,
+                "database": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+            },
+            "scenarios": scenarios,
+        }
+
+    def _compare(self, results, options):
+        try:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['compare']}: {e}")
+        regressions = loadtest.compare(results, baseline, options["tolerance"])
+        for scenario, step, before, after in regressions:
+            self.stderr.write(f"{scenario}/{step}: p95 {before:.2f}ms -> {after:.2f}ms")
+        if regressions:
+            raise CommandError(f"{len(regressions)} steps regressed beyond {options['tolerance']:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"No step regressed beyond {options['tolerance']:.0%}"))
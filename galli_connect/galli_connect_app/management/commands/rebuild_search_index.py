@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from galli_connect_app.models import DriverRoute, RouteLocationToken
+from galli_connect_app.search import rebuild_index, reparse_departure_times
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-normalize every DriverRoute location, rebuild the location search index "
+        "and re-parse the departure times used to sort results."
+    )
+
+    def handle(self, *args, **options):
+        rebuild_index()
+        reparse_departure_times()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {DriverRoute.objects.count()} routes "
+            f"({RouteLocationToken.objects.count()} tokens)."
+        ))
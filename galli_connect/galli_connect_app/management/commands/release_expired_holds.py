@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from galli_connect_app import holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Put the seats of expired seat holds back on sale. Run it every minute or so, "
+        "e.g. from cron; new holds also release expired ones on the dates they want."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=holds.SWEEP_CHUNK,
+            help="Holds released per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        released = holds.release_expired(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired seat holds."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from galli_connect_app import demand
+
+
+class Command(BaseCommand):
+    help = (
+        "Rank pickup locations by recent searches and bookings into the table behind "
+        "/api/demand-hotspots. Run it periodically, e.g. every few minutes from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24, help="Window of counters to rank.")
+        parser.add_argument("--top", type=int, default=10, help="Number of hotspots to keep.")
+        parser.add_argument(
+            "--booking-weight", type=int, default=3,
+            help="How many searches one booked seat counts as.",
+        )
+        parser.add_argument(
+            "--keep-hours", type=int, default=7 * 24,
+            help="Delete counters older than this.",
+        )
+
+    def handle(self, *args, **options):
+        # Counts still buffered in this process (e.g. when run from a shell)
+        demand.flush()
+        hotspots = demand.rollup(options["hours"], options["top"], options["booking_weight"])
+        pruned = demand.prune(max(options["keep_hours"], options["hours"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked {len(hotspots)} hotspots; pruned {pruned} old counters."
+        ))
@@ -0,0 +1,108 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+
+from galli_connect_app import benchmarks
+from galli_connect_app.inventory import parse_schedule, sync_inventory
+from galli_connect_app.models import DriverRoute, PassengerBooking, RouteSeatInventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent /api/book-seats requests at one route and check that "
+        "no date is oversold. Runs against a throwaway on-disk database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--seats", type=int, default=20, help="Seats per date on the route.")
+        parser.add_argument("--dates", type=int, default=5, help="Dates on the route's schedule.")
+
+    def handle(self, *args, **options):
+        # Sold-out 400s are expected here; keep them out of the output
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        with benchmarks.isolated_database(on_disk=True):
+            report = self._run(options)
+        self.stdout.write(json.dumps(report, indent=2))
+        if report["oversold_dates"]:
+            raise CommandError(f"Oversold dates: {report['oversold_dates']}")
+
+    def _run(self, options):
+        rng = benchmarks.make_rng()
+        driver = User.objects.create_user(username="stress_driver", password="x")
+        schedule = [date.today() + timedelta(days=i) for i in range(options["dates"])]
+        route = DriverRoute.objects.create(
+            driver=driver, from_location="Stress From", to_location="Stress To",
+            departure_time="08:00", cost_per_seat=10, total_seats=options["seats"],
+        )
+        sync_inventory(route, parse_schedule([
+            {"date": d.isoformat(), "availableSeats": options["seats"]} for d in schedule
+        ]))
+        # One logged-in client per worker, prepared before the clock starts
+        clients = []
+        for i in range(options["threads"]):
+            client = Client()
+            client.force_login(User.objects.create_user(username=f"stress_passenger_{i}", password="x"))
+            clients.append(client)
+        payloads = [
+            json.dumps({
+                "driverId": driver.id,
+                "routeId": route.id,
+                "dates": [d.isoformat() for d in rng.sample(schedule, rng.randint(1, len(schedule)))],
+                "seatsToBook": rng.randint(1, 3),
+            })
+            for _ in range(options["requests"])
+        ]
+
+        def worker(client, share):
+            timings = []
+            try:
+                for payload in share:
+                    start = time.perf_counter()
+                    response = client.post("/api/book-seats", payload, content_type="application/json")
+                    timings.append((response.status_code, (time.perf_counter() - start) * 1000))
+            finally:
+                # Each worker thread opened its own database connection
+                connections.close_all()
+            return timings
+
+        shares = [payloads[i::options["threads"]] for i in range(options["threads"])]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            results = [result for timings in pool.map(worker, clients, shares) for result in timings]
+        elapsed = time.perf_counter() - start
+
+        booked = dict(
+            PassengerBooking.objects.filter(route=route)
+            .values_list("date").annotate(seats=Sum("seats_booked"))
+        )
+        remaining = dict(
+            RouteSeatInventory.objects.filter(route=route).values_list("date", "available_seats")
+        )
+        oversold = [
+            d.isoformat() for d in schedule
+            if remaining[d] < 0 or booked.get(d, 0) + remaining[d] != options["seats"]
+        ]
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            "requests": len(results),
+            "threads": options["threads"],
+            "elapsed_s": round(elapsed, 3),
+            "requests_per_s": round(len(results) / elapsed, 1),
+            "latency": benchmarks.summarize([ms for _, ms in results]),
+            "statuses": statuses,
+            "seats_booked": {d.isoformat(): booked.get(d, 0) for d in schedule},
+            "seats_remaining": {d.isoformat(): remaining[d] for d in schedule},
+            "oversold_dates": oversold,
+        }
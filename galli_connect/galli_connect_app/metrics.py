@@ -0,0 +1,116 @@
+"""
+Per-view request metrics, served in Prometheus text format at ``/metrics``.
+
+``RequestMetricsMiddleware`` (middleware.py) times each request, counts the
+SQL statements it runs and their time with a database execute wrapper, and
+records them here under the view's URL name. Streaming responses are
+finished when their last chunk is sent, so their queries and bytes count.
+
+Series, all labelled ``view`` and ``method``:
+
+- ``galli_http_requests_total`` (also ``status``)
+- ``galli_http_request_duration_seconds`` histogram
+- ``galli_http_response_size_bytes`` histogram
+- ``galli_db_queries_per_request`` histogram
+- ``galli_db_queries_total`` and ``galli_db_query_duration_seconds_total``
+
+Counters live in process memory: every worker serves its own, so scrape
+each worker (or run one) rather than a load-balanced address.
+"""
+import bisect
+import threading
+from collections import Counter
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_views = {}
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "total")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.total}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class _ViewStats:
+    __slots__ = ("statuses", "duration", "size", "queries", "query_count", "query_seconds")
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.duration = _Histogram(DURATION_BUCKETS)
+        self.size = _Histogram(SIZE_BUCKETS)
+        self.queries = _Histogram(QUERY_BUCKETS)
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+
+def record(view, method, status, seconds, size, query_count, query_seconds):
+    """Add one finished request; ``size`` is None when unknown."""
+    with _lock:
+        stats = _views.get((view, method))
+        if stats is None:
+            stats = _views[view, method] = _ViewStats()
+        stats.statuses[status] += 1
+        stats.duration.observe(seconds)
+        if size is not None:
+            stats.size.observe(size)
+        stats.queries.observe(query_count)
+        stats.query_count += query_count
+        stats.query_seconds += query_seconds
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _header(name, kind, text):
+    return [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+
+
+def render():
+    """All series in the Prometheus text exposition format."""
+    with _lock:
+        views = sorted(_views.items())
+        requests = _header("galli_http_requests_total", "counter", "Requests by view, method and status.")
+        duration = _header("galli_http_request_duration_seconds", "histogram", "Time to the last byte.")
+        size = _header("galli_http_response_size_bytes", "histogram", "Response body size.")
+        queries = _header("galli_db_queries_per_request", "histogram", "SQL statements per request.")
+        query_count = _header("galli_db_queries_total", "counter", "SQL statements run.")
+        query_seconds = _header("galli_db_query_duration_seconds_total", "counter", "Time spent in SQL.")
+        for (view, method), stats in views:
+            labels = f'view="{_escape(view)}",method="{_escape(method)}"'
+            requests.extend(
+                f'galli_http_requests_total{{{labels},status="{status}"}} {count}'
+                for status, count in sorted(stats.statuses.items())
+            )
+            duration.extend(stats.duration.lines("galli_http_request_duration_seconds", labels))
+            size.extend(stats.size.lines("galli_http_response_size_bytes", labels))
+            queries.extend(stats.queries.lines("galli_db_queries_per_request", labels))
+            query_count.append(f"galli_db_queries_total{{{labels}}} {stats.query_count}")
+            query_seconds.append(f"galli_db_query_duration_seconds_total{{{labels}}} {stats.query_seconds}")
+    return "\n".join(requests + duration + size + queries + query_count + query_seconds) + "\n"
@@ -0,0 +1,204 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SessionTokenMiddleware:
+    """Accept the session key from ``Authorization: Token <key>``.
+
+    The login response returns the session key as ``token`` for clients that
+    do not keep cookies. Placed before SessionMiddleware, this maps the header
+    onto the session cookie so the request is authenticated from the session
+    store instead of re-checking the password.
+    """
+
+    keyword = "Token"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self._map_token(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._map_token(request)
+        return await self.get_response(request)
+
+    def _map_token(self, request):
+        header = request.headers.get("Authorization", "")
+        keyword, _, token = header.partition(" ")
+        if keyword == self.keyword and token and settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = token.strip()
+
+
+# Statements kept per request for the slow-request log
+SLOW_LOG_MAX_STATEMENTS = 50
+
+
+class _QueryRecorder:
+    """Counts a request's statements and their time; see ``record_query``."""
+
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.statements is not None and len(self.statements) < SLOW_LOG_MAX_STATEMENTS:
+                self.statements.append((elapsed, sql))
+
+
+# The recorder of the request being handled. Context variables follow a
+# request into sync_to_async threads, so async requests whose queries share
+# one thread's connections still count only their own.
+_recorder = ContextVar("query_recorder", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper feeding the current request's recorder, if any."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """Add ``record_query`` to a connection once (signals.py, on connect)."""
+    if settings.REQUEST_METRICS and record_query not in connection.execute_wrappers:
+        # First, so popping a connection.execute_wrapper() block entered
+        # before the connection opened still removes that block's wrapper
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class RequestMetricsMiddleware:
+    """Record latency, SQL and response size per view for ``/metrics``.
+
+    Goes right after StaticFilesMiddleware so the time includes the rest of
+    the stack while static hits stay out of the per-view table. With
+    ``REQUEST_METRICS`` off it removes itself from the chain, costing
+    nothing. With ``SLOW_REQUEST_MS`` set, slower requests are logged with
+    their SQL as warnings. Runs sync or async to match the chain, so async
+    views are not pushed onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_seconds = settings.SLOW_REQUEST_MS / 1000 if settings.SLOW_REQUEST_MS else None
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder = _QueryRecorder(keep_sql=self.slow_seconds is not None)
+        start = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self._measure(request, response, start, recorder)
+
+    async def __acall__(self, request):
+        recorder = _QueryRecorder(keep_sql=self.slow_seconds is not None)
+        start = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self._measure(request, response, start, recorder)
+
+    def _measure(self, request, response, start, recorder):
+        if not response.streaming:
+            self._record(request, response, start, recorder, len(response.content))
+        elif not response.is_async:
+            response.streaming_content = self._stream(response.streaming_content, request, response,
+                                                      start, recorder)
+        elif self.async_mode:
+            response.streaming_content = self._astream(response.streaming_content, request, response,
+                                                       start, recorder)
+        else:
+            # Consumed by the ASGI handler outside this thread; time to first byte only
+            self._record(request, response, start, recorder, None)
+        return response
+
+    # The body is produced after __call__ returns, in the server's context:
+    # each chunk is pulled with the request's recorder set again.
+
+    def _stream(self, content, request, response, start, recorder):
+        size = 0
+        chunks = iter(content)
+        try:
+            while True:
+                token = _recorder.set(recorder)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    _recorder.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, start, recorder, size)
+
+    async def _astream(self, content, request, response, start, recorder):
+        size = 0
+        chunks = aiter(content)
+        try:
+            while True:
+                token = _recorder.set(recorder)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _recorder.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, start, recorder, size)
+
+    def _record(self, request, response, start, recorder, size):
+        seconds = time.perf_counter() - start
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        metrics.record(view, request.method, response.status_code, seconds, size,
+                       recorder.count, recorder.seconds)
+        if self.slow_seconds is not None and seconds >= self.slow_seconds:
+            statements = "".join(f"\n  {elapsed * 1000:8.1f} ms  {sql}" for elapsed, sql in recorder.statements)
+            logger.warning(
+                "Slow request: %s %s %s in %.0f ms, %d queries (%.0f ms)%s",
+                request.method, request.get_full_path(), response.status_code, seconds * 1000,
+                recorder.count, recorder.seconds * 1000, statements,
+            )
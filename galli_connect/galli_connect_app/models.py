@@ -10,6 +10,11 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["role", "user"], name="profile_role_user_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.email} - {self.role}"
 
@@ -17,13 +22,28 @@ class UserProfile(models.Model):
 
 
 class DriverRoute(models.Model):
+    # departure_minutes of a departure_time that could not be parsed; sorts last
+    UNKNOWN_DEPARTURE = 24 * 60
+
     driver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="routes")
     from_location = models.CharField(max_length=255)
     to_location = models.CharField(max_length=255)
     departure_time = models.CharField(max_length=50)  # or DateTimeField if needed
+    # Minutes after midnight parsed from departure_time by signals.py, for sorting
+    departure_minutes = models.PositiveSmallIntegerField(default=UNKNOWN_DEPARTURE)
     cost_per_seat = models.DecimalField(max_digits=10, decimal_places=2)
     total_seats = models.IntegerField(default=2)
-    active_days = models.JSONField()  # store list like ["Monday", "Wednesday"]
+    # Optional coordinates; indexed in RoutePoint by signals.py, see geo.py
+    from_lat = models.FloatField(null=True, blank=True)
+    from_lng = models.FloatField(null=True, blank=True)
+    to_lat = models.FloatField(null=True, blank=True)
+    to_lng = models.FloatField(null=True, blank=True)
+    # Recurring schedule, see inventory.py: bit 0 = Monday ... bit 6 = Sunday
+    weekday_mask = models.PositiveSmallIntegerField(default=0)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    # Legacy per-date schedule; only read by the backfill_seat_inventory command
+    active_days = models.JSONField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.driver.username}: {self.from_location} -> {self.to_location}"
@@ -34,10 +54,187 @@ class PassengerBooking(models.Model):
     date = models.DateField()
     seats_booked = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            # Bookings of a route, per date (driver dashboard, seat totals)
+            models.Index(fields=["route", "date"], name="booking_route_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.passenger.username} booked {self.seats_booked} seats on {self.date} for {self.route}"
 
 
+class RouteSeatInventory(models.Model):
+    """Per-date override of a route's recurring schedule; see inventory.py."""
+    route = models.ForeignKey(DriverRoute, on_delete=models.CASCADE, related_name="seat_inventory")
+    date = models.DateField()
+    available_seats = models.IntegerField()
+    cancelled = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["route", "date"], name="uniq_route_date_inventory"),
+        ]
+
+    def __str__(self):
+        return f"{self.route_id} on {self.date}: {self.available_seats} seats"
+
+
+class RouteLocationToken(models.Model):
+    """One word of a route's normalized from/to location, kept in sync by signals.py."""
+    FROM = "F"
+    TO = "T"
+    SIDE_CHOICES = [
+        (FROM, "From"),
+        (TO, "To"),
+    ]
+    route = models.ForeignKey(
+        DriverRoute, on_delete=models.CASCADE, related_name="location_tokens", db_index=False
+    )
+    side = models.CharField(max_length=1, choices=SIDE_CHOICES)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            # Finds routes by word prefix
+            models.Index(fields=["side", "token", "route"], name="route_token_idx"),
+            # Checks a route's remaining words; also serves the FK cascade
+            models.Index(fields=["route", "side", "token"], name="token_route_idx"),
+        ]
 
+    def __str__(self):
+        return f"{self.route_id} {self.side}: {self.token}"
 
 
+class RoutePoint(models.Model):
+    """A route's origin, waypoint or destination keyed by geohash; see geo.py."""
+    ORIGIN = "O"
+    WAYPOINT = "W"
+    DESTINATION = "D"
+    KIND_CHOICES = [
+        (ORIGIN, "Origin"),
+        (WAYPOINT, "Waypoint"),
+        (DESTINATION, "Destination"),
+    ]
+    # seq of the destination, after any number of waypoints
+    LAST = 32767
+
+    route = models.ForeignKey(DriverRoute, on_delete=models.CASCADE, related_name="points")
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    seq = models.PositiveSmallIntegerField()
+    lat = models.FloatField()
+    lng = models.FloatField()
+    geohash = models.CharField(max_length=12)
+
+    class Meta:
+        indexes = [
+            # Radius queries scan geohash prefixes; covering, so candidates
+            # are filtered and read without touching the table
+            models.Index(
+                fields=["geohash", "kind", "lat", "lng", "route", "seq"], name="route_point_geohash_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.route_id} {self.kind}{self.seq}: {self.lat},{self.lng}"
+
+
+class DemandCounter(models.Model):
+    """Searches and booked seats from one pickup location in one hour; see demand.py."""
+    LOCATION_LENGTH = 255
+
+    location = models.CharField(max_length=LOCATION_LENGTH)  # normalized
+    bucket = models.DateTimeField()  # start of the hour
+    searches = models.PositiveIntegerField(default=0)
+    seats_booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["location", "bucket"], name="uniq_demand_location_bucket"),
+        ]
+        indexes = [
+            # Rollup window and pruning
+            models.Index(fields=["bucket"], name="demand_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.location} @ {self.bucket}: {self.searches} searches, {self.seats_booked} seats"
+
+
+class DemandHotspot(models.Model):
+    """Ranked output of the last demand rollup, served as is by /api/demand-hotspots."""
+    rank = models.PositiveSmallIntegerField(unique=True)
+    location = models.CharField(max_length=255)
+    demand_score = models.PositiveSmallIntegerField()
+    searches = models.PositiveIntegerField()
+    seats_booked = models.PositiveIntegerField()
+    window_hours = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["rank"]
+
+    def __str__(self):
+        return f"#{self.rank} {self.location} ({self.demand_score}/10)"
+
+
+class TripRequest(models.Model):
+    """A passenger's request for a ride inside a time window; pooled by pooling.py."""
+    PENDING = "PENDING"
+    POOLED = "POOLED"
+    CANCELLED = "CANCELLED"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (POOLED, "Pooled"),
+        (CANCELLED, "Cancelled"),
+    ]
+
+    passenger = models.ForeignKey(User, on_delete=models.CASCADE, related_name="trip_requests")
+    from_location = models.CharField(max_length=255)
+    to_location = models.CharField(max_length=255)
+    from_lat = models.FloatField()
+    from_lng = models.FloatField()
+    to_lat = models.FloatField()
+    to_lng = models.FloatField()
+    date = models.DateField()
+    # Acceptable departure window, minutes after midnight
+    earliest_minutes = models.PositiveSmallIntegerField()
+    latest_minutes = models.PositiveSmallIntegerField()
+    seats = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Pending requests of a day, the optimizer's input
+            models.Index(fields=["date", "status"], name="trip_request_date_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.passenger_id}: {self.from_location} -> {self.to_location} on {self.date}"
+
+
+class SeatHold(models.Model):
+    """Seats of one route and date set aside for a passenger until ``expires_at``; see holds.py.
+
+    The dates of one hold share ``hold_id``. The seats are already taken off
+    the route's inventory; confirming turns the rows into PassengerBookings,
+    expiring gives the seats back.
+    """
+    hold_id = models.UUIDField(db_index=True)
+    passenger = models.ForeignKey(User, on_delete=models.CASCADE, related_name="seat_holds")
+    route = models.ForeignKey(DriverRoute, on_delete=models.CASCADE, related_name="seat_holds")
+    date = models.DateField()
+    seats = models.PositiveSmallIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Expired holds, the sweeper's input
+            models.Index(fields=["expires_at"], name="seat_hold_expiry_idx"),
+            # Expired holds on the dates a new hold wants
+            models.Index(fields=["route", "date"], name="seat_hold_route_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.passenger_id} holds {self.seats} seats on {self.date} for {self.route_id}"
@@ -0,0 +1,172 @@
+"""
+Pools pending TripRequests into shared rides.
+
+Two requests can share a car when their pickups are within
+``max_pickup_km`` of each other, their dropoffs within ``max_dropoff_km``,
+and their departure windows overlap. Requests are bucketed by a pickup
+grid with ``max_pickup_km`` cells, so every request a pickup can pool with
+sits in its own or a neighbouring cell. For each cell the pairwise
+distance and window matrices of that 3x3 neighbourhood are computed with
+NumPy in one shot, and a greedy pass grows a pool from each of the cell's
+requests, earliest first, adding the closest candidates compatible with
+every member until the car (``capacity`` seats) is full.
+
+Stops are ordered along the pool's direction of travel: pickups from the
+one farthest from the destinations, dropoffs from the nearest.
+
+Needs NumPy; views import this module lazily so the rest of the API works
+without it.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.template.defaultfilters import pluralize
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+
+AVERAGE_SPEED_KMH = 20.0
+MINUTES_PER_STOP = 2
+
+Pool = namedtuple("Pool", ["request_ids", "seats", "departure_minutes", "stops", "distance_km", "minutes"])
+
+
+def distance_matrix(lat, lng):
+    """Pairwise distances in km between nearby points given in degrees.
+
+    Equirectangular: within a few km it is as close to haversine as the
+    coordinates are accurate, at a fraction of the trigonometry.
+    """
+    lat, lng = np.radians(lat), np.radians(lng)
+    x = lng * np.cos(np.mean(lat))
+    return EARTH_RADIUS_KM * np.hypot(lat[:, None] - lat[None, :], x[:, None] - x[None, :])
+
+
+def _cells(lat, lng, cell_km):
+    """Map (row, col) of a ``cell_km`` pickup grid -> indices of the requests in it."""
+    step_lat = np.degrees(cell_km / EARTH_RADIUS_KM)
+    step_lng = step_lat / max(np.cos(np.radians(np.mean(lat))), 1e-6)
+    rows = np.floor(lat / step_lat).astype(np.int64)
+    cols = np.floor(lng / step_lng).astype(np.int64)
+    order = np.lexsort((cols, rows))
+    boundaries = np.flatnonzero(np.diff(rows[order]) | np.diff(cols[order])) + 1
+    return {(int(rows[group[0]]), int(cols[group[0]])): group for group in np.split(order, boundaries)}
+
+
+def _neighbourhood(cells, row, col):
+    return np.concatenate([
+        cells[key] for key in ((row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+        if key in cells
+    ])
+
+
+def _greedy_pools(seeds, compatible, cost, earliest, seats, capacity):
+    """Pools (lists of local indices) grown from each of ``seeds`` in turn."""
+    assigned = np.zeros(len(seats), dtype=bool)
+    pools = []
+    for seed in seeds[np.argsort(earliest[seeds], kind="stable")]:
+        if assigned[seed] or seats[seed] > capacity:
+            continue
+        members, taken = [seed], seats[seed]
+        candidates = np.flatnonzero(compatible[seed] & ~assigned)
+        for j in candidates[np.argsort(cost[seed, candidates], kind="stable")]:
+            if j == seed or taken + seats[j] > capacity or not compatible[j, members].all():
+                continue
+            members.append(j)
+            taken += seats[j]
+            if taken == capacity:
+                break
+        if len(members) > 1:
+            assigned[members] = True
+            pools.append(members)
+    return pools
+
+
+def _stops(rows):
+    """Ordered stop names and total path length for the requests of one pool."""
+    # A pool is a handful of requests; plain Python beats NumPy's call overhead.
+    # Stops are ordered by projection onto the pickup-centroid -> dropoff-centroid
+    # direction (flat approximation, fine at city scale).
+    count = len(rows)
+    north = sum(row["to_lat"] - row["from_lat"] for row in rows) / count
+    east = sum(row["to_lng"] - row["from_lng"] for row in rows) / count
+    pickups = sorted(rows, key=lambda row: row["from_lat"] * north + row["from_lng"] * east)
+    dropoffs = sorted(rows, key=lambda row: row["to_lat"] * north + row["to_lng"] * east)
+    points = ([(row["from_location"], row["from_lat"], row["from_lng"]) for row in pickups]
+              + [(row["to_location"], row["to_lat"], row["to_lng"]) for row in dropoffs])
+
+    stops = [points[0][0]]
+    distance_km = 0.0
+    for (_, lat1, lng1), (name, lat2, lng2) in zip(points, points[1:]):
+        distance_km += haversine_km(lat1, lng1, lat2, lng2)
+        if name != stops[-1]:
+            stops.append(name)
+    return stops, distance_km
+
+
+def propose(requests, capacity, max_pickup_km=1.5, max_dropoff_km=2.0):
+    """Pool trip requests for cars with ``capacity`` seats.
+
+    ``requests`` are dicts with id, from_location, to_location, from_lat,
+    from_lng, to_lat, to_lng, earliest_minutes, latest_minutes and seats
+    (TripRequest ``values()`` rows). Returns (pools, unpooled request ids);
+    pools are ordered by departure time.
+    """
+    requests = list(requests)
+    if not requests:
+        return [], []
+    column = lambda name, dtype=np.float64: np.array([row[name] for row in requests], dtype=dtype)
+    from_lat, from_lng = column("from_lat"), column("from_lng")
+    to_lat, to_lng = column("to_lat"), column("to_lng")
+    earliest, latest = column("earliest_minutes", np.int32), column("latest_minutes", np.int32)
+    seats = column("seats", np.int32)
+
+    pools = []
+    pooled = np.zeros(len(requests), dtype=bool)
+    cells = _cells(from_lat, from_lng, max_pickup_km)
+    for (row, col), cell in sorted(cells.items()):
+        block = _neighbourhood(cells, row, col)
+        block = block[~pooled[block]]
+        seeds = np.flatnonzero(np.isin(block, cell))
+        if len(block) < 2 or not len(seeds):
+            continue
+        pickup = distance_matrix(from_lat[block], from_lng[block])
+        dropoff = distance_matrix(to_lat[block], to_lng[block])
+        overlap = (np.maximum(earliest[block][:, None], earliest[block][None, :])
+                   <= np.minimum(latest[block][:, None], latest[block][None, :]))
+        compatible = (pickup <= max_pickup_km) & (dropoff <= max_dropoff_km) & overlap
+        cost = pickup + dropoff
+        for members in _greedy_pools(seeds, compatible, cost, earliest[block], seats[block], capacity):
+            indices = block[members]
+            pooled[indices] = True
+            rows = [requests[i] for i in indices]
+            stops, distance_km = _stops(rows)
+            pools.append(Pool(
+                request_ids=[row["id"] for row in rows],
+                seats=int(seats[indices].sum()),
+                departure_minutes=int(earliest[indices].max()),
+                stops=stops,
+                distance_km=round(distance_km, 2),
+                minutes=round(distance_km / AVERAGE_SPEED_KMH * 60 + MINUTES_PER_STOP * len(stops)),
+            ))
+    pools.sort(key=lambda pool: (pool.departure_minutes, pool.request_ids[0]))
+    unpooled = [requests[i]["id"] for i in np.flatnonzero(~pooled)]
+    return pools, unpooled
+
+
+def as_json(pool):
+    """A pool in the client's ``OptimizedRouteData`` shape, plus the requests it serves."""
+    hours, minutes = divmod(pool.departure_minutes, 60)
+    passengers = len(pool.request_ids)
+    return {
+        "routeName": f"{pool.stops[0]} to {pool.stops[-1]}",
+        "stops": pool.stops,
+        "estimatedDuration": f"{pool.minutes} min",
+        "summary": (
+            f"{passengers} requests, {pool.seats} seat{pluralize(pool.seats)}, "
+            f"{pool.distance_km} km leaving at {hours:02d}:{minutes:02d}."
+        ),
+        "departureTime": f"{hours:02d}:{minutes:02d}",
+        "requestIds": pool.request_ids,
+        "seats": pool.seats,
+        "distanceKm": pool.distance_km,
+    }
@@ -0,0 +1,99 @@
+"""
+Primary/replica database routing.
+
+Writes and ordinary reads go to ``default`` (the primary). Views decorated
+with ``replica_reads`` (route search and nearby routes, the bulk of the read
+traffic) send their reads to one of ``settings.DATABASE_REPLICAS``, picked
+at random per request so a request sees a single replica's snapshot.
+Without replicas configured everything stays on the primary.
+
+Reads are opt-in rather than the default because replicas lag: listings
+behind the API cache (api_cache.py) must not refill it from a replica that
+has not yet seen the write that invalidated it, and a passenger's own
+bookings should show up right after booking. Inside a transaction on the
+primary, reads stay there too.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica = ContextVar("galli_replica", default=None)
+
+
+@contextmanager
+def reading_replica():
+    """Route reads in the block to one randomly chosen replica, if any."""
+    replicas = settings.DATABASE_REPLICAS
+    token = _replica.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def _sync_stream(content, alias):
+    token = _replica.set(alias)
+    try:
+        yield from content
+    finally:
+        _replica.reset(token)
+
+
+async def _async_stream(content, alias):
+    token = _replica.set(alias)
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        _replica.reset(token)
+
+
+def _stream_from(response, alias):
+    # Streamed rows are read after the view returns; keep them on the same replica
+    if alias and response.streaming:
+        stream = _async_stream if response.is_async else _sync_stream
+        response.streaming_content = stream(response.streaming_content, alias)
+    return response
+
+
+def replica_reads(view):
+    """Serve the reads of ``view`` (sync or async) from a replica."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with reading_replica():
+                alias = _replica.get()
+                response = await view(request, *args, **kwargs)
+            return _stream_from(response, alias)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with reading_replica():
+                alias = _replica.get()
+                response = view(request, *args, **kwargs)
+            return _stream_from(response, alias)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """DATABASE_ROUTERS entry; replicas hold the same data as the primary."""
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
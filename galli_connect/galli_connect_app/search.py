@@ -0,0 +1,172 @@
+"""
+Location search index for DriverRoute.
+
+Every route's from/to locations are normalized (lowercased, accents and
+punctuation stripped) and split into word tokens stored in
+``RouteLocationToken``. A search term matches a location when each of its
+words is a prefix of some word in that location, so "kora" finds
+"Koramangala 5th Block" and "sec 12" finds "Sector 12, Gurgaon".
+
+The query words are intersected with one join on the token table per word
+instead of a ``LIKE '%x%'`` over every route: the database walks one word's
+range of the (side, token, route) index and probes the (route, side, token)
+index for the others, so the cost follows the number of routes carrying the
+words rather than the size of the table. A search term may have at most
+``MAX_SEARCH_WORDS`` words, which keeps the join within the database's
+table limit (64 on SQLite).
+
+Results are ordered by ``departure_minutes``, parsed from the free-text
+``departure_time`` when a route is saved.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import DriverRoute, RouteLocationToken
+
+FROM, TO = RouteLocationToken.FROM, RouteLocationToken.TO
+
+_NON_WORD = re.compile(r"[^\w]+")
+# "08:00", "8:30:00", "8.30 pm", "7am", "19h"
+_TIME = re.compile(r"^(\d{1,2})(?:[:.h](\d{2}))?(?::\d{2})?\s*(?:([ap])\.?m?\.?|h)?$", re.IGNORECASE)
+_MAX_TOKEN = RouteLocationToken._meta.get_field("token").max_length
+# Words per from/to term; each one is a join of the token table
+MAX_SEARCH_WORDS = 10
+
+
+def normalize_location(value):
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", stripped.casefold()).split())
+
+
+def departure_minutes(value):
+    """Minutes after midnight of a departure time, or DriverRoute.UNKNOWN_DEPARTURE."""
+    match = _TIME.match(str(value or "").strip())
+    if not match:
+        return DriverRoute.UNKNOWN_DEPARTURE
+    hours, minutes, meridiem = int(match[1]), int(match[2] or 0), (match[3] or "").lower()
+    if meridiem:
+        if not 1 <= hours <= 12:
+            return DriverRoute.UNKNOWN_DEPARTURE
+        hours = hours % 12 + (12 if meridiem == "p" else 0)
+    if hours > 23 or minutes > 59:
+        return DriverRoute.UNKNOWN_DEPARTURE
+    return hours * 60 + minutes
+
+
+def location_tokens(value):
+    """Distinct word tokens of a location, in order of first appearance."""
+    return list(dict.fromkeys(w[:_MAX_TOKEN] for w in normalize_location(value).split()))
+
+
+def route_tokens(route):
+    """Unsaved RouteLocationToken rows for a route."""
+    return [
+        RouteLocationToken(route_id=route.pk, side=side, token=token)
+        for side, value in ((FROM, route.from_location), (TO, route.to_location))
+        for token in location_tokens(value)
+    ]
+
+
+def index_routes(routes):
+    """(Re)build the tokens of the given saved routes."""
+    routes = list(routes)
+    if not routes:
+        return
+    RouteLocationToken.objects.filter(route_id__in=[r.pk for r in routes]).delete()
+    RouteLocationToken.objects.bulk_create(
+        [token for route in routes for token in route_tokens(route)],
+        batch_size=1000,
+    )
+
+
+def rebuild_index(chunk_size=2000):
+    """Rebuild the token table for every route."""
+    RouteLocationToken.objects.all().delete()
+    routes = DriverRoute.objects.only("id", "from_location", "to_location")
+    batch = []
+    for route in routes.iterator(chunk_size=chunk_size):
+        batch.extend(route_tokens(route))
+        if len(batch) >= chunk_size:
+            RouteLocationToken.objects.bulk_create(batch)
+            batch = []
+    RouteLocationToken.objects.bulk_create(batch)
+
+
+def reparse_departure_times(chunk_size=2000):
+    """Recompute departure_minutes for every route (bulk_create skips signals)."""
+    routes = DriverRoute.objects.only("id", "departure_time", "departure_minutes")
+    batch = []
+    for route in routes.iterator(chunk_size=chunk_size):
+        minutes = departure_minutes(route.departure_time)
+        if minutes != route.departure_minutes:
+            route.departure_minutes = minutes
+            batch.append(route)
+        if len(batch) >= chunk_size:
+            DriverRoute.objects.bulk_update(batch, ["departure_minutes"])
+            batch = []
+    DriverRoute.objects.bulk_update(batch, ["departure_minutes"])
+
+
+def _prefix_range(prefix):
+    # Range scan instead of LIKE 'x%' so SQLite can always use the index
+    return {"token__gte": prefix, "token__lt": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def _search_words(value):
+    """Query words of a search term, minus those another word already covers ("sec sector")."""
+    words = location_tokens(value)
+    return [word for word in words if not any(other != word and other.startswith(word) for other in words)]
+
+
+def _intersection_sql(terms):
+    """SELECT of the route ids carrying every (side, word) term: one self-join of the token table per term."""
+    qn = connection.ops.quote_name
+    table, route, side, token = (
+        qn(RouteLocationToken._meta.db_table),
+        *(qn(RouteLocationToken._meta.get_field(name).column) for name in ("route", "side", "token")),
+    )
+    joins, params = [], []
+    for n, (term_side, word) in enumerate(terms[1:], start=1):
+        joins.append(
+            f" INNER JOIN {table} t{n} ON t{n}.{route} = t0.{route}"
+            f" AND t{n}.{side} = %s AND t{n}.{token} >= %s AND t{n}.{token} < %s"
+        )
+        params += [term_side, *_prefix_range(word).values()]
+    term_side, word = terms[0]
+    params += [term_side, *_prefix_range(word).values()]
+    sql = (
+        f"SELECT t0.{route} FROM {table} t0{''.join(joins)}"
+        f" WHERE t0.{side} = %s AND t0.{token} >= %s AND t0.{token} < %s"
+    )
+    return sql, params
+
+
+def matching_routes(from_location, to_location):
+    """Routes whose from/to locations match the given search terms.
+
+    Raises ValueError when a term has more than MAX_SEARCH_WORDS words.
+    """
+    terms = [(FROM, word) for word in _search_words(from_location)]
+    to_terms = [(TO, word) for word in _search_words(to_location)]
+    if max(len(terms), len(to_terms)) > MAX_SEARCH_WORDS:
+        raise ValueError(f"Search locations can have at most {MAX_SEARCH_WORDS} words each")
+    if not terms or not to_terms:
+        return DriverRoute.objects.none()
+    terms += to_terms
+
+    # The words are intersected in one pass through the token indexes: a
+    # join per word is far cheaper than a correlated EXISTS per candidate
+    # route, and the database picks which word to start from. Written as
+    # SQL because the same joins through the ORM cost more to build and
+    # compile than a whole search of a small table. A word can match several
+    # tokens of a route; the id__in subquery drops the duplicate rows.
+    # Longest word first, for planners that keep the written join order.
+    terms.sort(key=lambda term: len(term[1]), reverse=True)
+    return DriverRoute.objects.filter(id__in=RawSQL(*_intersection_sql(terms)))
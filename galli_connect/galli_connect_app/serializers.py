@@ -0,0 +1,140 @@
+"""
+JSON shapes of DriverRoute and PassengerBooking, and the JSON encoder.
+
+Serializers read ``values()`` rows, so list endpoints never instantiate
+models; ``route_row`` turns an instance a view already holds into the same
+row. Two route shapes exist because two clients read them:
+
+- ``route``: camelCase with the cost as a number. Search, nearby routes,
+  route creation and booking responses (types.ts ``PassengerRouteView``).
+- ``driver_route``: snake_case with the cost as a string. The driver
+  dashboard list and the update response (DriverServiceInteractor.ts).
+
+Responses are encoded by ``dumps`` with the backend named in
+``settings.API_JSON_BACKEND``: orjson when it is installed, else the
+standard library with DjangoJSONEncoder. Compare them with
+``manage.py bench_serializers``.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from . import geo, inventory
+from .models import DriverRoute
+
+# values() fields behind driver_route, in addition to the active_days
+# computed by inventory.active_days_for
+DRIVER_ROUTE_FIELDS = (
+    "id", "driver_id", "from_location", "to_location", "departure_time", "departure_minutes",
+    "cost_per_seat", "total_seats", "weekday_mask", "start_date", "end_date",
+    "from_lat", "from_lng", "to_lat", "to_lng",
+)
+# ... and behind route, which names the driver
+ROUTE_FIELDS = DRIVER_ROUTE_FIELDS + ("driver__username",)
+ROUTE_BOOKING_FIELDS = ("date", "passenger_id", "passenger__first_name", "seats_booked")
+
+
+def route_row(route):
+    """The ``values(*ROUTE_FIELDS)`` row of a DriverRoute instance.
+
+    The driver's name is only filled in when the driver is already loaded
+    (``select_related`` or assigned), so this never queries.
+    """
+    row = {field: getattr(route, field) for field in DRIVER_ROUTE_FIELDS}
+    row["driver__username"] = route.driver.username if DriverRoute.driver.is_cached(route) else None
+    return row
+
+
+def route(row, active_days):
+    return {
+        "id": row["id"],
+        "from": row["from_location"],
+        "to": row["to_location"],
+        "departureTime": row["departure_time"],
+        "costPerSeat": float(row["cost_per_seat"]),
+        "activeDays": active_days,
+        "totalSeats": row["total_seats"],
+        "driverId": row["driver_id"],
+        "driverName": row["driver__username"],  # You can change this to full_name if stored
+        "fromCoords": geo.as_json(row["from_lat"], row["from_lng"]),
+        "toCoords": geo.as_json(row["to_lat"], row["to_lng"]),
+        "schedule": inventory.schedule_for(row),
+    }
+
+
+def driver_route(row, active_days):
+    return {
+        "id": row["id"],
+        "from_location": row["from_location"],
+        "to_location": row["to_location"],
+        "departure_time": row["departure_time"],
+        "cost_per_seat": str(row["cost_per_seat"]),
+        "from_coords": geo.as_json(row["from_lat"], row["from_lng"]),
+        "to_coords": geo.as_json(row["to_lat"], row["to_lng"]),
+        "active_days": active_days,
+        "schedule": inventory.schedule_for(row),
+        "total_seats": row["total_seats"],
+    }
+
+
+def route_bookings(rows):
+    """``{"YYYY-MM-DD": [{passengerId, passengerName, seatsBooked}]}`` from ROUTE_BOOKING_FIELDS rows."""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row["date"].isoformat(), []).append({
+            "passengerId": row["passenger_id"],
+            "passengerName": row["passenger__first_name"],
+            "seatsBooked": row["seats_booked"],
+        })
+    return grouped
+
+
+def booking_summary(booked, active_days, end):
+    """``{"YYYY-MM-DD": {seatsBooked, seatsRemaining}}`` up to ``end``, in date order.
+
+    ``booked`` is (date, seats) pairs; ``active_days`` the route's list from
+    inventory.active_days_for over the same window. Dates with bookings but
+    no service left (cancelled) have ``seatsRemaining`` null.
+    """
+    remaining = {day["date"]: day["availableSeats"] for day in active_days if day["date"] <= end.isoformat()}
+    booked = {date.isoformat(): seats for date, seats in booked}
+    return {
+        date: {"seatsBooked": booked.get(date, 0), "seatsRemaining": remaining.get(date)}
+        for date in sorted(remaining.keys() | booked.keys())
+    }
+
+
+def _json_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def _orjson_default(value):
+    # orjson handles dates itself; Decimal and lazy strings go the Django way
+    return DjangoJSONEncoder().default(value)
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data, default=_orjson_default)
+
+
+BACKENDS = {"json": _json_dumps, "orjson": _orjson_dumps}
+
+
+def dumps(data, backend=None):
+    """``data`` as JSON bytes."""
+    return BACKENDS[backend or settings.API_JSON_BACKEND](data)
+
+
+def json_response(data, status=200):
+    """JsonResponse equivalent (lists allowed) encoded with ``dumps``."""
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+def ndjson_line(data):
+    return dumps(data) + b"\n"
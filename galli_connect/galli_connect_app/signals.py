@@ -0,0 +1,32 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from .models import DriverRoute
+from . import geo, middleware, search
+
+
+@receiver(pre_save, sender=DriverRoute)
+def parse_departure_time(sender, instance, **kwargs):
+    instance.departure_minutes = search.departure_minutes(instance.departure_time)
+
+
+@receiver(post_save, sender=DriverRoute)
+def index_route_locations(sender, instance, update_fields=None, **kwargs):
+    # Tokens are removed with the route through the FK cascade on delete
+    if update_fields and not {"from_location", "to_location"} & set(update_fields):
+        return
+    search.index_routes([instance])
+
+
+@receiver(post_save, sender=DriverRoute)
+def index_route_points(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields and not {"from_lat", "from_lng", "to_lat", "to_lng"} & set(update_fields):
+        return
+    geo.index_route(instance, created=created)
+
+
+@receiver(connection_created)
+def record_request_queries(sender, connection, **kwargs):
+    # One shared wrapper per connection, counting into the current request's recorder
+    middleware.install_query_recorder(connection)
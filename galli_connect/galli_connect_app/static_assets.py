@@ -0,0 +1,238 @@
+"""
+Fingerprinted, precompressed static files and the SPA shell.
+
+``manage.py collectstatic`` (after the Vite build, which manage.py runs
+first) copies the build into STATIC_ROOT. ``CompressedManifestStaticFilesStorage``
+adds a content-hashed copy of every file, rewrites the bundle URLs in
+index.html to those copies and writes ``.gz`` (and ``.br`` with brotli
+installed) variants next to every compressible file.
+
+``StaticFilesMiddleware`` serves STATIC_ROOT from a table built once per
+process: no stat, finder or template per request. It sends the
+precompressed variant the client accepts as is, and marks hashed names
+(Django's and Vite's) cacheable for a year. ``home`` serves the collected
+shell the same way, revalidated on every load so a new build is picked up
+at once. Both are on with ``SERVE_COLLECTED_STATIC`` (the default without
+DEBUG). Otherwise, or before collectstatic has run, the middleware steps
+aside and ``home`` renders the template as before.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+
+COMPRESSIBLE = (".css", ".html", ".ico", ".js", ".json", ".map", ".mjs", ".svg", ".txt", ".wasm", ".xml")
+# A variant is kept only if it saves at least this much
+MIN_SAVING = 0.05
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Unhashed names may change with the next deploy
+MUTABLE = "public, max-age=60"
+# Files up to this size are answered from memory after the first request
+IN_MEMORY_MAX = 64 * 1024
+# Vite's own content hashes (build.outDir in client/vite.config.ts): assets/index-o6Q6E77z.js
+VITE_HASHED = re.compile(r"^assets/.+-[\w-]{8}\.\w+$")
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also hashes index.html's bundle URLs and precompresses."""
+
+    patterns = ManifestStaticFilesStorage.patterns + (
+        ("*.html", ((r"""(?P<matched>(?P<attr>src|href)=["'](?P<url>[^"']+)["'])""", '%(attr)s="%(url)s"'),)),
+    )
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+        if not name.endswith(".html"):
+            return converter
+
+        def lenient(matchobj):
+            # A page may link files outside the build (public/ assets, stale references); leave them be
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj["matched"]
+
+        return lenient
+
+    def post_process(self, paths, dry_run=False, **options):
+        written = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception):
+                written.update(n for n in (name, hashed_name) if n and n.endswith(COMPRESSIBLE))
+        if not dry_run:
+            # Once all passes are done: the hashed copies of CSS and HTML are rewritten until they settle
+            for name in sorted(written):
+                self._precompress(name)
+
+    def _precompress(self, name):
+        path = self.path(name)
+        data = Path(path).read_bytes()
+        for encoding in settings.STATIC_COMPRESSION:
+            variant = path + ENCODING_SUFFIXES[encoding]
+            compressed = _compress(data, encoding)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                Path(variant).write_bytes(compressed)
+            elif os.path.exists(variant):
+                os.remove(variant)
+
+
+class StaticFile(NamedTuple):
+    path: str
+    size: int
+    content_type: str
+    etag: str
+    cache_control: str
+    # (encoding, path, size) of the precompressed variants, preferred first
+    variants: tuple
+
+
+@lru_cache(maxsize=None)
+def _contents(path):
+    return Path(path).read_bytes()
+
+
+@lru_cache(maxsize=None)
+def collected_files():
+    """URL path -> StaticFile for everything collectstatic wrote; empty before it ran or when not serving it."""
+    root = settings.STATIC_ROOT
+    if not settings.SERVE_COLLECTED_STATIC or not root or not settings.STATIC_URL.startswith("/") or not os.path.isdir(root):
+        return {}
+    hashed = set(staticfiles_storage.hashed_files.values()) if hasattr(staticfiles_storage, "hashed_files") else set()
+    suffixes = tuple(ENCODING_SUFFIXES.values())
+    files = {}
+    for directory, _, names in os.walk(root):
+        for filename in names:
+            path = os.path.join(directory, filename)
+            name = Path(os.path.relpath(path, root)).as_posix()
+            if filename.endswith(suffixes) or name == getattr(staticfiles_storage, "manifest_name", None):
+                continue
+            stat = os.stat(path)
+            content_type, _ = mimetypes.guess_type(name)
+            if content_type and (content_type.startswith("text/") or content_type == "application/javascript"):
+                content_type += "; charset=utf-8"
+            files[settings.STATIC_URL + name] = StaticFile(
+                path=path,
+                size=stat.st_size,
+                content_type=content_type or "application/octet-stream",
+                etag=f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                cache_control=IMMUTABLE if name in hashed or VITE_HASHED.match(name) else MUTABLE,
+                variants=tuple(
+                    (encoding, path + ENCODING_SUFFIXES[encoding], os.path.getsize(path + ENCODING_SUFFIXES[encoding]))
+                    for encoding in settings.STATIC_COMPRESSION
+                    if os.path.exists(path + ENCODING_SUFFIXES[encoding])
+                ),
+            )
+    return files
+
+
+def index_shell():
+    """The collected (URL-hashed) index.html, or None before collectstatic."""
+    if not collected_files() or not hasattr(staticfiles_storage, "stored_name"):
+        return None
+    try:
+        name = staticfiles_storage.stored_name("index.html")
+    except ValueError:
+        return None
+    return collected_files().get(settings.STATIC_URL + name)
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve(request, static_file, cache_control=None):
+    """Response for a StaticFile, as the precompressed variant the client accepts if there is one."""
+    headers = {
+        "ETag": static_file.etag,
+        "Cache-Control": cache_control or static_file.cache_control,
+        "X-Content-Type-Options": "nosniff",
+    }
+    if static_file.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if request.headers.get("If-None-Match") == static_file.etag:
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    accepted = _accepted_encodings(request.headers.get("Accept-Encoding", ""))
+    path, size, encoding = static_file.path, static_file.size, None
+    for variant_encoding, variant_path, variant_size in static_file.variants:
+        if variant_encoding in accepted:
+            path, size, encoding = variant_path, variant_size, variant_encoding
+            break
+    if size <= IN_MEMORY_MAX:
+        response = HttpResponse(_contents(path), content_type=static_file.content_type)
+        response["Content-Length"] = size
+    else:
+        response = FileResponse(open(path, "rb"), content_type=static_file.content_type)
+        del response["Content-Disposition"]
+    if encoding:
+        response["Content-Encoding"] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+class StaticFilesMiddleware:
+    """Serve STATIC_URL from STATIC_ROOT ahead of the rest of the stack.
+
+    Goes right after SecurityMiddleware, so static responses still get its
+    HTTPS redirect and security headers. Removes itself from the chain when
+    nothing is collected or SERVE_COLLECTED_STATIC is off; ``runserver``
+    serves static files itself in development.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not collected_files():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.files = collected_files()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        static_file = self._lookup(request)
+        if static_file is None:
+            return self.get_response(request)
+        return serve(request, static_file)
+
+    async def __acall__(self, request):
+        static_file = self._lookup(request)
+        if static_file is None:
+            return await self.get_response(request)
+        return serve(request, static_file)
+
+    def _lookup(self, request):
+        return self.files.get(request.path_info) if request.method in ("GET", "HEAD") else None
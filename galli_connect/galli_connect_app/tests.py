@@ -1,3 +1,1005 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import threading
+from datetime import date, timedelta
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import accounts, api_cache, bulk_io, demand, events, geo, holds, inventory, metrics, search, views
+from .management.commands import check_query_budget as budget
+from .middleware import RequestMetricsMiddleware, SessionTokenMiddleware
+from .models import DemandCounter, DriverRoute, PassengerBooking, RouteSeatInventory, SeatHold, TripRequest
+
+MONDAY = date(2030, 1, 7)
+
+
+def make_route(driver, **fields):
+    """A weekday route from MONDAY for four weeks with 4 seats."""
+    fields = {
+        "from_location": "Koramangala", "to_location": "Electronic City", "departure_time": "08:00",
+        "cost_per_seat": 40, "total_seats": 4, "weekday_mask": 0b0011111,
+        "start_date": MONDAY, "end_date": MONDAY + timedelta(days=27), **fields,
+    }
+    return DriverRoute.objects.create(driver=driver, **fields)
+
+
+def seats_left(route, day):
+    return RouteSeatInventory.objects.get(route=route, date=day).available_seats
+
+
+def post_json(client, path, body):
+    return client.post(path, json.dumps(body), content_type="application/json")
+
+
+class QueryBudgetTests(TransactionTestCase):
+    """Every API view issues exactly its ``check_query_budget`` budget, without full table scans."""
+
+    def test_views_within_budget(self):
+        for view, http, method, path, body in budget.api_calls(budget.seed()):
+            with self.subTest(view=view):
+                budget.reset_caches()
+                with budget.capture_statements() as statements:
+                    with self.assertNumQueries(budget.BUDGETS[view]):
+                        response = budget.send(http, method, path, body)
+                self.assertLess(response.status_code, 400, response.content[:200])
+                if connection.vendor == "sqlite":
+                    plans = budget.explain_statements(statements)
+                    self.assertEqual([line for plan in plans for line in budget.full_scans(plan["plan"])], [])
+
+
+class LocationSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.koramangala = make_route(cls.driver, from_location="Koramangala 5th Block", to_location="Electronic City")
+        cls.sector = make_route(cls.driver, from_location="Sector 12, Gurgaon", to_location="Cyber City")
+        cls.sao_paulo = make_route(cls.driver, from_location="São Paulo", to_location="Électronic City")
+
+    def matches(self, from_location, to_location):
+        return set(search.matching_routes(from_location, to_location).values_list("id", flat=True))
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.matches("kora", "elec"), {self.koramangala.id})
+        self.assertEqual(self.matches("sec 12", "city"), {self.sector.id})
+        self.assertEqual(self.matches("12 sector sec", "cyb"), {self.sector.id})
+
+    def test_accents_and_punctuation_are_ignored(self):
+        self.assertEqual(self.matches("SAO paulo!", "electronic"), {self.sao_paulo.id})
+        self.assertEqual(self.matches("gurgaon,", "city"), {self.sector.id})
+
+    def test_every_word_must_match_its_side(self):
+        self.assertEqual(self.matches("kora gurgaon", "city"), set())
+        self.assertEqual(self.matches("kora", "cyber"), set())
+        self.assertEqual(self.matches("electronic", "koramangala"), set())
+        self.assertEqual(self.matches("kora", "  "), set())
+
+    def test_renamed_route_is_reindexed(self):
+        self.koramangala.from_location = "Indiranagar"
+        self.koramangala.save()
+        self.assertEqual(self.matches("kora", "elec"), set())
+        self.assertEqual(self.matches("indira", "elec"), {self.koramangala.id})
+
+    def test_search_words_are_capped(self):
+        words = " ".join(f"w{n}" for n in range(search.MAX_SEARCH_WORDS))
+        self.assertEqual(self.matches(words, words), set())
+        with self.assertRaises(ValueError):
+            search.matching_routes(f"{words} extra", "city")
+
+        # 70 words would join the token table more often than SQLite allows
+        many = " ".join(f"stop{n}" for n in range(70))
+        response = post_json(Client(), "/api/routes/search", {"from": many, "to": "city"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_departure_minutes(self):
+        for value, minutes in (("08:00", 480), ("8.30 pm", 1230), ("7am", 420), ("19h", 1140), ("12am", 0)):
+            with self.subTest(value=value):
+                self.assertEqual(search.departure_minutes(value), minutes)
+        self.assertEqual(search.departure_minutes("soon"), DriverRoute.UNKNOWN_DEPARTURE)
+        self.assertEqual(search.departure_minutes("25:00"), DriverRoute.UNKNOWN_DEPARTURE)
+
+
+class SearchPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        routes = DriverRoute.objects.bulk_create([
+            DriverRoute(driver=cls.driver, from_location="Koramangala", to_location="Electronic City",
+                        departure_time=f"{6 + n // 60:02d}:{n % 60:02d}", departure_minutes=360 + n,
+                        cost_per_seat=40, total_seats=4, weekday_mask=0b0011111)
+            for n in range(views.SEARCH_PAGE_SIZE + 5)
+        ])
+        search.index_routes(routes)
+        cls.ids = [route.id for route in routes]
+
+    def search(self, **body):
+        return post_json(Client(), "/api/routes/search", {"from": "kora", "to": "elec", **body})
+
+    def test_every_match_without_limit_or_cursor(self):
+        response = self.search()
+        self.assertEqual([route["id"] for route in response.json()], self.ids)
+        self.assertNotIn("X-Next-Cursor", response)
+
+    def test_pages_follow_the_cursor(self):
+        first = self.search(limit=20)
+        self.assertEqual([route["id"] for route in first.json()], self.ids[:20])
+        second = self.search(limit=20, cursor=first["X-Next-Cursor"])
+        self.assertEqual([route["id"] for route in second.json()], self.ids[20:40])
+        rest = self.search(cursor=second["X-Next-Cursor"])
+        self.assertEqual([route["id"] for route in rest.json()], self.ids[40:])
+        self.assertNotIn("X-Next-Cursor", rest)
+
+    def test_stream_returns_every_match_after_the_cursor(self):
+        first = self.search(limit=10)
+        response = self.search(cursor=first["X-Next-Cursor"], stream=True)
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], self.ids[10:])
+
+    def test_bad_limit_or_cursor(self):
+        for body in ({"limit": "many"}, {"cursor": "later"}):
+            with self.subTest(body=body):
+                self.assertEqual(self.search(**body).status_code, 400)
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+        cls.route = make_route(cls.driver)
+
+    def book_seats(self, **body):
+        client = Client()
+        client.force_login(self.passenger)
+        return post_json(client, "/api/book-seats", {
+            "driverId": self.driver.id, "routeId": self.route.id, "dates": [MONDAY.isoformat()],
+            "seatsToBook": 1, **body,
+        })
+
+    def test_book_takes_seats_on_every_date(self):
+        bookings = inventory.book(self.route, self.passenger, [MONDAY, MONDAY + timedelta(days=1)], 3)
+        self.assertEqual(len(bookings), 2)
+        self.assertEqual(seats_left(self.route, MONDAY), 1)
+        self.assertEqual(seats_left(self.route, MONDAY + timedelta(days=1)), 1)
+
+    def test_book_is_all_or_nothing(self):
+        inventory.book(self.route, self.passenger, [MONDAY + timedelta(days=1)], 3)
+        with self.assertRaises(inventory.NotEnoughSeats) as raised:
+            inventory.book(self.route, self.passenger, [MONDAY, MONDAY + timedelta(days=1)], 2)
+        self.assertEqual(raised.exception.date, MONDAY + timedelta(days=1))
+        self.assertFalse(RouteSeatInventory.objects.filter(date=MONDAY).exists())
+        self.assertEqual(PassengerBooking.objects.count(), 1)
+
+    def test_dates_off_the_schedule_cannot_be_booked(self):
+        saturday = MONDAY + timedelta(days=5)
+        with self.assertRaises(inventory.NotEnoughSeats):
+            inventory.book(self.route, self.passenger, [saturday], 1)
+
+    def test_reserve_rejects_fewer_than_one_seat(self):
+        for seats in (0, -2):
+            with self.subTest(seats=seats), self.assertRaises(ValueError):
+                inventory.reserve(self.route, [MONDAY], seats)
+        self.assertFalse(RouteSeatInventory.objects.exists())
+
+    def test_book_seats(self):
+        response = self.book_seats(seatsToBook=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seats_left(self.route, MONDAY), 2)
+        response = self.book_seats(seatsToBook=3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], f"Not enough seats available on {MONDAY}")
+
+    def test_book_seats_rejects_fewer_than_one_seat(self):
+        for seats in (0, -1, "two"):
+            with self.subTest(seats=seats):
+                response = self.book_seats(seatsToBook=seats)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["message"], "'seatsToBook' must be a positive integer")
+        self.assertFalse(PassengerBooking.objects.exists())
+
+    def test_book_seats_rejects_bad_dates(self):
+        for value in ("2030-02-30", "next monday"):
+            with self.subTest(value=value):
+                response = self.book_seats(dates=[MONDAY.isoformat(), value])
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["message"], "Dates must be in YYYY-MM-DD format")
+        self.assertFalse(PassengerBooking.objects.exists())
+
+
+class RecurringBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+        cls.route = make_route(cls.driver)
+
+    def book_recurring(self, **body):
+        client = Client()
+        client.force_login(self.passenger)
+        return post_json(client, "/api/book-recurring", {
+            "driverId": self.driver.id, "routeId": self.route.id, "startDate": MONDAY.isoformat(),
+            "endDate": (MONDAY + timedelta(days=13)).isoformat(), "seatsToBook": 1, **body,
+        })
+
+    def test_books_every_scheduled_date_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.book_recurring(weekdays=["Mon", "Wed", "Sat"])
+        self.assertEqual(response.status_code, 200)
+        inserts = [query for query in queries if query["sql"].startswith(f'INSERT INTO "{PassengerBooking._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+        booked = [MONDAY + timedelta(days=offset) for offset in (0, 2, 7, 9)]
+        self.assertEqual(response.json()["bookedDates"], [day.isoformat() for day in booked])
+        self.assertEqual(sorted(PassengerBooking.objects.values_list("date", flat=True)), booked)
+
+    def test_is_all_or_nothing(self):
+        inventory.book(self.route, self.passenger, [MONDAY + timedelta(days=9)], 4)
+        response = self.book_recurring(weekdays=["Mon", "Wed"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PassengerBooking.objects.count(), 1)
+
+    def test_rejects_bad_dates(self):
+        for body in ({"startDate": "2030-02-30"}, {"endDate": "2030-13-01"}):
+            with self.subTest(body=body):
+                response = self.book_recurring(**body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["message"], "Dates must be in YYYY-MM-DD format")
+        response = self.book_recurring(startDate=(MONDAY + timedelta(days=1)).isoformat(), endDate=MONDAY.isoformat())
+        self.assertEqual(response.status_code, 400)
+
+
+class ApiCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.route = make_route(cls.driver)
+
+    def setUp(self):
+        api_cache.get_cache().clear()
+        self.path = f"/api/get-driver-routes/{self.driver.id}/"
+
+    def test_etag_answers_304(self):
+        client = Client()
+        first = client.get(self.path)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            again = client.get(self.path, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+        self.assertEqual(client.get(self.path, headers={"If-None-Match": '"other"'}).content, first.content)
+
+    def test_writes_invalidate_on_commit(self):
+        client = Client()
+        first = client.get(self.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.put(f"/api/update-driver-route/{self.driver.id}/{self.route.id}/",
+                                  json.dumps({"departure_time": "09:15"}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        fresh = client.get(self.path, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()["routes"][0]["departure_time"], "09:15")
+
+    def test_write_during_a_miss_is_not_cached_over(self):
+        key = api_cache.driver_routes_key(self.driver.id)
+        builds = []
+
+        def build(content):
+            builds.append(content)
+            if len(builds) == 1:
+                # A write commits after this miss read the database, before it stores the entry
+                with self.captureOnCommitCallbacks(execute=True):
+                    api_cache.invalidate_driver(self.driver.id)
+            return HttpResponse(content)
+
+        request = RequestFactory().get(self.path)
+        self.assertEqual(api_cache.cached_response(request, key, lambda: build(b"stale")).content, b"stale")
+        self.assertEqual(api_cache.cached_response(request, key, lambda: build(b"fresh")).content, b"fresh")
+        self.assertEqual(api_cache.cached_response(request, key, lambda: build(b"again")).content, b"fresh")
+
+    def test_entries_are_rebuilt_the_next_day(self):
+        key = api_cache.driver_routes_key(self.driver.id)
+        request = RequestFactory().get(self.path)
+        api_cache.cached_response(request, key, lambda: HttpResponse(b"today"))
+        tomorrow = date.today() + timedelta(days=1)
+        with mock.patch("django.utils.timezone.localdate", return_value=tomorrow):
+            response = api_cache.cached_response(request, key, lambda: HttpResponse(b"tomorrow"))
+        self.assertEqual(response.content, b"tomorrow")
+
+    def test_errors_are_not_cached(self):
+        key = api_cache.driver_routes_key(self.driver.id)
+        request = RequestFactory().get(self.path)
+        api_cache.cached_response(request, key, lambda: HttpResponse(status=404))
+        self.assertEqual(api_cache.cached_response(request, key, lambda: HttpResponse(b"ok")).content, b"ok")
+
+
+class TokenLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+
+    def login(self, **body):
+        return post_json(Client(), "/api/login", {
+            "email": "rider@example.com", "password": "pw", "role": "PASSENGER", **body,
+        })
+
+    def chain(self, view):
+        return SessionTokenMiddleware(SessionMiddleware(AuthenticationMiddleware(view)))
+
+    def authenticated_user(self, headers):
+        """request.user after the token, session and auth middleware."""
+        chain = self.chain(lambda request: HttpResponse(str(request.user.pk)))
+        return chain(RequestFactory().get("/", headers=headers)).content.decode()
+
+    def test_token_authenticates_without_the_cookie(self):
+        token = self.login().json()["token"]
+        self.assertEqual(self.authenticated_user({"Authorization": f"Token {token}"}), str(self.passenger.pk))
+        self.assertEqual(self.authenticated_user({"Authorization": "Token nope"}), "None")
+        self.assertEqual(self.authenticated_user({"Authorization": f"Bearer {token}"}), "None")
+
+    async def test_token_in_async_chains(self):
+        token = (await sync_to_async(self.login)()).json()["token"]
+
+        async def show_user(request):
+            return HttpResponse(str((await request.auser()).pk))
+
+        response = await self.chain(show_user)(RequestFactory().get("/", headers={"Authorization": f"Token {token}"}))
+        self.assertEqual(response.content.decode(), str(self.passenger.pk))
+
+    def test_wrong_role_or_password(self):
+        self.assertEqual(self.login(role="DRIVER").status_code, 404)
+        self.assertEqual(self.login(password="wrong").status_code, 401)
+
+    def test_login_upgrades_older_hashes(self):
+        self.passenger.password = make_password("pw", hasher="pbkdf2_sha1")
+        self.passenger.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.passenger.refresh_from_db()
+        self.assertTrue(self.passenger.password.startswith(get_hasher().algorithm))
+
+
+class ScheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.route = make_route(cls.driver)
+
+    def test_parse_weekdays(self):
+        self.assertEqual(inventory.parse_weekdays(["Mon", "wednesday", "SUN"]), 0b1000101)
+        self.assertEqual(inventory.weekday_names(0b1000101), ["Mon", "Wed", "Sun"])
+        with self.assertRaises(ValueError):
+            inventory.parse_weekdays(["Funday"])
+
+    def test_parse_schedule(self):
+        update = inventory.parse_schedule(
+            ["Mon", "Tue", {"date": "2030-01-12", "availableSeats": 2}],
+            {"startDate": "2030-01-07", "endDate": None, "exceptions": ["2030-01-08"]},
+        )
+        self.assertEqual(update.fields, {"weekday_mask": 0b11, "start_date": MONDAY, "end_date": None})
+        self.assertEqual(update.overrides, {date(2030, 1, 12): 2})
+        self.assertEqual(update.exceptions, {date(2030, 1, 8)})
+        self.assertEqual(inventory.parse_schedule(), inventory.ScheduleUpdate({}, None, None))
+        for recurrence in ({"startDate": "2030-02-30"}, {"exceptions": ["soon"]}):
+            with self.subTest(recurrence=recurrence), self.assertRaises(ValueError):
+                inventory.parse_schedule(recurrence=recurrence)
+
+    def test_runs_by_rule(self):
+        self.assertTrue(inventory.runs_by_rule(self.route, MONDAY))
+        self.assertFalse(inventory.runs_by_rule(self.route, MONDAY + timedelta(days=5)))
+        self.assertFalse(inventory.runs_by_rule(self.route, MONDAY - timedelta(days=7)))
+        self.assertFalse(inventory.runs_by_rule(self.route, MONDAY + timedelta(days=28)))
+
+    def test_overrides_and_exceptions_change_the_listing(self):
+        saturday, tuesday = MONDAY + timedelta(days=5), MONDAY + timedelta(days=1)
+        inventory.sync_inventory(self.route, inventory.parse_schedule(
+            [{"date": saturday.isoformat(), "availableSeats": 2}], {"exceptions": [tuesday.isoformat()]},
+        ))
+        active_days = inventory.active_days_for([self.route], MONDAY, 7)[self.route.id]
+        listed = {day["date"]: day["availableSeats"] for day in active_days}
+        self.assertEqual(listed, {
+            MONDAY.isoformat(): 4, (MONDAY + timedelta(days=2)).isoformat(): 4,
+            (MONDAY + timedelta(days=3)).isoformat(): 4, (MONDAY + timedelta(days=4)).isoformat(): 4,
+            saturday.isoformat(): 2,
+        })
+        self.assertEqual(inventory.scheduled_dates(self.route, MONDAY, MONDAY + timedelta(days=6)),
+                         [MONDAY + timedelta(days=offset) for offset in (0, 2, 3, 4, 5)])
+        self.assertEqual(inventory.scheduled_dates(self.route, MONDAY, MONDAY + timedelta(days=6), weekday_mask=0b100000),
+                         [saturday])
+
+    def test_new_dates_replace_old_extra_dates_but_keep_booked_ones(self):
+        saturday = MONDAY + timedelta(days=5)
+        passenger = budget.make_user("rider@example.com", "PASSENGER")
+        inventory.sync_inventory(self.route, inventory.parse_schedule([{"date": saturday.isoformat(), "availableSeats": 2}]))
+        inventory.book(self.route, passenger, [MONDAY], 1)
+        sunday = saturday + timedelta(days=1)
+        inventory.sync_inventory(self.route, inventory.parse_schedule([{"date": sunday.isoformat()}]))
+        self.assertEqual(sorted(RouteSeatInventory.objects.filter(route=self.route).values_list("date", flat=True)),
+                         [MONDAY, sunday])
+        self.assertEqual(seats_left(self.route, MONDAY), 3)
+
+    def test_add_route_stores_the_rule(self):
+        response = post_json(Client(), "/api/add-driver-route/", {
+            "driverId": self.driver.id, "from": "Indiranagar", "to": "Whitefield", "departureTime": "09:30",
+            "costPerSeat": 60, "totalSeats": 3,
+            "schedule": {"weekdays": ["Sat", "Sun"], "startDate": MONDAY.isoformat(), "endDate": None},
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        route = DriverRoute.objects.get(from_location="Indiranagar")
+        self.assertEqual((route.weekday_mask, route.start_date, route.end_date), (0b1100000, MONDAY, None))
+        self.assertFalse(RouteSeatInventory.objects.filter(route=route).exists())
+        self.assertEqual(response.json()["schedule"],
+                         {"weekdays": ["Sat", "Sun"], "startDate": MONDAY.isoformat(), "endDate": None})
+        response = post_json(Client(), "/api/add-driver-route/", {
+            "driverId": self.driver.id, "from": "A", "to": "B", "departureTime": "09:30",
+            "costPerSeat": 60, "totalSeats": 3, "schedule": {"weekdays": ["Someday"]},
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class DateSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+        cls.late = make_route(cls.driver, departure_time="18:30")
+        cls.early = make_route(cls.driver, departure_time="7am")
+        cls.weekend = make_route(cls.driver, departure_time="09:00", weekday_mask=0b1100000)
+
+    def search(self, **body):
+        response = post_json(Client(), "/api/routes/search", {"from": "kora", "to": "elec", **body})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_sorted_by_departure_time(self):
+        self.assertEqual([route["id"] for route in self.search()], [self.early.id, self.weekend.id, self.late.id])
+
+    def test_date_and_seats_filter_the_routes(self):
+        inventory.book(self.early, self.passenger, [MONDAY], 3)
+        self.assertEqual([route["id"] for route in self.search(date=MONDAY.isoformat())], [self.early.id, self.late.id])
+        self.assertEqual([route["id"] for route in self.search(date=MONDAY.isoformat(), seats=2)], [self.late.id])
+        saturday = MONDAY + timedelta(days=5)
+        self.assertEqual([route["id"] for route in self.search(date=saturday.isoformat())], [self.weekend.id])
+        self.assertEqual(
+            [route["id"] for route in self.search(startDate=MONDAY.isoformat(), endDate=saturday.isoformat(), seats=2)],
+            [self.early.id, self.weekend.id, self.late.id],
+        )
+
+    def test_active_days_cover_the_searched_dates(self):
+        wednesday = MONDAY + timedelta(days=2)
+        results = self.search(startDate=MONDAY.isoformat(), endDate=wednesday.isoformat())
+        self.assertEqual([route["id"] for route in results], [self.early.id, self.late.id])
+        self.assertEqual([day["date"] for day in results[0]["activeDays"]],
+                         [(MONDAY + timedelta(days=offset)).isoformat() for offset in range(3)])
+
+    def test_bad_dates(self):
+        for body in ({"date": "2030-02-30"}, {"startDate": MONDAY.isoformat(), "endDate": "2030-03-01"},
+                     {"startDate": MONDAY.isoformat(), "endDate": (MONDAY - timedelta(days=1)).isoformat()}):
+            with self.subTest(body=body):
+                response = post_json(Client(), "/api/routes/search", {"from": "kora", "to": "elec", **body})
+                self.assertEqual(response.status_code, 400)
+
+    def test_active_days_stay_in_the_window(self):
+        inventory.sync_inventory(self.early, inventory.parse_schedule(
+            [{"date": (MONDAY + timedelta(days=40)).isoformat(), "availableSeats": 2}],
+            {"exceptions": [(MONDAY + timedelta(days=1)).isoformat()]},
+        ))
+        days = inventory.active_days_for([self.early], MONDAY, 7)[self.early.id]
+        self.assertEqual([day["date"] for day in days],
+                         [(MONDAY + timedelta(days=offset)).isoformat() for offset in (0, 2, 3, 4)])
+        days = inventory.active_days_for([self.early], MONDAY)[self.early.id]
+        self.assertEqual(days[-1], {"date": (MONDAY + timedelta(days=40)).isoformat(), "day": "Sat",
+                                    "availableSeats": 2})
+
+
+class NearbySearchTests(TestCase):
+    # Koramangala -> Silk Board -> Electronic City, and a route the other way
+    KORAMANGALA = (12.9352, 77.6245)
+    SILK_BOARD = (12.9177, 77.6233)
+    ELECTRONIC_CITY = (12.8452, 77.6602)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        (from_lat, from_lng), (to_lat, to_lng) = cls.KORAMANGALA, cls.ELECTRONIC_CITY
+        cls.outbound = make_route(cls.driver, from_lat=from_lat, from_lng=from_lng, to_lat=to_lat, to_lng=to_lng)
+        geo.set_waypoints(cls.outbound, [cls.SILK_BOARD])
+        cls.inbound = make_route(cls.driver, from_lat=to_lat, from_lng=to_lng, to_lat=from_lat, to_lng=from_lng)
+
+    def nearby(self, **body):
+        return post_json(Client(), "/api/routes/nearby", body)
+
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertTrue(geo.encode(*self.KORAMANGALA).startswith(geo.encode(*self.KORAMANGALA, 5)))
+
+    def test_haversine(self):
+        self.assertAlmostEqual(geo.haversine_km(0, 0, 1, 0), 111.195, places=2)  # one degree of latitude
+        self.assertAlmostEqual(geo.haversine_km(*self.KORAMANGALA, *self.ELECTRONIC_CITY), 10.73, places=2)
+
+    def test_cells_cover_points_across_a_cell_edge(self):
+        # Two points 100 m apart on either side of a precision-5 boundary
+        height, _ = geo.cell_size(5)
+        edge = 13 * height
+        cells = geo.covering_cells(edge - 0.0005, 77.6, 0.2)
+        point = geo.encode(edge + 0.0004, 77.6)
+        self.assertTrue(any(point.startswith(cell) for cell in cells))
+        self.assertLessEqual(len(cells), geo.MAX_CELLS)
+
+    def test_pickup_matches_origins_and_waypoints(self):
+        found = geo.nearby_routes(self.SILK_BOARD, 0.5)
+        self.assertEqual([route_id for route_id, _, _ in found], [self.outbound.id])
+        self.assertAlmostEqual(found[0][1], 0.0, places=3)
+        self.assertEqual(geo.nearby_routes((13.2, 77.7), 1), [])
+
+    def test_dropoff_must_come_after_pickup(self):
+        response = self.nearby(pickup=dict(zip(("lat", "lng"), self.SILK_BOARD)),
+                               dropoff=dict(zip(("lat", "lng"), self.ELECTRONIC_CITY)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(route["id"], route["pickupKm"], route["dropoffKm"]) for route in response.json()],
+                         [(self.outbound.id, 0.0, 0.0)])
+        response = self.nearby(pickup=dict(zip(("lat", "lng"), self.ELECTRONIC_CITY)),
+                               dropoff=dict(zip(("lat", "lng"), self.SILK_BOARD)), radiusKm=0.5)
+        self.assertEqual([route["id"] for route in response.json()], [])
+
+    def test_moved_routes_are_reindexed(self):
+        self.inbound.from_lat, self.inbound.from_lng = self.SILK_BOARD
+        self.inbound.save()
+        found = geo.nearby_routes(self.SILK_BOARD, 0.5)
+        self.assertEqual({route_id for route_id, _, _ in found}, {self.outbound.id, self.inbound.id})
+
+    def test_bad_requests(self):
+        for body in ({}, {"pickup": {"lat": 95, "lng": 0}}, {"pickup": {"lat": "north"}},
+                     {"pickup": {"lat": 12.9, "lng": 77.6}, "radiusKm": 100}):
+            with self.subTest(body=body):
+                self.assertEqual(self.nearby(**body).status_code, 400)
+
+
+class DemandTests(TransactionTestCase):
+    """The flusher thread writes DemandCounter, so no test transaction may hold the tables."""
+
+    def search(self):
+        return post_json(Client(), "/api/routes/search", {"from": "Jayanagar 4th Block", "to": "MG Road"})
+
+    def test_requests_do_not_write_counters(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search().status_code, 200)
+        self.assertEqual([query["sql"] for query in queries if DemandCounter._meta.db_table in query["sql"]], [])
+
+    def test_counts_reach_the_hotspots(self):
+        flushed = threading.Event()
+        flush = demand.flush
+
+        def flush_and_signal():
+            if flush():
+                flushed.set()
+
+        # Waiting on the flusher rather than polling the table, which its write would lock
+        with mock.patch.object(demand, "flush", flush_and_signal):
+            self.search()
+            self.search()
+            with mock.patch.object(demand, "FLUSH_KEYS", 1):
+                demand.record_booking("jayanagar 4th block", 2)
+            self.assertTrue(flushed.wait(5), "the pending keys did not wake the flusher")
+        counter = DemandCounter.objects.get(location="jayanagar 4th block")
+        self.assertEqual((counter.searches, counter.seats_booked), (2, 2))
+
+        call_command("rollup_demand", stdout=StringIO())
+        hotspots = {hotspot["location"]: hotspot for hotspot in Client().get("/api/demand-hotspots").json()["hotspots"]}
+        self.assertEqual(hotspots["Jayanagar 4th Block"]["summary"],
+                         "2 searches and 2 seats booked from here in the last 24 hours.")
+
+    def test_failed_writes_are_kept_for_the_next_flush(self):
+        demand.flush()
+        demand.record_search("Jayanagar")
+        with mock.patch.object(DemandCounter.objects, "bulk_create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                demand.flush()
+        self.assertEqual(demand.flush(), 1)
+        self.assertEqual(DemandCounter.objects.get().searches, 1)
+
+
+def trip(trip_id, pickup, dropoff, window=(480, 510), seats=1):
+    """A pending trip request row as ``pooling.propose`` takes it."""
+    return {
+        "id": trip_id, "from_location": f"pickup {trip_id}", "to_location": f"dropoff {trip_id}",
+        "from_lat": pickup[0], "from_lng": pickup[1], "to_lat": dropoff[0], "to_lng": dropoff[1],
+        "earliest_minutes": window[0], "latest_minutes": window[1], "seats": seats,
+    }
+
+
+@skipUnless(find_spec("numpy"), "pooling needs NumPy")
+class PoolingTests(TestCase):
+    KORAMANGALA = (12.9352, 77.6245)
+    ELECTRONIC_CITY = (12.8452, 77.6602)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+
+    def near(self, point, north_m=0, east_m=0):
+        return point[0] + north_m / 111_195, point[1] + east_m / 108_400
+
+    def propose(self, trips, capacity=4, **limits):
+        from . import pooling
+        pools, unpooled = pooling.propose(trips, capacity, **limits)
+        return [sorted(pool.request_ids) for pool in pools], sorted(unpooled)
+
+    def test_distance_matrix_is_close_to_haversine(self):
+        from . import pooling
+        lat, lng = zip(self.KORAMANGALA, self.ELECTRONIC_CITY)
+        distances = pooling.distance_matrix(list(lat), list(lng))
+        self.assertAlmostEqual(distances[0, 1], geo.haversine_km(*self.KORAMANGALA, *self.ELECTRONIC_CITY), places=1)
+        self.assertEqual(distances[0, 0], 0)
+
+    def test_pools_nearby_overlapping_requests(self):
+        trips = [
+            trip(1, self.KORAMANGALA, self.ELECTRONIC_CITY),
+            trip(2, self.near(self.KORAMANGALA, 400), self.near(self.ELECTRONIC_CITY, east_m=300), (500, 530)),
+            trip(3, self.near(self.KORAMANGALA, -300), self.ELECTRONIC_CITY, (600, 630)),  # later
+            trip(4, self.near(self.KORAMANGALA, 3000), self.ELECTRONIC_CITY),  # too far to pick up
+            trip(5, self.KORAMANGALA, self.near(self.ELECTRONIC_CITY, 5000)),  # too far to drop off
+        ]
+        self.assertEqual(self.propose(trips), ([[1, 2]], [3, 4, 5]))
+        self.assertEqual(self.propose(trips, max_pickup_km=4.0, max_dropoff_km=6.0), ([[1, 2, 4, 5]], [3]))
+
+    def test_pools_fit_the_car(self):
+        trips = [trip(n, self.near(self.KORAMANGALA, 50 * n), self.ELECTRONIC_CITY, seats=2) for n in range(1, 4)]
+        self.assertEqual(self.propose(trips), ([[1, 2]], [3]))
+        self.assertEqual(self.propose(trips, capacity=1), ([], [1, 2, 3]))
+
+    def test_pickups_in_neighbouring_cells_are_pooled(self):
+        from . import pooling
+        cell_lat = math.degrees(1.5 / geo.EARTH_RADIUS_KM)  # the pickup grid's row height
+        edge = (int(self.KORAMANGALA[0] / cell_lat) + 1) * cell_lat
+        trips = [trip(1, (edge - 0.002, 77.6245), self.ELECTRONIC_CITY),
+                 trip(2, (edge + 0.002, 77.6245), self.ELECTRONIC_CITY)]
+        self.assertEqual(len(pooling._cells(*zip(*[(t["from_lat"], t["from_lng"]) for t in trips]), 1.5)), 2)
+        self.assertEqual(self.propose(trips), ([[1, 2]], []))
+
+    def test_suggestions(self):
+        client = Client()
+        client.force_login(self.passenger)
+        for pickup in (self.KORAMANGALA, self.near(self.KORAMANGALA, 300)):
+            response = post_json(client, "/api/trip-requests", {
+                "from": "Koramangala", "to": "Electronic City", "date": MONDAY.isoformat(), "windowStart": "08:00",
+                "fromCoords": dict(zip(("lat", "lng"), pickup)),
+                "toCoords": dict(zip(("lat", "lng"), self.ELECTRONIC_CITY)),
+            })
+            self.assertEqual(response.status_code, 201, response.content)
+        response = post_json(client, "/api/pooling/suggestions", {"date": MONDAY.isoformat(), "capacity": 4})
+        self.assertEqual(response.status_code, 200)
+        pool, = response.json()["pools"]
+        self.assertEqual(sorted(pool["requestIds"]), sorted(TripRequest.objects.values_list("id", flat=True)))
+        self.assertEqual((pool["stops"], pool["departureTime"], pool["seats"]),
+                         (["Koramangala", "Electronic City"], "08:00", 2))
+        self.assertEqual(response.json()["unpooled"], [])
+
+        for body in ({"date": "soon", "capacity": 4}, {"date": MONDAY.isoformat()},
+                     {"date": MONDAY.isoformat(), "capacity": 4, "maxPickupKm": 50}):
+            with self.subTest(body=body):
+                self.assertEqual(post_json(client, "/api/pooling/suggestions", body).status_code, 400)
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+
+    def route_row(self, **fields):
+        return json.dumps({
+            "driverId": self.driver.id, "from": "Whitefield", "to": "Indiranagar", "departureTime": "09:00",
+            "costPerSeat": 30, "totalSeats": 3, "weekdays": "Mon Tue Wed Thu Fri",
+            "startDate": MONDAY.isoformat(), "endDate": (MONDAY + timedelta(days=27)).isoformat(), **fields,
+        })
+
+    def test_import_routes_reports_bad_rows(self):
+        errors = []
+        rows = [
+            (1, self.route_row()),
+            (2, self.route_row(totalSeats=0)),
+            (3, self.route_row(driverId=9999)),
+            (4, "{not json"),
+            (5, self.route_row(activeDays=["2030-01-08:2"], exceptions=["2030-01-08"])),
+        ]
+        self.assertEqual(bulk_io.import_routes(rows, on_error=errors.append), 1)
+        self.assertEqual([error.line for error in errors], [2, 3, 4, 5])
+        self.assertEqual(errors[1].message, "Driver 9999 not found")
+        self.assertEqual(DriverRoute.objects.count(), 1)
+
+    def test_routes_round_trip_with_their_dates(self):
+        for fmt in bulk_io.FORMATS:
+            with self.subTest(fmt=fmt):
+                DriverRoute.objects.all().delete()
+                row = self.route_row(activeDays=["2030-01-12:2", "2030-01-09:1"], exceptions=["2030-01-08"])
+                bulk_io.import_routes([(1, row)])
+                route = DriverRoute.objects.get()
+                inventory.book(route, self.passenger, [date(2030, 1, 12)], 1)
+
+                exported = list(bulk_io.export_routes(DriverRoute.objects.all(), fmt))
+                DriverRoute.objects.all().delete()
+                self.assertEqual(bulk_io.import_routes(bulk_io.read_rows(exported, fmt)), 1)
+                days = inventory.active_days_for(DriverRoute.objects.all(), MONDAY, 7)
+                self.assertEqual(
+                    [(day["date"], day["availableSeats"]) for day in next(iter(days.values()))],
+                    [("2030-01-07", 3), ("2030-01-09", 1), ("2030-01-10", 3), ("2030-01-11", 3),
+                     ("2030-01-12", 2)],
+                )
+
+    def test_import_bookings_reports_overbooking(self):
+        route = make_route(self.driver)
+        errors = []
+        rows = [
+            (line, json.dumps({"passengerId": self.passenger.id, "routeId": route.id,
+                               "date": MONDAY.isoformat(), "seatsBooked": seats}))
+            for line, seats in ((1, 2), (2, 3), (3, 2))
+        ]
+        self.assertEqual(bulk_io.import_bookings(rows, on_error=errors.append), 2)
+        self.assertEqual(errors, [bulk_io.RowError(2, f"Not enough seats available on {MONDAY}")])
+        self.assertEqual(seats_left(route, MONDAY), 0)
+
+    def test_import_and_export_endpoints(self):
+        body = (
+            "driverId,from,to,departureTime,costPerSeat,totalSeats,weekdays\n"
+            f"{self.driver.id},Whitefield,Indiranagar,09:00,30,3,Mon Fri\n"
+            f"{self.driver.id},Whitefield,,09:00,30,3,Mon Fri\n"
+        )
+        client = Client()
+        client.force_login(self.driver)
+        self.assertEqual(client.post("/api/routes/import", body, content_type="text/csv").status_code, 403)
+
+        self.driver.is_staff = True
+        self.driver.save()
+        response = client.post("/api/routes/import?dryRun=1", body, content_type="text/csv")
+        self.assertEqual((response.json()["created"], response.json()["errorCount"]), (1, 1))
+        self.assertFalse(DriverRoute.objects.exists())
+        response = client.post("/api/routes/import", body, content_type="text/csv")
+        self.assertEqual(response.json()["errors"][0]["line"], 3)
+        exported = b"".join(client.get("/api/routes/export?format=csv").streaming_content).decode()
+        self.assertEqual(exported.splitlines()[0], ",".join(bulk_io.ROUTE_COLUMNS))
+        self.assertIn("Whitefield,Indiranagar", exported)
+
+
+class RequestMetricsTests(TestCase):
+    @staticmethod
+    def query_counts(record):
+        """Method -> query count of each request ``metrics.record`` saw."""
+        return {call.args[1]: call.args[5] for call in record.call_args_list}
+
+    async def test_overlapping_async_requests_count_their_own_queries(self):
+        get_started, post_done = asyncio.Event(), asyncio.Event()
+
+        async def view(request):
+            # The two requests' queries interleave on the ORM's one thread
+            if request.method == "GET":
+                await User.objects.acount()
+                get_started.set()
+                await post_done.wait()
+                await User.objects.acount()
+            else:
+                await get_started.wait()
+                for _ in range(3):
+                    await User.objects.acount()
+                post_done.set()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        with mock.patch.object(metrics, "record") as record:
+            await asyncio.gather(middleware(RequestFactory().get("/")), middleware(RequestFactory().post("/")))
+        self.assertEqual(self.query_counts(record), {"GET": 2, "POST": 3})
+
+    def test_streamed_queries_are_counted(self):
+        make_route(budget.make_user("driver@example.com", "DRIVER"))
+        with mock.patch.object(metrics, "record") as record:
+            response = post_json(Client(), "/api/routes/search", {"from": "kora", "to": "elec", "stream": True})
+            record.assert_not_called()
+            self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+        self.assertEqual(self.query_counts(record), {"POST": 2})
+        self.assertEqual(record.call_args.args[0], "search_routes")
+
+    def test_queries_outside_requests_are_not_counted(self):
+        with mock.patch.object(metrics, "record") as record:
+            Client().get("/api/demand-hotspots")
+            User.objects.count()
+        self.assertEqual(self.query_counts(record), {"GET": 1})
+
+
+class SeatHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = budget.make_user("driver@example.com", "DRIVER")
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+        cls.other = budget.make_user("other@example.com", "PASSENGER")
+        cls.route = make_route(cls.driver)
+
+    def place(self, seats=2, now=None):
+        return holds.place(self.route, self.passenger, [MONDAY, MONDAY + timedelta(days=1)], seats, now)[0].hold_id
+
+    def test_place_takes_the_seats(self):
+        self.place()
+        self.assertEqual(seats_left(self.route, MONDAY), 2)
+        with self.assertRaises(inventory.NotEnoughSeats):
+            holds.place(self.route, self.other, [MONDAY], 3)
+
+    def test_confirm_books_the_held_seats(self):
+        bookings = holds.confirm(self.place(), self.passenger)
+        self.assertEqual(sorted(booking.date for booking in bookings), [MONDAY, MONDAY + timedelta(days=1)])
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(seats_left(self.route, MONDAY), 2)
+
+    def test_confirm_after_expiry_gives_the_seats_back(self):
+        hold_id = self.place()
+        later = timezone.now() + timedelta(minutes=holds.HOLD_MINUTES + 1)
+        with self.assertRaises(holds.HoldExpired) as raised:
+            holds.confirm(hold_id, self.passenger, now=later)
+        self.assertEqual(raised.exception.route, (self.driver.id, self.route.id))
+        self.assertEqual(seats_left(self.route, MONDAY), 4)
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertFalse(PassengerBooking.objects.exists())
+
+    def test_hold_belongs_to_its_passenger(self):
+        hold_id = self.place()
+        with self.assertRaises(SeatHold.DoesNotExist):
+            holds.confirm(hold_id, self.other)
+        self.assertIsNone(holds.cancel(hold_id, self.other))
+        self.assertEqual(seats_left(self.route, MONDAY), 2)
+
+    def test_cancel_gives_the_seats_back(self):
+        self.assertEqual(holds.cancel(self.place(), self.passenger), (self.driver.id, self.route.id))
+        self.assertEqual(seats_left(self.route, MONDAY), 4)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_release_expired_leaves_live_holds(self):
+        self.place(seats=1, now=timezone.now() - timedelta(minutes=holds.HOLD_MINUTES + 1))
+        holds.place(self.route, self.other, [MONDAY + timedelta(days=2)], 1)
+        self.assertEqual(holds.release_expired(), 2)
+        self.assertEqual(seats_left(self.route, MONDAY), 4)
+        self.assertEqual(seats_left(self.route, MONDAY + timedelta(days=2)), 3)
+        self.assertEqual(list(SeatHold.objects.values_list("passenger", flat=True)), [self.other.id])
+
+    def test_hold_endpoints(self):
+        client = Client()
+        client.force_login(self.passenger)
+        body = {"driverId": self.driver.id, "routeId": self.route.id, "dates": [MONDAY.isoformat()], "seatsToBook": 3}
+        response = post_json(client, "/api/seat-holds", body)
+        self.assertEqual(response.status_code, 201, response.content)
+        hold_id = response.json()["holdId"]
+        self.assertEqual(post_json(client, "/api/seat-holds", {**body, "seatsToBook": 2}).status_code, 400)
+
+        response = client.post(f"/api/seat-holds/{hold_id}/confirm")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["bookedDates"], [MONDAY.isoformat()])
+        self.assertEqual(client.post(f"/api/seat-holds/{hold_id}/confirm").status_code, 404)
+
+        hold_id = post_json(client, "/api/seat-holds", {**body, "seatsToBook": 1}).json()["holdId"]
+        self.assertEqual(client.delete(f"/api/seat-holds/{hold_id}").status_code, 200)
+        self.assertEqual(seats_left(self.route, MONDAY), 1)
+
+    def test_confirming_an_expired_hold_answers_410(self):
+        client = Client()
+        client.force_login(self.passenger)
+        hold_id = self.place()
+        later = timezone.now() + timedelta(minutes=holds.HOLD_MINUTES + 1)
+        with mock.patch.object(timezone, "now", return_value=later):
+            response = client.post(f"/api/seat-holds/{hold_id}/confirm")
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(seats_left(self.route, MONDAY), 4)
+
+
+class LiveEventsTests(TestCase):
+    def setUp(self):
+        # A broker of the test's own, so no subscriptions leak between tests
+        patcher = mock.patch.object(events, "broker", return_value=events.LocalBroker())
+        self.broker = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_encode(self):
+        self.assertEqual(events.encode("seats", {"routeId": 1, "changes": []}),
+                         b'event: seats\ndata: {"routeId":1,"changes":[]}\n\n')
+
+    async def test_publish_reaches_the_route_subscribers(self):
+        one, both = self.broker.subscribe(["route:1"]), self.broker.subscribe(["route:1", "route:2"])
+        # Writes publish from worker threads
+        await asyncio.to_thread(self.broker.publish, "route:2", "route", {"routeId": 2, "deleted": True})
+        self.assertEqual(await both.get(1), events.encode("route", {"routeId": 2, "deleted": True}))
+        self.assertIsNone(await one.get(0.01))
+        self.assertEqual(self.broker.connections(), 2)
+        one.close()
+        both.close()
+        self.assertEqual(self.broker.connections(), 0)
+
+    async def test_slow_readers_are_told_to_resync(self):
+        with mock.patch.object(events, "QUEUE_SIZE", 2):
+            subscription = self.broker.subscribe(["route:1"])
+        for n in range(3):
+            self.broker.publish("route:1", "seats", {"n": n})
+        await asyncio.sleep(0)  # deliveries are scheduled on the loop
+        frames = [await subscription.get(0.01) for _ in range(4)]
+        self.assertEqual(frames, [
+            events.encode("seats", {"n": 0}), events.encode("seats", {"n": 1}), events.RESYNC, None,
+        ])
+
+    async def test_stream_sends_heartbeats_and_unsubscribes(self):
+        stream = events.stream(["route:1"], heartbeat=0.01)
+        self.assertEqual(await anext(stream), f"retry: {events.RETRY_MS}\n\n".encode())
+        self.assertEqual(await anext(stream), b": keep-alive\n\n")
+        self.broker.publish("route:1", "route", {"routeId": 1, "deleted": False})
+        self.assertEqual(await anext(stream), events.encode("route", {"routeId": 1, "deleted": False}))
+        await stream.aclose()
+        self.assertEqual(self.broker.connections(), 0)
+
+    def test_bookings_publish_seat_changes_after_commit(self):
+        route = make_route(budget.make_user("driver@example.com", "DRIVER"))
+        passenger = budget.make_user("rider@example.com", "PASSENGER")
+        with mock.patch.object(self.broker, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                inventory.book(route, passenger, [MONDAY + timedelta(days=1), MONDAY], 2)
+                publish.assert_not_called()
+        publish.assert_called_once_with(events.route_channel(route.id), "seats", {
+            "routeId": route.id,
+            "changes": [{"date": "2030-01-07", "delta": -2}, {"date": "2030-01-08", "delta": -2}],
+        })
+
+    async def test_events_endpoint(self):
+        client = AsyncClient()
+        response = await client.get("/api/events?routes=7,8")
+        self.assertEqual((response.status_code, response["Content-Type"]), (200, "text/event-stream"))
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), f"retry: {events.RETRY_MS}\n\n".encode())
+        events.broker().publish("route:8", "route", {"routeId": 8, "deleted": True})
+        self.assertEqual(await anext(chunks), events.encode("route", {"routeId": 8, "deleted": True}))
+        await chunks.aclose()
+        for query in ("", "?routes=x", "?routes=" + ",".join(map(str, range(views.EVENTS_MAX_ROUTES + 1)))):
+            with self.subTest(query=query):
+                self.assertEqual((await client.get(f"/api/events{query}")).status_code, 400)
+
+    def test_events_need_asgi(self):
+        self.assertEqual(Client().get("/api/events?routes=1").status_code, 501)
+
+
+class AccountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.passenger = budget.make_user("rider@example.com", "PASSENGER")
+
+    def signup(self, **body):
+        return post_json(Client(), "/api/signup", {
+            "name": "Asha", "email": "asha@example.com", "password": "pw", "role": "PASSENGER", **body,
+        })
+
+    def test_one_account_per_email_and_role(self):
+        self.assertEqual(self.signup().status_code, 201)
+        self.assertEqual(self.signup(name="Someone else").status_code, 409)
+        self.assertEqual(self.signup(role="DRIVER").status_code, 201)
+        self.assertEqual(sorted(User.objects.filter(email="asha@example.com").values_list("username", flat=True)),
+                         ["asha@example.com_DRIVER", "asha@example.com_PASSENGER"])
+        self.assertEqual(self.signup(role="ADMIN").status_code, 400)
+
+    def test_create_is_one_transaction(self):
+        with mock.patch("galli_connect_app.accounts.UserProfile.objects.create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                accounts.create("Asha", "asha@example.com", "pw", "PASSENGER")
+        self.assertFalse(User.objects.filter(email="asha@example.com").exists())
+
+    def test_import_users_skips_duplicates(self):
+        errors = []
+        rows = [
+            (1, json.dumps({"name": "Asha", "email": "asha@example.com", "role": "passenger", "password": "pw"})),
+            (2, json.dumps({"name": "Asha", "email": "asha@example.com", "role": "PASSENGER"})),
+            (3, json.dumps({"name": "Asha", "email": "asha@example.com", "role": "DRIVER"})),
+            (4, json.dumps({"name": "Rider", "email": "rider@example.com", "role": "PASSENGER"})),
+        ]
+        self.assertEqual(bulk_io.import_users(rows, on_error=errors.append), 2)
+        self.assertEqual([error.line for error in errors], [2, 4])
+        self.assertTrue(User.objects.get(email="asha@example.com", userprofile__role="PASSENGER").check_password("pw"))
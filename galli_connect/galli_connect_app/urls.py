@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Read-heavy polling endpoints have async twins for ASGI deployments
+polling_views = async_views if settings.ASYNC_API_VIEWS else views
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('', views.homepage, name='homepage'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
     path('api/signup', views.signup, name='signup'),
     path('api/login', views.login, name='login'),
     path('api/add-driver-route/', views.add_driver_route, name='add_driver_route'),
-    path('api/get-driver-routes/<int:driver_id>/', views.get_driver_routes, name='get_driver_routes'),
+    path('api/get-driver-routes/<int:driver_id>/', polling_views.get_driver_routes, name='get_driver_routes'),
     path('api/update-driver-route/<int:driver_id>/<int:route_id>/', views.update_driver_route, name='update_driver_route'),
     path('api/delete-driver-route/<int:driver_id>/<int:route_id>/', views.delete_driver_route, name='delete_driver_route'),
-    path('api/routes/search', views.search_routes, name='search_routes'),
+    path('api/routes/search', polling_views.search_routes, name='search_routes'),
+    path('api/routes/nearby', views.nearby_routes, name='nearby_routes'),
+    path('api/events', views.route_events, name='route_events'),
+    path('api/trip-requests', views.create_trip_request, name='create_trip_request'),
+    path('api/pooling/suggestions', views.pooling_suggestions, name='pooling_suggestions'),
+    path('api/demand-hotspots', views.demand_hotspots, name='demand_hotspots'),
+    path('api/routes/import', views.import_routes, name='import_routes'),
+    path('api/routes/export', views.export_routes, name='export_routes'),
+    path('api/bookings/import', views.import_bookings, name='import_bookings'),
+    path('api/bookings/export', views.export_bookings, name='export_bookings'),
     path('api/book-seats', views.book_seats, name='book_seats'),
-    path('api/driver/<int:driver_id>/routes/<int:route_id>/bookings',views.get_route_bookings,name='get_route_bookings')
+    path('api/book-recurring', views.book_recurring, name='book_recurring'),
+    path('api/seat-holds', views.place_seat_hold, name='place_seat_hold'),
+    path('api/seat-holds/<uuid:hold_id>', views.release_seat_hold, name='release_seat_hold'),
+    path('api/seat-holds/<uuid:hold_id>/confirm', views.confirm_seat_hold, name='confirm_seat_hold'),
+    path('api/driver/<int:driver_id>/routes/<int:route_id>/bookings',polling_views.get_route_bookings,name='get_route_bookings')
 ]
 
 
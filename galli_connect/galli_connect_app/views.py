@@ -5,22 +5,41 @@ import json
 from django.http import HttpResponse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
+from django.contrib.auth.signals import user_login_failed
 from django.contrib import messages
 from django.utils.dateparse import parse_date
-from datetime import datetime
-from .models import UserProfile  # import the profile model
+from datetime import datetime, timedelta
+from itertools import islice
 from .models import DriverRoute
 from .models import PassengerBooking
+from .models import DemandHotspot
+from .models import TripRequest
+from .models import SeatHold
+from .search import departure_minutes, matching_routes
+from . import (
+    accounts, api_cache, bulk_io, demand, events, geo, holds, inventory, metrics, routers, serializers, static_assets,
+)
 
+import codecs
 import json
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 
 # Create your views here.
 def home(request):
-    return render(request, 'index.html') 
+    shell = static_assets.index_shell()
+    if shell is None:
+        return render(request, 'index.html')
+    # The shell names this build's bundles; revalidate it on every load
+    return static_assets.serve(request, shell, cache_control="no-cache")
 
 def homepage(request):
-    return render(request, 'index.html') 
+    return home(request)
+
 
 @csrf_exempt
 def signup(request):
@@ -36,19 +55,14 @@ def signup(request):
 
         if not name or not email or not password or not role:
             return JsonResponse({"message": "All fields are required."}, status=400)
+        if role not in accounts.ROLES:
+            return JsonResponse({"message": "Role must be PASSENGER or DRIVER."}, status=400)
 
-        # Check if same email already exists for this role
-        existing_user = User.objects.filter(email=email, userprofile__role=role).first()
-        if existing_user:
-            return JsonResponse({"message": f"User with email {email} and role {role} already exists."}, status=409)
-
-        # Create the Django User
-        user = User.objects.create_user(username=f"{email}_{role}", email=email, password=password)
-        user.first_name = name
-        user.save()
-
-        # Create linked profile with role
-        UserProfile.objects.create(user=user, role=role)
+        # User and profile in one transaction; a duplicate (email, role) fails on the unique username
+        try:
+            user = accounts.create(name, email, password, role)
+        except accounts.AccountExists as e:
+            return JsonResponse({"message": str(e)}, status=409)
 
         return JsonResponse({
             "id": user.id,
@@ -74,22 +88,25 @@ def login(request):
         if not email or not password or not role:
             return JsonResponse({"error": "Email, password, and role are required"}, status=400)
 
-        # Find user with matching email AND role
-        user_obj = User.objects.filter(email=email, userprofile__role=role).first()
-        if not user_obj:
+        # Find user with matching email AND role (one indexed query, no re-fetch by authenticate)
+        user = User.objects.filter(username=accounts.username(email, role), userprofile__role=role).first()
+        if not user:
             return JsonResponse({"error": "No user found with given email and role"}, status=404)
 
-        # Authenticate
-        user = authenticate(username=user_obj.username, password=password)
-        if user:
-            auth_login(request, user)
+        # Authenticate against the fetched row; check_password also upgrades
+        # hashes made with an older PASSWORD_HASHERS entry
+        if user.is_active and user.check_password(password):
+            auth_login(request, user, backend="django.contrib.auth.backends.ModelBackend")
             return JsonResponse({
                 "message": "Login successful",
                 "id": user.id,  # unique internal id
                 "role": role,
                 "name": user.first_name,
+                # Send back as "Authorization: Token <token>" instead of the session cookie
+                "token": request.session.session_key,
             }, status=200)
         else:
+            user_login_failed.send(sender=__name__, credentials={"username": user.username}, request=request)
             return JsonResponse({"error": "Invalid credentials"}, status=401)
 
     return JsonResponse({"error": "Invalid request method"}, status=405)
@@ -105,31 +122,34 @@ def add_driver_route(request):
             to_location = data.get("to")
             departure_time = data.get("departureTime")
             cost_per_seat = data.get("costPerSeat")
-            active_days = data.get("activeDays")
             total_seats = data.get("totalSeats")
 
             driver = User.objects.filter(id=driver_id).first()
             if not driver:
                 return JsonResponse({"error": "Driver not found"}, status=404)
 
-            route = DriverRoute.objects.create(
-                driver=driver,
-                from_location=from_location,
-                to_location=to_location,
-                departure_time=departure_time,
-                cost_per_seat=cost_per_seat,
-                active_days=active_days,
-                total_seats = total_seats
-            )
+            # Parse before creating anything so bad dates/weekdays/coordinates are rejected
+            schedule = inventory.parse_schedule(data.get("activeDays"), data.get("schedule"))
+            coordinates = geo.coordinate_fields(data, "fromCoords", "toCoords")
+            waypoints = geo.parse_waypoints(data.get("waypoints"))
+            # The route, its search index rows and schedule are written together
+            with transaction.atomic():
+                route = DriverRoute.objects.create(
+                    driver=driver,
+                    from_location=from_location,
+                    to_location=to_location,
+                    departure_time=departure_time,
+                    cost_per_seat=cost_per_seat,
+                    total_seats = total_seats,
+                    **schedule.fields,
+                    **coordinates
+                )
+                inventory.sync_inventory(route, schedule)
+                if waypoints:
+                    geo.set_waypoints(route, waypoints)
+            api_cache.invalidate_driver(driver.id)
 
-            return JsonResponse({
-                "id": route.id,
-                "from": route.from_location,
-                "to": route.to_location,
-                "departureTime": route.departure_time,
-                "costPerSeat": str(route.cost_per_seat),
-                "activeDays": route.active_days
-            }, status=201)
+            return serializers.json_response(_route_json(route), status=201)
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
@@ -140,28 +160,31 @@ def add_driver_route(request):
 
 
 
+def _route_json(route):
+    """A route instance in the ``serializers.route`` shape."""
+    return serializers.route(serializers.route_row(route), inventory.active_days_for([route])[route.id])
+
+
+def _driver_routes_response(driver_id):
+    driver = User.objects.filter(id=driver_id).first()
+    if not driver:
+        return JsonResponse({"error": "Driver not found"}, status=404)
+
+    rows = list(DriverRoute.objects.filter(driver=driver).values(*serializers.DRIVER_ROUTE_FIELDS))
+    active_days = inventory.active_days_for(rows)
+    route_list = [serializers.driver_route(row, active_days[row["id"]]) for row in rows]
+
+    return serializers.json_response({"routes": route_list})
+
+
 @csrf_exempt
 def get_driver_routes(request, driver_id):
     if request.method == "GET":
-        driver = User.objects.filter(id=driver_id).first()
-        if not driver:
-            return JsonResponse({"error": "Driver not found"}, status=404)
-
-        routes = DriverRoute.objects.filter(driver=driver)
-        route_list = [
-            {
-                "id": route.id,
-                "from_location": route.from_location,
-                "to_location": route.to_location,
-                "departure_time": route.departure_time,
-                "cost_per_seat": str(route.cost_per_seat),
-                "active_days": route.active_days,
-                "total_seats": route.total_seats
-            }
-            for route in routes
-        ]
-
-        return JsonResponse({"routes": route_list}, status=200)
+        return api_cache.cached_response(
+            request,
+            api_cache.driver_routes_key(driver_id),
+            lambda: _driver_routes_response(driver_id),
+        )
 
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
@@ -192,17 +215,25 @@ def update_driver_route(request, driver_id, route_id):
         route.to_location = data.get("to_location", route.to_location)
         route.departure_time = data.get("departure_time", route.departure_time)
         route.cost_per_seat = data.get("cost_per_seat", route.cost_per_seat)
-        route.active_days = data.get("active_days", route.active_days)
-        route.save()
+        try:
+            schedule = inventory.parse_schedule(data.get("active_days"), data.get("schedule"))
+            coordinates = geo.coordinate_fields(data, "from_coords", "to_coords")
+            waypoints = geo.parse_waypoints(data.get("waypoints"))
+        except (AttributeError, TypeError, ValueError) as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        for field, value in {**schedule.fields, **coordinates}.items():
+            setattr(route, field, value)
+        with transaction.atomic():
+            route.save()
+            inventory.sync_inventory(route, schedule)
+            if "waypoints" in data:
+                geo.set_waypoints(route, waypoints)
+        api_cache.invalidate_route(driver.id, route.id)
+        events.route_changed(route.id)
 
-        return JsonResponse({
-            "id": route.id,
-            "from_location": route.from_location,
-            "to_location": route.to_location,
-            "departure_time": route.departure_time,
-            "cost_per_seat": str(route.cost_per_seat),
-            "active_days": route.active_days
-        }, status=200)
+        return serializers.json_response(
+            serializers.driver_route(serializers.route_row(route), inventory.active_days_for([route])[route.id])
+        )
 
     return JsonResponse({"error": "Invalid request method"}, status=405)
 from django.views.decorators.csrf import csrf_exempt
@@ -222,138 +253,828 @@ def delete_driver_route(request, driver_id, route_id):
             return JsonResponse({"error": "Route not found for this driver"}, status=404)
 
         route.delete()
+        api_cache.invalidate_route(driver.id, route_id)
+        events.route_changed(route_id, deleted=True)
         return JsonResponse({"message": "Route deleted successfully"}, status=200)
 
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+SEARCH_STREAM_CHUNK = 500
+SEARCH_MAX_DAYS = 14
+
+
+def _with_active_days(rows, chunk_size=SEARCH_STREAM_CHUNK, **window):
+    """Attach inventory-backed active_days to route rows, one query per chunk."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        active_days = inventory.active_days_for(chunk, **window)
+        for row in chunk:
+            row["active_days"] = active_days[row["id"]]
+            yield row
+
+
+def _ndjson_line(row):
+    return serializers.ndjson_line(serializers.route(row, row["active_days"]))
+
+
+def _wants_stream(request, data):
+    return bool(data.get("stream")) or "application/x-ndjson" in request.headers.get("Accept", "")
+
+
+def _search_dates(data):
+    """Travel dates of a search body: ``date``, or ``startDate``..``endDate``."""
+    first = data.get("date") or data.get("startDate")
+    if not first:
+        return []
+    last = first if data.get("date") else data.get("endDate") or first
+    start, end = parse_date(str(first)), parse_date(str(last))
+    if start is None or end is None:
+        raise ValueError("Dates must be in YYYY-MM-DD format")
+    if not 0 <= (end - start).days < SEARCH_MAX_DAYS:
+        raise ValueError(f"'endDate' must be on or after 'startDate' and within {SEARCH_MAX_DAYS} days")
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _parse_cursor(value):
+    """``"<departure minutes>:<id>"`` from a previous page's X-Next-Cursor."""
+    if not value:
+        return None
+    minutes, _, route_id = str(value).partition(":")
+    return int(minutes), int(route_id)
+
+
+def _search_query(data):
+    """Validate a search body.
+
+    Returns (rows queryset, page size, active_days window) or an error response.
+    The page size is None, for every match, unless ``limit`` or ``cursor`` is sent.
+    """
+    from_location = data.get("from")
+    to_location = data.get("to")
+
+    if not from_location or not to_location:
+        return JsonResponse({"message": "Both 'from' and 'to' locations are required"}, status=400)
+
+    try:
+        cursor = _parse_cursor(data.get("cursor"))
+        limit = None
+        if "limit" in data or "cursor" in data:
+            limit = max(1, min(int(data.get("limit") or SEARCH_PAGE_SIZE), SEARCH_MAX_PAGE_SIZE))
+        seats = max(1, int(data.get("seats") or 1))
+    except (TypeError, ValueError):
+        return JsonResponse({"message": "'cursor', 'limit' and 'seats' are invalid"}, status=400)
+    try:
+        dates = _search_dates(data)
+        # Query matching routes through the location search index, ordered by
+        # departure time and keyset-paginated on (departure_minutes, id).
+        # values() pulls the driver in the same query instead of one lookup per row.
+        routes = matching_routes(from_location, to_location)
+    except ValueError as e:
+        return JsonResponse({"message": str(e)}, status=400)
+
+    demand.record_search(from_location)
+
+    window = {}
+    if dates:
+        routes = routes.filter(inventory.available_on(dates, seats))
+        window = {"start": dates[0], "days": len(dates)}
+    elif "seats" in data:
+        routes = routes.filter(total_seats__gte=seats)
+    if cursor:
+        minutes, route_id = cursor
+        routes = routes.filter(
+            Q(departure_minutes__gt=minutes) | Q(departure_minutes=minutes, id__gt=route_id)
+        )
+    rows = routes.order_by("departure_minutes", "id").values(*serializers.ROUTE_FIELDS)
+    return rows, limit, window
+
+
+def _search_page(page, limit, active_days):
+    """Response for a fetched page of ``limit + 1`` rows."""
+    results = [serializers.route(row, active_days[row["id"]]) for row in page[:limit]]
+    response = serializers.json_response(results)
+    if len(page) > limit:
+        last = page[limit - 1]
+        response["X-Next-Cursor"] = f"{last['departure_minutes']}:{last['id']}"
+    return response
+
+
 @csrf_exempt
+@routers.replica_reads
 def search_routes(request):
+    """Search routes by from/to location.
+
+    With ``date`` (or ``startDate``/``endDate``) only routes with ``seats``
+    (default 1) free on one of those dates are returned, and their
+    ``activeDays`` cover just those dates.
+
+    Returns every match ordered by departure time. With ``limit`` or
+    ``cursor`` (default page size 50) it returns one page; when more exist
+    the ``X-Next-Cursor`` header carries the value to send back as
+    ``cursor``. With ``"stream": true`` (or ``Accept: application/x-ndjson``)
+    every match after ``cursor`` is streamed as one JSON object per line instead.
+    """
     if request.method != "POST":
         return JsonResponse({"message": "Method not allowed"}, status=405)
 
     try:
         data = json.loads(request.body)
-        from_location = data.get("from")
-        to_location = data.get("to")
+        parsed = _search_query(data)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        rows, limit, window = parsed
 
-        if not from_location or not to_location:
-            return JsonResponse({"message": "Both 'from' and 'to' locations are required"}, status=400)
+        if _wants_stream(request, data):
+            lines = (
+                _ndjson_line(row)
+                for row in _with_active_days(rows.iterator(chunk_size=SEARCH_STREAM_CHUNK), **window)
+            )
+            return StreamingHttpResponse(lines, content_type="application/x-ndjson")
 
-        # Query matching routes (case-insensitive match)
-        routes = DriverRoute.objects.filter(
-            from_location__icontains=from_location,
-            to_location__icontains=to_location
-        )
+        if limit is None:
+            matches = _with_active_days(rows.iterator(chunk_size=SEARCH_STREAM_CHUNK), **window)
+            return serializers.json_response([serializers.route(row, row["active_days"]) for row in matches])
 
-        # Format response
+        page = list(rows[:limit + 1])
+        return _search_page(page, limit, inventory.active_days_for(page[:limit], **window))
+
+    except json.JSONDecodeError:
+        return JsonResponse({"message": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+NEARBY_RADIUS_KM = 1.0
+NEARBY_MAX_RADIUS_KM = 25.0
+
+
+@csrf_exempt
+@routers.replica_reads
+def nearby_routes(request):
+    """Routes passing near a pickup point (and optionally a dropoff point).
+
+    Body: ``pickup`` (``{"lat": ..., "lng": ...}``), optional ``dropoff``,
+    ``radiusKm`` (default 1) and ``limit``. Results are the search results
+    with ``pickupKm``/``dropoffKm`` added, nearest first.
+    """
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        try:
+            pickup = geo.parse_point(data.get("pickup"), "pickup")
+            dropoff = geo.parse_point(data.get("dropoff"), "dropoff")
+            radius_km = float(data.get("radiusKm") or NEARBY_RADIUS_KM)
+            limit = max(1, min(int(data.get("limit") or SEARCH_PAGE_SIZE), SEARCH_MAX_PAGE_SIZE))
+        except (TypeError, ValueError) as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        if pickup is None:
+            return JsonResponse({"message": "'pickup' is required"}, status=400)
+        if not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+            return JsonResponse({"message": f"'radiusKm' must be between 0 and {NEARBY_MAX_RADIUS_KM}"}, status=400)
+
+        matches = geo.nearby_routes(pickup, radius_km, dropoff, limit)
+        rows = {row["id"]: row for row in DriverRoute.objects.filter(
+            id__in=[route_id for route_id, _, _ in matches]).values(*serializers.ROUTE_FIELDS)}
+        active_days = inventory.active_days_for(rows.values())
         results = []
-        for route in routes:
-            results.append({
-                "id": route.id,
-                "from": route.from_location,
-                "to": route.to_location,
-                "departureTime": route.departure_time,
-                "costPerSeat": float(route.cost_per_seat),
-                "activeDays": route.active_days,
-                "totalSeats": route.total_seats,
-                "driverId": route.driver.id,
-                "driverName": route.driver.username  # You can change this to full_name if stored
-            })
-
-        return JsonResponse(results, safe=False)
+        for route_id, pickup_km, dropoff_km in matches:
+            result = serializers.route(rows[route_id], active_days[route_id])
+            result["pickupKm"] = round(pickup_km, 3)
+            result["dropoffKm"] = None if dropoff_km is None else round(dropoff_km, 3)
+            results.append(result)
+        return serializers.json_response(results)
+
+    except json.JSONDecodeError:
+        return JsonResponse({"message": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+EVENTS_MAX_ROUTES = 200
+
+
+async def route_events(request):
+    """Seat changes of ``routes`` (comma-separated ids) as Server-Sent Events; see events.py.
+
+    Lets search results and the driver dashboard update live instead of
+    polling. Only served under ASGI, where an open stream costs a
+    coroutine rather than a worker thread.
+    """
+    if request.method != "GET":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"message": "Live updates need the ASGI server (galli_connect.asgi)"}, status=501)
+    try:
+        route_ids = {int(value) for value in request.GET.get("routes", "").split(",") if value.strip()}
+    except ValueError:
+        return JsonResponse({"message": "'routes' must be comma-separated route ids"}, status=400)
+    if not 0 < len(route_ids) <= EVENTS_MAX_ROUTES:
+        return JsonResponse({"message": f"Send 1 to {EVENTS_MAX_ROUTES} route ids in 'routes'"}, status=400)
+
+    response = StreamingHttpResponse(
+        events.stream([events.route_channel(route_id) for route_id in sorted(route_ids)]),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: pass events through unbuffered
+    return response
+
+
+TRIP_REQUEST_WINDOW_MINUTES = 30
+POOLING_PICKUP_KM = 1.5
+POOLING_DROPOFF_KM = 2.0
+POOLING_MAX_KM = 10.0
+
+
+def _trip_window(data):
+    """(earliest, latest) departure minutes from ``windowStart``/``windowEnd``."""
+    earliest = departure_minutes(data.get("windowStart"))
+    if earliest == DriverRoute.UNKNOWN_DEPARTURE:
+        raise ValueError("'windowStart' must be a time such as 08:00")
+    if data.get("windowEnd") is None:
+        return earliest, min(earliest + TRIP_REQUEST_WINDOW_MINUTES, DriverRoute.UNKNOWN_DEPARTURE - 1)
+    latest = departure_minutes(data.get("windowEnd"))
+    if latest == DriverRoute.UNKNOWN_DEPARTURE or latest < earliest:
+        raise ValueError("'windowEnd' must be a time no earlier than 'windowStart'")
+    return earliest, latest
+
+
+@csrf_exempt
+def create_trip_request(request):
+    """Ask for a ride on ``date`` leaving between ``windowStart`` and ``windowEnd``.
+
+    Body: ``from``, ``to``, ``fromCoords``, ``toCoords`` (``{"lat", "lng"}``),
+    ``date``, ``windowStart``, optional ``windowEnd`` (default 30 minutes
+    later) and ``seats`` (default 1). Pending requests feed
+    ``/api/pooling/suggestions``.
+    """
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        try:
+            from_coords = geo.parse_point(data.get("fromCoords"), "fromCoords")
+            to_coords = geo.parse_point(data.get("toCoords"), "toCoords")
+            trip_date = parse_date(str(data.get("date") or ""))
+            earliest, latest = _trip_window(data)
+            seats = int(data.get("seats") or 1)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        if not (data.get("from") and data.get("to") and from_coords and to_coords):
+            return JsonResponse({"message": "Missing trip details"}, status=400)
+        if trip_date is None:
+            return JsonResponse({"message": "'date' must be in YYYY-MM-DD format"}, status=400)
+        if seats < 1:
+            return JsonResponse({"message": "'seats' must be at least 1"}, status=400)
+
+        trip = TripRequest.objects.create(
+            passenger=request.user,  # This assumes user is logged in
+            from_location=data["from"],
+            to_location=data["to"],
+            from_lat=from_coords[0], from_lng=from_coords[1],
+            to_lat=to_coords[0], to_lng=to_coords[1],
+            date=trip_date,
+            earliest_minutes=earliest,
+            latest_minutes=latest,
+            seats=seats,
+        )
+        return JsonResponse({"id": trip.id, "status": trip.status}, status=201)
 
     except json.JSONDecodeError:
         return JsonResponse({"message": "Invalid JSON"}, status=400)
     except Exception as e:
         return JsonResponse({"message": str(e)}, status=500)
-    
+
+
+@csrf_exempt
+def pooling_suggestions(request):
+    """Pooled rides proposed from the pending trip requests of a date.
+
+    Body: ``date`` and either ``routeId`` (pools sized to that route's
+    ``totalSeats``) or ``capacity``; optional ``maxPickupKm`` and
+    ``maxDropoffKm`` bound how far apart pooled pickups and dropoffs may be.
+    Returns the pools, each shaped like the client's ``OptimizedRouteData``,
+    and the ids of requests left unpooled.
+    """
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        from . import pooling
+    except ImportError:
+        return JsonResponse({"message": "Pooling needs NumPy installed"}, status=501)
+
+    try:
+        data = json.loads(request.body)
+        try:
+            trip_date = parse_date(str(data.get("date") or ""))
+            max_pickup_km = float(data.get("maxPickupKm") or POOLING_PICKUP_KM)
+            max_dropoff_km = float(data.get("maxDropoffKm") or POOLING_DROPOFF_KM)
+            capacity = int(data.get("capacity") or 0)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        if trip_date is None:
+            return JsonResponse({"message": "'date' must be in YYYY-MM-DD format"}, status=400)
+        if not (0 < max_pickup_km <= POOLING_MAX_KM and 0 < max_dropoff_km <= POOLING_MAX_KM):
+            return JsonResponse({"message": f"Distances must be between 0 and {POOLING_MAX_KM} km"}, status=400)
+        if data.get("routeId"):
+            capacity = (
+                DriverRoute.objects.filter(id=data["routeId"]).values_list("total_seats", flat=True).first()
+            )
+            if capacity is None:
+                return JsonResponse({"message": "Route not found"}, status=404)
+        if capacity < 1:
+            return JsonResponse({"message": "Send 'routeId' or a positive 'capacity'"}, status=400)
+
+        trips = TripRequest.objects.filter(date=trip_date, status=TripRequest.PENDING).values(
+            "id", "from_location", "to_location", "from_lat", "from_lng", "to_lat", "to_lng",
+            "earliest_minutes", "latest_minutes", "seats",
+        )
+        pools, unpooled = pooling.propose(trips, capacity, max_pickup_km, max_dropoff_km)
+        return JsonResponse({
+            "pools": [pooling.as_json(pool) for pool in pools],
+            "unpooled": unpooled,
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({"message": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+def _seat_count(data):
+    """``seatsToBook`` as a positive int, or None."""
+    try:
+        seats = int(data.get("seatsToBook", 0))
+    except (TypeError, ValueError):
+        return None
+    return seats if seats >= 1 else None
+
+
+def _seats_request(data, check_availability=True):
+    """Route, dates and seats of a ``book-seats`` style body, or an error response."""
+    driver_id = data.get("driverId")
+    route_id = data.get("routeId")
+    dates = data.get("dates", [])
+    seats_to_book = _seat_count(data)
+
+    if not (driver_id and route_id and dates):
+        return JsonResponse({"message": "Missing booking details"}, status=400)
+    if seats_to_book is None:
+        return JsonResponse({"message": "'seatsToBook' must be a positive integer"}, status=400)
+
+    # Find the route (and its driver, named in the response)
+    try:
+        route = DriverRoute.objects.select_related("driver").get(id=route_id, driver_id=driver_id)
+    except DriverRoute.DoesNotExist:
+        return JsonResponse({"message": "Route not found"}, status=404)
+
+    try:
+        booking_dates = [parse_date(str(date_str)) for date_str in dates]
+    except ValueError:
+        # Well-formed but impossible, e.g. 2025-02-30
+        booking_dates = [None]
+    if None in booking_dates:
+        return JsonResponse({"message": "Dates must be in YYYY-MM-DD format"}, status=400)
+
+    # First check seat availability against the per-date inventory
+    unavailable = check_availability and inventory.first_unavailable(route, booking_dates, seats_to_book)
+    if unavailable:
+        return JsonResponse({"message": f"Not enough seats available on {unavailable}"}, status=400)
+    return route, booking_dates, seats_to_book
+
+
 @csrf_exempt
 def book_seats(request):
     if request.method != "POST":
         return JsonResponse({"message": "Method not allowed"}, status=405)
 
+    try:
+        data = json.loads(request.body)
+        parsed = _seats_request(data)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        route, booking_dates, seats_to_book = parsed
+
+        # Reduce seats & save bookings in one transaction (all dates or none)
+        passenger = request.user  # This assumes user is logged in
+        try:
+            inventory.book(route, passenger, booking_dates, seats_to_book)
+        except inventory.NotEnoughSeats as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        api_cache.invalidate_route(route.driver_id, route.id)
+        demand.record_booking(route.from_location, seats_to_book * len(set(booking_dates)))
+
+        return serializers.json_response(_route_json(route))
+
+    except json.JSONDecodeError:
+        return JsonResponse({"message": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+@csrf_exempt
+def place_seat_hold(request):
+    """Hold seats for ``holds.HOLD_MINUTES`` minutes while the passenger checks out.
+
+    Body as for ``/api/book-seats``. The seats are taken off sale at once;
+    the 201 response carries ``holdId`` and ``expiresAt``. Confirm with
+    ``/api/seat-holds/<holdId>/confirm`` before then, or the seats go back.
+    """
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        # Seats of expired holds count as taken until released, which holds.place does first
+        parsed = _seats_request(data, check_availability=False)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        route, hold_dates, seats = parsed
+
+        passenger = request.user  # This assumes user is logged in
+        try:
+            held = holds.place(route, passenger, hold_dates, seats)
+        except inventory.NotEnoughSeats as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        api_cache.invalidate_route(route.driver_id, route.id)
+
+        return serializers.json_response({
+            "holdId": str(held[0].hold_id),
+            "expiresAt": held[0].expires_at.isoformat(),
+            "routeId": route.id,
+            "dates": [hold.date.isoformat() for hold in held],
+            "seatsHeld": seats,
+        }, status=201)
+
+    except json.JSONDecodeError:
+        return JsonResponse({"message": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+@csrf_exempt
+def confirm_seat_hold(request, hold_id):
+    """Book the held seats; responds like ``/api/book-seats`` plus ``bookedDates``."""
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        passenger = request.user  # This assumes user is logged in
+        try:
+            bookings = holds.confirm(hold_id, passenger)
+        except SeatHold.DoesNotExist:
+            return JsonResponse({"message": "Seat hold not found"}, status=404)
+        except holds.HoldExpired as e:
+            api_cache.invalidate_route(*e.route)
+            return JsonResponse({"message": "Seat hold expired; the seats have been released"}, status=410)
+
+        route = DriverRoute.objects.select_related("driver").get(id=bookings[0].route_id)
+        api_cache.invalidate_route(route.driver_id, route.id)
+        demand.record_booking(route.from_location, sum(booking.seats_booked for booking in bookings))
+
+        response = _route_json(route)
+        response["bookedDates"] = [booking.date.isoformat() for booking in bookings]
+        return serializers.json_response(response)
+
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+@csrf_exempt
+def release_seat_hold(request, hold_id):
+    """Give held seats back before the hold expires."""
+    if request.method != "DELETE":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
+    try:
+        released = holds.cancel(hold_id, request.user)  # This assumes user is logged in
+        if released is None:
+            return JsonResponse({"message": "Seat hold not found"}, status=404)
+        api_cache.invalidate_route(*released)
+        return JsonResponse({"message": "Seat hold released"})
+
+    except Exception as e:
+        return JsonResponse({"message": str(e)}, status=500)
+
+
+@csrf_exempt
+def book_recurring(request):
+    """Book the same seats on every date a route runs between two dates.
+
+    Body: ``driverId``, ``routeId``, ``startDate``, ``endDate``,
+    ``seatsToBook`` and optionally ``weekdays`` (e.g. ``["Mon", "Wed"]``).
+    The dates are expanded server-side and booked in one transaction.
+    """
+    if request.method != "POST":
+        return JsonResponse({"message": "Method not allowed"}, status=405)
+
     try:
         data = json.loads(request.body)
         driver_id = data.get("driverId")
         route_id = data.get("routeId")
-        dates = data.get("dates", [])
-        seats_to_book = int(data.get("seatsToBook", 0))
+        try:
+            start = parse_date(str(data.get("startDate", "")))
+            end = parse_date(str(data.get("endDate", "")))
+        except ValueError:
+            # Well-formed but impossible, e.g. 2025-02-30
+            return JsonResponse({"message": "Dates must be in YYYY-MM-DD format"}, status=400)
+        seats_to_book = _seat_count(data)
 
-        if not (driver_id and route_id and dates and seats_to_book):
+        if not (driver_id and route_id and start and end):
             return JsonResponse({"message": "Missing booking details"}, status=400)
+        if seats_to_book is None:
+            return JsonResponse({"message": "'seatsToBook' must be a positive integer"}, status=400)
+        try:
+            weekday_mask = inventory.parse_weekdays(data.get("weekdays"))
+        except ValueError as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        if end < start:
+            return JsonResponse({"message": "'endDate' must not be before 'startDate'"}, status=400)
 
-        # Find the route
         try:
-            route = DriverRoute.objects.get(id=route_id, driver_id=driver_id)
+            route = DriverRoute.objects.select_related("driver").get(id=route_id, driver_id=driver_id)
         except DriverRoute.DoesNotExist:
             return JsonResponse({"message": "Route not found"}, status=404)
 
-        # Ensure active_days structure is correct
-        active_days = route.active_days  # Example: [{"date": "2025-08-15", "availableSeats": 3}, ...]
+        booking_dates = inventory.scheduled_dates(route, start, end, weekday_mask)
+        if not booking_dates:
+            return JsonResponse({"message": "Route does not run on any of the requested dates"}, status=400)
 
-        # First check seat availability
-        for date_str in dates:
-            day_schedule = next((d for d in active_days if d["date"] == date_str), None)
-            if not day_schedule or day_schedule["availableSeats"] < seats_to_book:
-                return JsonResponse({"message": f"Not enough seats available on {date_str}"}, status=400)
-
-        # Reduce seats & save booking
         passenger = request.user  # This assumes user is logged in
-        for date_str in dates:
-            day_schedule = next((d for d in active_days if d["date"] == date_str), None)
-            if day_schedule:
-                day_schedule["availableSeats"] -= seats_to_book
-                PassengerBooking.objects.create(
-                    passenger=passenger,
-                    route=route,
-                    date=parse_date(date_str),
-                    seats_booked=seats_to_book
-                )
-
-        # Save updated active_days
-        route.active_days = active_days
-        route.save()
+        try:
+            inventory.book(route, passenger, booking_dates, seats_to_book)
+        except inventory.NotEnoughSeats as e:
+            return JsonResponse({"message": str(e)}, status=400)
+        api_cache.invalidate_route(route.driver_id, route.id)
+        demand.record_booking(route.from_location, seats_to_book * len(set(booking_dates)))
 
-        return JsonResponse({
-            "id": route.id,
-            "from": route.from_location,
-            "to": route.to_location,
-            "departureTime": route.departure_time,
-            "costPerSeat": float(route.cost_per_seat),
-            "totalSeats": route.total_seats,
-            "activeDays": route.active_days
-        })
+        response = _route_json(route)
+        response["bookedDates"] = [date.isoformat() for date in booking_dates]
+        return serializers.json_response(response)
 
     except json.JSONDecodeError:
         return JsonResponse({"message": "Invalid JSON"}, status=400)
     except Exception as e:
         return JsonResponse({"message": str(e)}, status=500)
-    
-@csrf_exempt
-def get_route_bookings(request, driver_id, route_id):
+
+ROUTE_BOOKINGS_PAGE_DATES = 31
+ROUTE_BOOKINGS_MAX_DATES = 366
+ROUTE_BOOKINGS_QUERY = ("from", "to", "cursor", "limit", "summary")
+
+
+def _route_bookings_query(params):
+    """Range, page and mode of a bookings request; None for the full history.
+
+    Raises ValueError on bad parameters.
+    """
+    if not any(key in params for key in ROUTE_BOOKINGS_QUERY):
+        return None
+    dates = {}
+    for key in ("from", "to", "cursor"):
+        if params.get(key):
+            try:
+                dates[key] = parse_date(params[key])
+            except ValueError:
+                dates[key] = None
+            if dates[key] is None:
+                raise ValueError(f"'{key}' must be in YYYY-MM-DD format")
+    try:
+        limit = max(1, min(int(params.get("limit") or ROUTE_BOOKINGS_PAGE_DATES), ROUTE_BOOKINGS_MAX_DATES))
+    except ValueError:
+        raise ValueError("'limit' must be a whole number")
+    start, end = dates.get("from"), dates.get("to")
+    summary = params.get("summary") in ("1", "true")
+    if summary:
+        start = start or timezone.localdate()
+        end = end or start + timedelta(days=inventory.AVAILABILITY_DAYS - 1)
+        if not 0 <= (end - start).days < ROUTE_BOOKINGS_MAX_DATES:
+            raise ValueError(f"'to' must be on or after 'from' and within {ROUTE_BOOKINGS_MAX_DATES} days")
+    elif start and end and end < start:
+        raise ValueError("'to' must be on or after 'from'")
+    return {"start": start, "end": end, "after": dates.get("cursor"), "limit": limit, "summary": summary}
+
+
+def _bookings_in_range(route, query):
+    bookings = PassengerBooking.objects.filter(route=route)
+    if query["start"]:
+        bookings = bookings.filter(date__gte=query["start"])
+    if query["end"]:
+        bookings = bookings.filter(date__lte=query["end"])
+    if query["after"]:
+        bookings = bookings.filter(date__gt=query["after"])
+    return bookings
+
+
+def _booked_seats(bookings):
+    """(date, seats booked) per date, summed in SQL."""
+    return bookings.values_list("date").annotate(seats=Sum("seats_booked")).order_by()
+
+
+def _booked_dates(bookings, limit):
+    """The first ``limit + 1`` dates with bookings (one more tells if a page follows)."""
+    return bookings.values_list("date", flat=True).distinct().order_by("date")[:limit + 1]
+
+
+def _page_rows(bookings, dates, limit):
+    return (
+        bookings.filter(date__range=(dates[0], dates[:limit][-1]))
+        .order_by("date", "id").values(*serializers.ROUTE_BOOKING_FIELDS)
+    )
+
+
+def _bookings_page_response(rows, dates, limit):
+    response = serializers.json_response(serializers.route_bookings(rows))
+    if len(dates) > limit:
+        response["X-Next-Cursor"] = dates[limit - 1].isoformat()
+    return response
+
+
+def _summary_window(query):
+    return {"start": query["start"], "days": (query["end"] - query["start"]).days + 1}
+
+
+def _route_bookings_response(driver_id, route_id, query=None):
     try:
         # Ensure this route belongs to the driver
         route = DriverRoute.objects.get(id=route_id, driver_id=driver_id)
     except DriverRoute.DoesNotExist:
         return JsonResponse({"error": "Route not found or unauthorized"}, status=404)
 
-    # Fetch all passenger bookings for this route
-    bookings = PassengerBooking.objects.filter(route=route).select_related('passenger')
+    if query is None:
+        # Fetch all passenger bookings for this route
+        bookings = PassengerBooking.objects.filter(route=route).values(*serializers.ROUTE_BOOKING_FIELDS)
+        return serializers.json_response(serializers.route_bookings(bookings))
+
+    bookings = _bookings_in_range(route, query)
+    if query["summary"]:
+        active_days = inventory.active_days_for([route], **_summary_window(query))[route.id]
+        return serializers.json_response(
+            serializers.booking_summary(_booked_seats(bookings), active_days, query["end"]))
+    dates = list(_booked_dates(bookings, query["limit"]))
+    rows = _page_rows(bookings, dates, query["limit"]) if dates else []
+    return _bookings_page_response(rows, dates, query["limit"])
 
-    # Group by date { "YYYY-MM-DD": [ {passengerId, passengerName, seatsBooked} ] }
-    grouped_bookings = {}
-    for booking in bookings:
-        date_str = booking.date.strftime("%Y-%m-%d")
-        passenger_info = {
-            "passengerId": booking.passenger.id,
-            "passengerName": booking.passenger.first_name,
-            "seatsBooked": booking.seats_booked
-        }
-        grouped_bookings.setdefault(date_str, []).append(passenger_info)
 
-    return JsonResponse(grouped_bookings)
+@csrf_exempt
+def get_route_bookings(request, driver_id, route_id):
+    """Bookings of a route grouped by date: ``{"YYYY-MM-DD": [booking, ...]}``.
+
+    Without parameters this is the route's whole history, cached. With
+    ``from``/``to`` (YYYY-MM-DD) only those dates are returned, ``limit``
+    dates at a time (default 31); when more follow, ``X-Next-Cursor``
+    carries the value to send back as ``cursor``. With ``summary=1`` the
+    response is ``{"YYYY-MM-DD": {"seatsBooked": n, "seatsRemaining": m}}``
+    for every date the route runs or has bookings between ``from`` (default
+    today) and ``to`` (default four weeks on); ``seatsRemaining`` is null
+    on cancelled dates.
+    """
+    try:
+        query = _route_bookings_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if query is not None:
+        return _route_bookings_response(driver_id, route_id, query)
+    return api_cache.cached_response(
+        request,
+        api_cache.route_bookings_key(driver_id, route_id),
+        lambda: _route_bookings_response(driver_id, route_id),
+    )
 
 
 def logout_view(request):
     auth_logout(request)
     return redirect('login')
+
+
+def _demand_hotspots_response():
+    hotspots = list(DemandHotspot.objects.all())
+    return JsonResponse({
+        "hotspots": [demand.as_json(hotspot) for hotspot in hotspots],
+        "computedAt": hotspots[0].computed_at.isoformat() if hotspots else None,
+    })
+
+
+@csrf_exempt
+def demand_hotspots(request):
+    """Busiest pickup locations from the last ``rollup_demand`` run."""
+    if request.method == "GET":
+        return api_cache.cached_response(
+            request, api_cache.demand_hotspots_key(), _demand_hotspots_response,
+        )
+
+    return JsonResponse({"error": "Invalid request method"}, status=405)
+
+
+# Rejected rows listed in an import response; the rest are only counted
+IMPORT_MAX_ERRORS = 100
+
+
+def _import_response(request, kind):
+    """Stream a CSV (``Content-Type: text/csv``) or NDJSON request body into ``kind``."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+
+    fmt = request.GET.get("format") or bulk_io.format_for(request.content_type)
+    if fmt not in bulk_io.FORMATS:
+        return JsonResponse({"error": f"'format' must be one of {', '.join(bulk_io.FORMATS)}"}, status=400)
+    errors = []
+    error_count = 0
+
+    def on_error(error):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": error.line, "message": error.message})
+
+    importer = bulk_io.import_routes if kind == "routes" else bulk_io.import_bookings
+    # Iterating the request reads the body line by line instead of loading it whole
+    lines = codecs.iterdecode(request, "utf-8-sig")
+    try:
+        created = importer(
+            bulk_io.read_rows(lines, fmt),
+            dry_run=request.GET.get("dryRun") in ("1", "true"),
+            on_error=on_error,
+        )
+    except UnicodeDecodeError:
+        return JsonResponse({"error": "Body must be UTF-8"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"created": created, "errorCount": error_count, "errors": errors})
+
+
+def _export_response(request, kind, queryset):
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in bulk_io.FORMATS:
+        return JsonResponse({"error": f"'format' must be one of {', '.join(bulk_io.FORMATS)}"}, status=400)
+    export = bulk_io.export_routes if kind == "routes" else bulk_io.export_bookings
+    response = StreamingHttpResponse(
+        export(queryset, fmt), content_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+@csrf_exempt
+def import_routes(request):
+    """Create routes from a CSV/NDJSON body in ``bulk_io.ROUTE_COLUMNS``; staff only.
+
+    ``?dryRun=1`` only validates. Returns the number created and the
+    rejected rows by line number.
+    """
+    return _import_response(request, "routes")
+
+
+@csrf_exempt
+def export_routes(request):
+    """Stream routes (``?driverId=`` to narrow) as ``?format=csv`` or NDJSON; staff only."""
+    routes = DriverRoute.objects.all()
+    try:
+        if request.GET.get("driverId"):
+            routes = routes.filter(driver_id=request.GET["driverId"])
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return _export_response(request, "routes", routes)
+
+
+@csrf_exempt
+def import_bookings(request):
+    """Create bookings from a CSV/NDJSON body in ``bulk_io.BOOKING_COLUMNS``; staff only.
+
+    Seats are taken from the route inventory; bookings that do not fit are
+    rejected like invalid rows.
+    """
+    return _import_response(request, "bookings")
+
+
+@csrf_exempt
+def export_bookings(request):
+    """Stream bookings (``?driverId=``/``?routeId=`` to narrow) as CSV or NDJSON; staff only."""
+    bookings = PassengerBooking.objects.all()
+    try:
+        if request.GET.get("driverId"):
+            bookings = bookings.filter(route__driver_id=request.GET["driverId"])
+        if request.GET.get("routeId"):
+            bookings = bookings.filter(route_id=request.GET["routeId"])
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return _export_response(request, "bookings", bookings)
+
+
+def prometheus_metrics(request):
+    """Request metrics of this worker in Prometheus text format."""
+    if not settings.REQUEST_METRICS:
+        raise Http404("Request metrics are disabled")
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -6,49 +6,80 @@ import subprocess
 from pathlib import Path
 import hashlib
 
-def hash_file(file_path):
-    """Return SHA256 hash of a file."""
-    h = hashlib.sha256()
-    with open(file_path, 'rb') as f:
-        while chunk := f.read(8192):
-            h.update(chunk)
+CLIENT_DIR = Path(__file__).resolve().parent / "client"
+BUILD_DIR = Path(__file__).resolve().parent / "templates"
+
+# What npm install depends on
+INSTALL_INPUTS = ["package.json", "package-lock.json"]
+# What the Vite build depends on, besides the installed packages
+BUILD_INPUTS = INSTALL_INPUTS + ["index.html", "vite.config.ts", "tsconfig.json", "metadata.json"]
+SOURCE_SUFFIXES = (".ts", ".tsx", ".css")
+
+
+def client_sources():
+    """Source files under client/, without walking node_modules."""
+    for root, dirs, files in os.walk(CLIENT_DIR):
+        dirs[:] = [d for d in dirs if d != "node_modules" and not d.startswith(".")]
+        for name in files:
+            if name.endswith(SOURCE_SUFFIXES):
+                yield Path(root) / name
+
+
+def hash_files(names, sources=(), extra=""):
+    """Return a SHA256 over the paths and contents of the named client files and sources."""
+    paths = {CLIENT_DIR / name for name in names if (CLIENT_DIR / name).is_file()}
+    paths.update(sources)
+    h = hashlib.sha256(extra.encode())
+    for path in sorted(paths):
+        h.update(path.relative_to(CLIENT_DIR).as_posix().encode() + b"\0")
+        h.update(path.read_bytes())
+        h.update(b"\0")
     return h.hexdigest()
 
-def build_frontend():
-    """Run npm install (if needed) and npm run build inside the client folder."""
-    client_dir = Path(__file__).resolve().parent / "client"
-    lock_file = client_dir / "package-lock.json"
-    hash_file_path = client_dir / ".package-lock.hash"
-
-    # Check if package-lock.json changed
-    need_install = True
-    if lock_file.exists():
-        new_hash = hash_file(lock_file)
-        if hash_file_path.exists():
-            old_hash = hash_file(hash_file_path)
-            if old_hash == new_hash:
-                need_install = False  # No change in lock file
-
-    if need_install:
-        print("📦 Installing npm dependencies...")
-        subprocess.run(["npm", "install"], cwd=client_dir, check=True)
-        # Save new hash
-        with open(hash_file_path, "wb") as f:
-            f.write(lock_file.read_bytes())
+
+def up_to_date(stamp, digest, output):
+    """True if the stamp file records digest and the output it vouches for still exists."""
+    return output.exists() and stamp.exists() and stamp.read_text().strip() == digest
+
+
+def build_frontend(script="build:dev"):
+    """Run npm install and npm run build inside the client folder, each only if its inputs changed."""
+    # Stamps live next to what they vouch for, so deleting node_modules or the build invalidates them
+    install_stamp = CLIENT_DIR / "node_modules" / ".galli-install.hash"
+    build_stamp = CLIENT_DIR / ".build.hash"
+
+    install_hash = hash_files(INSTALL_INPUTS)
+    if up_to_date(install_stamp, install_hash, CLIENT_DIR / "node_modules"):
+        print("✅ package.json and package-lock.json unchanged — skipping npm install.")
     else:
-        print("✅ package-lock.json unchanged — skipping npm install.")
+        print("📦 Installing npm dependencies...")
+        subprocess.run(["npm", "install"], cwd=CLIENT_DIR, check=True)
+        install_stamp.write_text(install_hash)
+
+    build_hash = hash_files(BUILD_INPUTS, client_sources(), extra=script)
+    if up_to_date(build_stamp, build_hash, BUILD_DIR / "index.html"):
+        print("✅ Client sources unchanged — skipping frontend build.")
+        return
 
-    # Always build
     print("⚡ Building frontend with Vite...")
-    subprocess.run(["npm", "run", "build:dev"], cwd=client_dir, check=True)
+    subprocess.run(["npm", "run", script], cwd=CLIENT_DIR, check=True)
+    build_stamp.write_text(build_hash)
     print("✅ Frontend build complete!")
 
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'galli_connect.settings')
 
+    # --no-frontend is ours, not Django's: serve or collect the existing build as is.
+    # The environment carries it to runserver's autoreloaded child.
+    if "--no-frontend" in sys.argv:
+        sys.argv.remove("--no-frontend")
+        os.environ["GALLI_NO_FRONTEND"] = "1"
+    # The autoreloader's child (RUN_MAIN) runs after its parent has built
+    skip_frontend = os.environ.get("GALLI_NO_FRONTEND") == "1" or os.environ.get("RUN_MAIN") == "true"
+
     # Only build when running server (you can add other commands here)
-    if len(sys.argv) > 1 and sys.argv[1] in ("runserver", "collectstatic"):
+    if not skip_frontend and len(sys.argv) > 1 and sys.argv[1] in ("runserver", "collectstatic"):
         try:
             build_frontend()
         except subprocess.CalledProcessError as e: